@@ -7,29 +7,79 @@ Replaces mock/localStorage with persistent SQLite database.
 Port: 5003
 Endpoints:
   - GET  /health
-  - GET  /api/patients
+  - GET  /api/patients          (?limit=&cursor=&fields=, next page in X-Next-Cursor)
   - POST /api/patients
+  - POST /api/patients/bulk     (JSON array, one transaction; ?mode=upsert|insert)
+  - GET  /api/patients/export   (?format=ndjson|csv&fields=, streamed)
   - GET  /api/patients/<id>
   - PUT  /api/patients/<id>
+  - PATCH /api/patients/<id>    (changed fields only; If-Match: <last_sync_timestamp>)
   - DELETE /api/patients/<id>
 
 Author: Low Back Pain System
 Date: 2025-10-17
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 import sqlite3
+import base64
+import csv
+import io
 import json
 import os
+import queue
+import re
 from datetime import datetime
 import sys
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag'])
 
 # Database configuration
-DB_PATH = os.path.join(os.path.dirname(__file__), 'low_back_pain.db')
+DB_PATH = os.environ.get('DB_PATH', os.path.join(os.path.dirname(__file__), 'low_back_pain.db'))
+
+# Connection pool and per-connection tuning (see open_db_connection)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))  # idle connections kept open
+DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', 5.0))  # seconds to wait on a locked database
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16 * 1024))  # page cache per connection
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+DB_STATEMENT_CACHE = 256  # prepared statements kept per connection
+
+# Patient list pagination
+DEFAULT_PAGE_SIZE = int(os.environ.get('PATIENT_PAGE_SIZE', 100))
+MAX_PAGE_SIZE = 500
+
+# Bulk import / export
+BULK_MAX_PATIENTS = int(os.environ.get('BULK_MAX_PATIENTS', 10000))  # records per POST /api/patients/bulk
+EXPORT_BATCH_SIZE = 500  # rows fetched from the cursor per streamed chunk
+
+PATIENT_COLUMNS = (
+    'id', 'study_id', 'name', 'gender', 'age', 'phone', 'onset_date', 'chief_complaint',
+    'medical_history', 'pain_areas', 'subjective_exam', 'objective_exam', 'functional_scores',
+    'intervention', 'ai_posture_analysis', 'remarks', 'created_date', 'last_sync_timestamp',
+    'workspace_id'
+)
+
+# Structured fields kept as JSON text in their columns (always json.dumps'd)
+JSON_COLUMNS = ('pain_areas', 'functional_scores', 'ai_posture_analysis')
+
+# Python type a column's values are expected to have. Other values are still stored in
+# the column (coerced as the column affinity would, e.g. age "45" -> 45) and their
+# original form is kept in extra_json so full reads return it unchanged
+COLUMN_TYPES = {'age': int}
+
+# PRAGMA user_version: 1 = columns + full data_json copy, 2 = columns + extra_json,
+# 3 = mistyped values (age "45") also stored in their column, 4 = data_json column dropped
+SCHEMA_VERSION = 4
+
+# fields=summary: everything the list view needs, served from idx_patients_list alone
+SUMMARY_FIELDS = ('id', 'study_id', 'name', 'gender', 'age', 'created_date', 'workspace_id')
+
+# Server-maintained fields a PATCH body cannot change
+IMMUTABLE_FIELDS = ('id', 'created_date', 'last_sync_timestamp', 'data_json', 'extra_json')
+
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
 
 print("=" * 60)
 print("SQLite Database Service for Low Back Pain System")
@@ -40,12 +90,79 @@ print()
 # Database Initialization
 # ============================================================
 
+def migrate_patient_storage(conn):
+    """
+    Convert version-1 rows (every field in a column and again in data_json)
+    to version 2 (typed columns + extra_json holding only the other keys),
+    fill version-2 columns whose mistyped value only sat in extra_json, and
+    drop the emptied data_json column so migrated and fresh databases return
+    the same record shape
+    """
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(patients)')}
+    if 'extra_json' not in existing:
+        conn.execute('ALTER TABLE patients ADD COLUMN extra_json TEXT')
+
+    migrated = 0
+    if version < 2 and 'data_json' in existing:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute('SELECT * FROM patients WHERE data_json IS NOT NULL').fetchall()
+        updates = []
+        for row in rows:
+            # Old read path: columns overlaid with the full payload
+            record = {k: row[k] for k in PATIENT_COLUMNS}
+            try:
+                record.update(json.loads(row['data_json']))
+            except ValueError:
+                pass
+            columns, extra_json = split_patient(record)
+            columns.pop('id', None)
+            updates.append((*columns.values(), extra_json, row['id']))
+
+        if updates:
+            set_clause = ', '.join(f'{key} = ?' for key in PATIENT_COLUMNS if key != 'id')
+            conn.executemany(
+                f'UPDATE patients SET {set_clause}, extra_json = ?, data_json = NULL WHERE id = ?',
+                updates
+            )
+        migrated = len(updates)
+        conn.row_factory = None
+
+    if version == 2:
+        for key in COLUMN_TYPES:
+            # Column affinity converts numeric text ("45") as split_patient does
+            conn.execute(
+                f"UPDATE patients SET {key} = json_extract(extra_json, '$.{key}') "
+                f"WHERE {key} IS NULL AND json_type(extra_json, '$.{key}') IN ('text', 'integer', 'real')"
+            )
+
+    dropped = False
+    if 'data_json' in existing:
+        if sqlite3.sqlite_version_info >= (3, 35, 0):
+            conn.execute('ALTER TABLE patients DROP COLUMN data_json')
+            dropped = True
+        else:
+            print(f"[WARN] SQLite {sqlite3.sqlite_version} cannot drop patients.data_json; reads skip it")
+
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.commit()
+
+    if migrated or dropped:
+        conn.execute('VACUUM')  # reclaim the pages the duplicate payloads used
+        print(f"[OK] Migrated {migrated} patients to column + extra_json storage")
+
 def init_database():
     """Initialize SQLite database with patients table"""
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
 
+        # WAL lets readers proceed while a writer commits; the mode is stored in the file
+        journal_mode = cursor.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+
         # Create patients table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS patients (
@@ -68,40 +185,263 @@ def init_database():
                 created_date TEXT NOT NULL,
                 last_sync_timestamp TEXT,
                 workspace_id TEXT,
-                data_json TEXT
+                extra_json TEXT
             )
         ''')
 
+        migrate_patient_storage(conn)
+
+        # Keyset pagination walks (created_date, id); the extra columns make
+        # fields=summary pages index-only scans
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_patients_list
+            ON patients (created_date, id, study_id, name, gender, age, workspace_id)
+        ''')
+
         conn.commit()
         conn.close()
 
         print("[OK] Database initialized successfully")
         print(f"    - Database path: {DB_PATH}")
+        print(f"    - Journal mode: {journal_mode}")
         print()
 
     except Exception as e:
         print(f"[ERROR] Failed to initialize database: {str(e)}")
         sys.exit(1)
 
-# Initialize database on startup
-init_database()
-
 # ============================================================
 # Helper Functions
 # ============================================================
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
+def open_db_connection():
+    """Open a tuned connection for the pool"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT,              # busy timeout instead of immediate "database is locked"
+        cached_statements=DB_STATEMENT_CACHE,  # reuse prepared statements across requests
+        check_same_thread=False                # pooled: used by one request thread at a time
+    )
     conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    conn.execute('PRAGMA synchronous = NORMAL')  # durable in WAL mode, fsync only at checkpoints
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+class ConnectionPool:
+    """
+    Long-lived connections handed to one request at a time
+
+    Flask's threaded server starts a thread per request, so connections are
+    pooled rather than thread-local. Up to `size` idle connections are kept;
+    bursts beyond that open extra connections that are closed on release.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.idle = queue.LifoQueue()  # most recently used first: warmest page cache
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return open_db_connection()
+
+    def release(self, conn):
+        # Never hand on an open transaction (e.g. a handler that failed before commit)
+        if conn.in_transaction:
+            conn.rollback()
+        if self.idle.qsize() < self.size:
+            self.idle.put(conn)
+        else:
+            conn.close()
+
+db_pool = ConnectionPool(DB_POOL_SIZE)
+
+def get_db_connection():
+    """Get this request's pooled connection (returned to the pool at teardown)"""
+    conn = getattr(g, '_database', None)
+    if conn is None:
+        conn = g._database = db_pool.acquire()
     return conn
 
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Return the request's connection to the pool"""
+    conn = g.pop('_database', None)
+    if conn is not None:
+        db_pool.release(conn)
+
 def row_to_dict(row):
     """Convert SQLite row to dictionary"""
     if row is None:
         return None
     return dict(row)
 
+def fits_column(key, value):
+    """Whether a non-null value can be stored in column key (JSON columns take anything)"""
+    if key in JSON_COLUMNS:
+        return True
+    return isinstance(value, COLUMN_TYPES.get(key, str)) and not isinstance(value, bool)
+
+def column_value(key, value):
+    """
+    Value as stored in column key
+
+    A value of the wrong type is coerced the way the column affinity would
+    have stored it (age "45" -> 45, "abc" stays text), so projections that
+    read only the column still see it; lists and objects cannot be.
+    """
+    if key in JSON_COLUMNS:
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    if isinstance(value, (list, dict)):
+        return None
+    if COLUMN_TYPES.get(key) is int and not isinstance(value, int):
+        try:
+            return int(value) if not isinstance(value, float) or value.is_integer() else value
+        except (TypeError, ValueError):
+            return value
+    return value
+
+def split_patient(record):
+    """
+    Split a patient record into column values and the extra_json blob
+
+    Each datum is stored once: known fields go to their typed column, JSON
+    columns hold json.dumps of their value, and every other key goes to
+    extra_json. A known field whose value does not have its column type
+    (age sent as "45") is stored coerced in the column and, with its
+    original type, in extra_json.
+
+    Returns:
+        tuple: ({column: value} for every column, compact extra_json or None)
+    """
+    columns = dict.fromkeys(PATIENT_COLUMNS)
+    extra = {}
+    for key, value in record.items():
+        if key in ('data_json', 'extra_json'):
+            continue
+        if key not in columns:
+            extra[key] = value
+        elif value is None:
+            continue
+        elif fits_column(key, value):
+            columns[key] = column_value(key, value)
+        else:
+            columns[key] = column_value(key, value)
+            extra[key] = value  # e.g. age sent as "45": keep the original type
+    extra_json = json.dumps(extra, ensure_ascii=False, separators=(',', ':')) if extra else None
+    return columns, extra_json
+
+def row_to_patient(row):
+    """Convert SQLite row to a patient record, decoding JSON columns and extra_json"""
+    patient = row_to_dict(row)
+    for key in JSON_COLUMNS:
+        if patient.get(key) is not None:
+            try:
+                patient[key] = json.loads(patient[key])
+            except ValueError:
+                pass
+    patient.pop('data_json', None)  # left on migrated databases by SQLite < 3.35
+    extra_json = patient.pop('extra_json', None)
+    if extra_json:
+        patient.update(json.loads(extra_json))
+    return patient
+
+def patch_patient_sql(patch):
+    """
+    Build the SET clause applying a field-level patch in one UPDATE
+
+    Top-level merge-patch semantics: a column field is overwritten (null
+    clears it), any other key is set in extra_json with json_set, and null
+    removes it with json_remove. Untouched columns and extra keys are never
+    read or rewritten.
+
+    Args:
+        patch: {field: new value}; field names must match FIELD_NAME
+
+    Returns:
+        tuple: (list of "column = expr" assignments, list of parameters)
+    """
+    assignments, params = [], []
+    extra_set, extra_remove = [], []
+
+    for key, value in patch.items():
+        if key in PATIENT_COLUMNS:
+            # A mistyped value keeps its original form in extra_json (see split_patient)
+            assignments.append(f'{key} = ?')
+            params.append(None if value is None else column_value(key, value))
+            if value is None or fits_column(key, value):
+                extra_remove.append(key)
+            else:
+                extra_set.append((key, value))
+        elif value is None:
+            extra_remove.append(key)
+        else:
+            extra_set.append((key, value))
+
+    if extra_set or extra_remove:
+        expr = "COALESCE(extra_json, '{}')"
+        if extra_remove:
+            expr = f"json_remove({expr}, {', '.join('?' for _ in extra_remove)})"
+        if extra_set:
+            expr = f"json_set({expr}, {', '.join('?, json(?)' for _ in extra_set)})"
+        assignments.append(f"extra_json = NULLIF({expr}, '{{}}')")
+        params += [f'$.{key}' for key in extra_remove]
+        for key, value in extra_set:
+            params += [f'$.{key}', json.dumps(value, ensure_ascii=False)]
+
+    return assignments, params
+
+def parse_if_match(header):
+    """last_sync_timestamp from an If-Match header (None for absent or *)"""
+    if not header or header.strip() == '*':
+        return None
+    tag = header.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    return tag.strip('"')
+
+def encode_cursor(row):
+    """Opaque cursor for the (created_date, id) position after row"""
+    position = json.dumps([row['created_date'], row['id']])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        created_date, patient_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return created_date, patient_id
+
+def parse_fields(fields_param):
+    """
+    Resolve ?fields= into (columns to select, whether extra_json is needed, fields to return)
+
+    No fields means the full record (all columns plus extra_json).
+    """
+    if not fields_param:
+        return list(PATIENT_COLUMNS), True, None
+
+    if fields_param == 'summary':
+        fields = list(SUMMARY_FIELDS)
+    else:
+        fields = [f.strip() for f in fields_param.split(',') if f.strip()]
+        invalid = [f for f in fields if not FIELD_NAME.match(f)]
+        if invalid:
+            raise ValueError(f'Invalid field names: {invalid}')
+
+    # created_date and id are always read for the cursor
+    columns = [f for f in fields if f in PATIENT_COLUMNS]
+    columns += [c for c in ('created_date', 'id') if c not in columns]
+    needs_json = any(f not in PATIENT_COLUMNS for f in fields)
+    return columns, needs_json, fields
+
+# Initialize database on startup
+init_database()
+
 # ============================================================
 # API Endpoints
 # ============================================================
@@ -114,7 +454,6 @@ def health_check():
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) as count FROM patients')
         result = cursor.fetchone()
-        conn.close()
 
         return jsonify({
             'status': 'healthy',
@@ -130,35 +469,158 @@ def health_check():
 
 @app.route('/api/patients', methods=['GET'])
 def list_patients():
-    """List all patients"""
+    """
+    List patients, optionally one page at a time
+
+    Query params:
+        sort: -created_date (default) or created_date
+        limit: page size (max MAX_PAGE_SIZE); without limit or cursor every
+               patient is returned, as before paging existed
+        cursor: X-Next-Cursor value from the previous page (pages default
+                to DEFAULT_PAGE_SIZE rows)
+        fields: comma-separated field names, or "summary"; extra_json is only
+                read when a requested field is not a column
+
+    The body is a JSON array; when more rows follow, the X-Next-Cursor
+    response header holds the cursor for the next page. Pages are keyset
+    scans on (created_date, id), so page N costs the same as page 1.
+    """
     try:
+        descending = request.args.get('sort', '-created_date') == '-created_date'
+        paged = 'limit' in request.args or 'cursor' in request.args
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+            if limit < 1:
+                raise ValueError('limit must be positive')
+            limit = min(limit, MAX_PAGE_SIZE)
+            columns, needs_json, fields = parse_fields(request.args.get('fields'))
+            cursor_param = request.args.get('cursor')
+            position = decode_cursor(cursor_param) if cursor_param else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        select_sql = ', '.join(columns + (['extra_json'] if needs_json else []))
+        direction = 'DESC' if descending else 'ASC'
+        where_sql = ''
+        params = []
+        if position is not None:
+            where_sql = f"WHERE (created_date, id) {'<' if descending else '>'} (?, ?)"
+            params.extend(position)
+
         conn = get_db_connection()
         cursor = conn.cursor()
+        sql = f'SELECT {select_sql} FROM patients {where_sql} ORDER BY created_date {direction}, id {direction}'
+        if paged:
+            cursor.execute(f'{sql} LIMIT ?', (*params, limit + 1))
+        else:
+            cursor.execute(sql, params)
+        rows = cursor.fetchall()
 
-        # Get sort order from query params
-        sort_order = request.args.get('sort', '-created_date')
+        has_more = paged and len(rows) > limit
+        rows = rows[:limit] if paged else rows
 
-        if sort_order == '-created_date':
-            order_sql = 'ORDER BY created_date DESC'
-        else:
-            order_sql = 'ORDER BY created_date ASC'
+        patients = [row_to_patient(row) for row in rows]
+        if fields is not None:
+            patients = [{f: patient.get(f) for f in fields} for patient in patients]
 
-        cursor.execute(f'SELECT * FROM patients {order_sql}')
-        rows = cursor.fetchall()
-        conn.close()
+        response = jsonify(patients)
+        if has_more:
+            response.headers['X-Next-Cursor'] = encode_cursor(rows[-1])
+        return response
 
-        patients = [row_to_dict(row) for row in rows]
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Parse JSON fields
-        for patient in patients:
-            if patient.get('data_json'):
-                try:
-                    extra_data = json.loads(patient['data_json'])
-                    patient.update(extra_data)
-                except:
-                    pass
+def csv_value(value):
+    """Cell text for the CSV export (nested values as JSON)"""
+    if value is None:
+        return ''
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+@app.route('/api/patients/export', methods=['GET'])
+def export_patients():
+    """
+    Stream every patient as NDJSON (default) or CSV
+
+    Query params:
+        format: ndjson or csv
+        fields: as for GET /api/patients; CSV defaults to the patient columns
+        workspace_id: only this workspace
+
+    Rows are fetched from one cursor EXPORT_BATCH_SIZE at a time and written
+    out as they arrive, so memory stays flat however many patients there
+    are. NDJSON lines are full records that POST /api/patients/bulk accepts.
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({'error': 'format must be ndjson or csv'}), 400
+        try:
+            columns, needs_json, fields = parse_fields(request.args.get('fields'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if export_format == 'csv' and fields is None:
+            fields = list(PATIENT_COLUMNS)
+
+        select_sql = ', '.join(columns + (['extra_json'] if needs_json else []))
+        where_sql = ''
+        params = []
+        workspace_id = request.args.get('workspace_id')
+        if workspace_id is not None:
+            where_sql = 'WHERE workspace_id = ?'
+            params.append(workspace_id)
+
+        # Own connection: the request's one is released at teardown, before the body is sent
+        conn = db_pool.acquire()
+        cursor = conn.cursor()
 
-        return jsonify(patients)
+        def close():
+            cursor.close()  # finish the statement before the connection goes back to the pool
+            db_pool.release(conn)
+
+        try:
+            cursor.execute(f'SELECT {select_sql} FROM patients {where_sql} ORDER BY created_date, id', params)
+        except Exception:
+            close()
+            raise
+
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if export_format == 'csv':
+                buffer.write('\ufeff')  # BOM so Excel opens the Chinese text as UTF-8
+                writer.writerow(fields)
+            count = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    patient = row_to_patient(row)
+                    if fields is not None:
+                        patient = {f: patient.get(f) for f in fields}
+                    if export_format == 'csv':
+                        writer.writerow([csv_value(v) for v in patient.values()])
+                    else:
+                        buffer.write(json.dumps(patient, ensure_ascii=False) + '\n')
+                count += len(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+            print(f"✅ Exported {count} patients ({export_format})")
+
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        extension = 'csv' if export_format == 'csv' else 'ndjson'
+        response = Response(
+            generate(),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=patients.{extension}'}
+        )
+        response.call_on_close(close)  # after the last row, or on disconnect
+        return response
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -171,22 +633,14 @@ def get_patient(patient_id):
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM patients WHERE id = ?', (patient_id,))
         row = cursor.fetchone()
-        conn.close()
 
         if row is None:
             return jsonify({'error': 'Patient not found'}), 404
 
-        patient = row_to_dict(row)
-
-        # Parse JSON data
-        if patient.get('data_json'):
-            try:
-                extra_data = json.loads(patient['data_json'])
-                patient.update(extra_data)
-            except:
-                pass
-
-        return jsonify(patient)
+        response = jsonify(row_to_patient(row))
+        if row['last_sync_timestamp']:
+            response.headers['ETag'] = f'"{row["last_sync_timestamp"]}"'
+        return response
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -202,29 +656,10 @@ def create_patient():
         created_date = data.get('created_date', datetime.now().isoformat())
         last_sync = datetime.now().isoformat()
 
-        # Extract main fields
-        main_fields = {
-            'id': patient_id,
-            'study_id': data.get('study_id'),
-            'name': data.get('name'),
-            'gender': data.get('gender'),
-            'age': data.get('age'),
-            'phone': data.get('phone'),
-            'onset_date': data.get('onset_date'),
-            'chief_complaint': data.get('chief_complaint'),
-            'medical_history': data.get('medical_history'),
-            'pain_areas': json.dumps(data.get('pain_areas', [])) if isinstance(data.get('pain_areas'), list) else data.get('pain_areas'),
-            'subjective_exam': data.get('subjective_exam'),
-            'objective_exam': data.get('objective_exam'),
-            'functional_scores': json.dumps(data.get('functional_scores', {})) if isinstance(data.get('functional_scores'), dict) else data.get('functional_scores'),
-            'intervention': data.get('intervention'),
-            'ai_posture_analysis': json.dumps(data.get('ai_posture_analysis', {})) if isinstance(data.get('ai_posture_analysis'), dict) else data.get('ai_posture_analysis'),
-            'remarks': data.get('remarks'),
-            'created_date': created_date,
-            'last_sync_timestamp': last_sync,
-            'workspace_id': data.get('workspace_id'),
-            'data_json': json.dumps(data)  # Store complete data as JSON
-        }
+        column_values, extra_json = split_patient({
+            **data, 'id': patient_id, 'created_date': created_date, 'last_sync_timestamp': last_sync
+        })
+        main_fields = {**column_values, 'extra_json': extra_json}
 
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -238,7 +673,6 @@ def create_patient():
         )
 
         conn.commit()
-        conn.close()
 
         print(f"✅ Created patient: {patient_id} (Study ID: {data.get('study_id', 'N/A')})")
 
@@ -248,6 +682,78 @@ def create_patient():
         print(f"❌ Error creating patient: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/patients/bulk', methods=['POST'])
+def bulk_create_patients():
+    """
+    Insert or update many patients in one transaction
+
+    Body: a JSON array of patient records, or {"patients": [...]}.
+    ?mode=upsert (default) merges each record into the stored one for an
+    existing id the way PUT does: fields it carries are overwritten (null
+    clears them), fields it leaves out keep their stored value, and
+    created_date is kept. ?mode=insert rejects the whole batch (409) if any
+    id already exists. Rows are written with a single executemany.
+    """
+    try:
+        data = request.get_json(silent=True)
+        patients = data.get('patients') if isinstance(data, dict) else data
+        mode = request.args.get('mode', 'upsert')
+
+        if not isinstance(patients, list) or not all(isinstance(p, dict) for p in patients):
+            return jsonify({'error': 'Body must be a JSON array of patient objects'}), 400
+        if len(patients) > BULK_MAX_PATIENTS:
+            return jsonify({'error': f'At most {BULK_MAX_PATIENTS} patients per request'}), 413
+        if mode not in ('upsert', 'insert'):
+            return jsonify({'error': 'mode must be upsert or insert'}), 400
+
+        last_sync = datetime.now().isoformat()
+        id_prefix = f"patient-{int(datetime.now().timestamp() * 1000)}"
+        ids, rows = [], []
+        for i, record in enumerate(patients):
+            patient_id = record.get('id') or f'{id_prefix}-{i}'
+            full_record = {
+                **record, 'id': patient_id,
+                'created_date': record.get('created_date', last_sync), 'last_sync_timestamp': last_sync
+            }
+            column_values, extra_json = split_patient(full_record)
+            ids.append(patient_id)
+            row = (*column_values.values(), extra_json)
+            if mode == 'upsert':
+                # {key: null} for every field sent: marks what to overwrite and, as a
+                # merge patch, clears those keys from the stored extra_json first
+                row += (json.dumps(dict.fromkeys(full_record), ensure_ascii=False),)
+            rows.append(row)
+
+        columns = (*PATIENT_COLUMNS, 'extra_json')
+        sql = f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+        if mode == 'upsert':
+            sent = f'?{len(columns) + 1}'
+            updates = [
+                f"{c} = CASE WHEN json_type({sent}, '$.{c}') IS NULL THEN patients.{c} ELSE excluded.{c} END"
+                for c in PATIENT_COLUMNS if c not in ('id', 'created_date')
+            ]
+            updates.append(
+                f"extra_json = NULLIF(json_patch(json_patch(COALESCE(patients.extra_json, '{{}}'), {sent}), "
+                f"COALESCE(excluded.extra_json, '{{}}')), '{{}}')"
+            )
+            sql += f" ON CONFLICT(id) DO UPDATE SET {', '.join(updates)}"
+
+        conn = get_db_connection()
+        try:
+            conn.executemany(sql, rows)
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            conn.rollback()
+            return jsonify({'error': f'Batch rejected, nothing written: {str(e)}'}), 409
+
+        print(f"✅ Bulk {mode}: {len(rows)} patients")
+
+        return jsonify({'mode': mode, 'count': len(rows), 'ids': ids, 'last_sync_timestamp': last_sync})
+
+    except Exception as e:
+        print(f"❌ Error in bulk import: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/patients/<patient_id>', methods=['PUT'])
 def update_patient(patient_id):
     """Update existing patient"""
@@ -262,40 +768,16 @@ def update_patient(patient_id):
         existing = cursor.fetchone()
 
         if existing is None:
-            conn.close()
             return jsonify({'error': 'Patient not found'}), 404
 
-        # Merge with existing data
-        existing_dict = row_to_dict(existing)
-        if existing_dict.get('data_json'):
-            try:
-                existing_data = json.loads(existing_dict['data_json'])
-                merged_data = {**existing_data, **data}
-            except:
-                merged_data = data
-        else:
-            merged_data = data
-
-        # Update fields
-        update_fields = {
-            'study_id': merged_data.get('study_id'),
-            'name': merged_data.get('name'),
-            'gender': merged_data.get('gender'),
-            'age': merged_data.get('age'),
-            'phone': merged_data.get('phone'),
-            'onset_date': merged_data.get('onset_date'),
-            'chief_complaint': merged_data.get('chief_complaint'),
-            'medical_history': merged_data.get('medical_history'),
-            'pain_areas': json.dumps(merged_data.get('pain_areas', [])) if isinstance(merged_data.get('pain_areas'), list) else merged_data.get('pain_areas'),
-            'subjective_exam': merged_data.get('subjective_exam'),
-            'objective_exam': merged_data.get('objective_exam'),
-            'functional_scores': json.dumps(merged_data.get('functional_scores', {})) if isinstance(merged_data.get('functional_scores'), dict) else merged_data.get('functional_scores'),
-            'intervention': merged_data.get('intervention'),
-            'ai_posture_analysis': json.dumps(merged_data.get('ai_posture_analysis', {})) if isinstance(merged_data.get('ai_posture_analysis'), dict) else merged_data.get('ai_posture_analysis'),
-            'remarks': merged_data.get('remarks'),
-            'last_sync_timestamp': last_sync,
-            'data_json': json.dumps(merged_data)
+        # Merge with existing data (id and created_date are immutable)
+        merged_data = {
+            **row_to_patient(existing), **data,
+            'id': patient_id, 'created_date': existing['created_date'], 'last_sync_timestamp': last_sync
         }
+        column_values, extra_json = split_patient(merged_data)
+        column_values.pop('id')
+        update_fields = {**column_values, 'extra_json': extra_json}
 
         set_clause = ', '.join([f'{key} = ?' for key in update_fields.keys()])
         cursor.execute(
@@ -304,16 +786,77 @@ def update_patient(patient_id):
         )
 
         conn.commit()
-        conn.close()
 
         print(f"✅ Updated patient: {patient_id}")
 
-        return jsonify({**merged_data, 'id': patient_id, 'last_sync_timestamp': last_sync})
+        return jsonify(merged_data)
 
     except Exception as e:
         print(f"❌ Error updating patient: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/patients/<patient_id>', methods=['PATCH'])
+def patch_patient(patient_id):
+    """
+    Apply changed fields only (autosave)
+
+    The body holds just the fields that changed; null clears a field. The
+    diff is applied by a single UPDATE ... RETURNING, so the stored record is
+    never read back, merged and rewritten as a whole.
+
+    Send If-Match: "<last_sync_timestamp>" (the ETag of GET/PATCH) to apply
+    the patch only if nobody saved since; otherwise 412 with the current
+    last_sync_timestamp.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+        patch = {k: v for k, v in data.items() if k not in IMMUTABLE_FIELDS}
+        invalid = [k for k in patch if not FIELD_NAME.match(k)]
+        if invalid:
+            return jsonify({'error': f'Invalid field names: {invalid}'}), 400
+
+        expected = parse_if_match(request.headers.get('If-Match'))
+        last_sync = datetime.now().isoformat()
+
+        assignments, params = patch_patient_sql(patch)
+        assignments.append('last_sync_timestamp = ?')
+        params.append(last_sync)
+
+        where = 'id = ?'
+        params.append(patient_id)
+        if expected is not None:
+            where += ' AND last_sync_timestamp = ?'
+            params.append(expected)
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'UPDATE patients SET {", ".join(assignments)} WHERE {where} RETURNING *', params)
+        row = cursor.fetchone()
+        conn.commit()
+
+        if row is None:
+            cursor.execute('SELECT last_sync_timestamp FROM patients WHERE id = ?', (patient_id,))
+            current = cursor.fetchone()
+            if current is None:
+                return jsonify({'error': 'Patient not found'}), 404
+            return jsonify({
+                'error': 'Patient was modified since last_sync_timestamp',
+                'last_sync_timestamp': current['last_sync_timestamp']
+            }), 412
+
+        print(f"✅ Patched patient: {patient_id} ({', '.join(patch) or 'no fields'})")
+
+        response = jsonify(row_to_patient(row))
+        response.headers['ETag'] = f'"{last_sync}"'
+        return response
+
+    except Exception as e:
+        print(f"❌ Error patching patient: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/patients/<patient_id>', methods=['DELETE'])
 def delete_patient(patient_id):
     """Delete patient"""
@@ -326,16 +869,14 @@ def delete_patient(patient_id):
         existing = cursor.fetchone()
 
         if existing is None:
-            conn.close()
             return jsonify({'error': 'Patient not found'}), 404
 
         cursor.execute('DELETE FROM patients WHERE id = ?', (patient_id,))
         conn.commit()
-        conn.close()
 
         print(f"✅ Deleted patient: {patient_id}")
 
-        return jsonify(row_to_dict(existing))
+        return jsonify(row_to_patient(existing))
 
     except Exception as e:
         print(f"❌ Error deleting patient: {str(e)}")
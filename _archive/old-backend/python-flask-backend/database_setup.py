@@ -12,6 +12,496 @@ import hashlib
 from datetime import datetime
 from pathlib import Path
 
+# Patient fields in insert order (after workspace_id)
+PATIENT_FIELDS = (
+    'study_id', 'age', 'gender', 'phone', 'chief_complaint', 'history_type',
+    'first_onset_date', 'pain_type', 'aggravating_factors', 'relieving_factors',
+    'has_radiation', 'radiation_location', 'previous_treatment', 'condition_progress',
+    'pain_score', 'sitting_tolerance', 'standing_tolerance', 'walking_tolerance',
+    'claudication_distance', 'rmdq_score', 'ndi_score', 'assistive_tools',
+    'cervical_posture', 'lumbar_posture', 'distal_pulse', 'medication_details', 'remarks'
+)
+
+RED_FLAG_FIELDS = (
+    'weight_loss', 'appetite_loss', 'fever', 'night_pain', 'bladder_bowel_dysfunction',
+    'saddle_numbness', 'bilateral_limb_weakness', 'bilateral_sensory_abnormal',
+    'hand_clumsiness', 'gait_abnormal'
+)
+
+CERVICAL_FUNCTION_FIELDS = (
+    'dropping_objects', 'difficulty_picking_small_items', 'writing_difficulty',
+    'phone_usage_difficulty', 'buttoning_difficulty', 'chopstick_usage_difficulty'
+)
+
+def patient_insert_sql(upsert=False):
+    """
+    Statements for one patient: patients row, red flags, cervical function
+
+    The child rows find their patient by study_id and workspace
+    (INSERT ... SELECT), so all three run through executemany without
+    reading back lastrowid. With upsert, an existing study_id in the same
+    workspace is updated in place (created_by and created_at kept); one
+    owned by another workspace is left untouched.
+    """
+    columns = ('workspace_id', *PATIENT_FIELDS, 'created_by', 'created_at')
+    patient_sql = f"""
+        INSERT INTO patients ({', '.join(columns)})
+        VALUES ({', '.join('?' for _ in columns)})
+    """
+    if upsert:
+        updates = ', '.join(f'{c} = excluded.{c}' for c in PATIENT_FIELDS)
+        patient_sql += (f" ON CONFLICT(study_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP"
+                        f" WHERE patients.workspace_id = excluded.workspace_id")
+
+    def child_sql(table, fields):
+        sql = f"""
+            INSERT INTO {table} (patient_id, {', '.join(fields)})
+            SELECT id, {', '.join('?' for _ in fields)} FROM patients WHERE study_id = ? AND workspace_id = ?
+        """
+        if upsert:
+            sql += f" ON CONFLICT(patient_id) DO UPDATE SET {', '.join(f'{f} = excluded.{f}' for f in fields)}"
+        return sql
+
+    return (patient_sql,
+            child_sql('patient_red_flags', RED_FLAG_FIELDS),
+            child_sql('patient_cervical_function', CERVICAL_FUNCTION_FIELDS))
+
+def insert_patients(cursor, patients_data, workspace_id=1, created_by=None, upsert=False):
+    """
+    Insert generated/imported patients with executemany
+
+    The whole list is written in one savepoint. If any row fails (duplicate
+    study_id, pain_score out of range, ...) the savepoint is rolled back and
+    the rows are retried one at a time so the good ones still go in. With
+    upsert, rows whose study_id belongs to another workspace are reported
+    as failed instead of taking that patient over.
+
+    Records exported by GET /api/patients/export keep their created_at
+    (generated ones their created_date) and their created_by when that user
+    exists here, so an export/import round trip leaves them unchanged.
+
+    Args:
+        cursor: cursor on an open connection; the caller commits
+        patients_data: patient dicts as produced by generate_patients.py
+        workspace_id: workspace the patients belong to
+        created_by: user id recorded as creator when a record carries none
+        upsert: update patients whose study_id already exists in the workspace
+
+    Returns:
+        tuple: (number of patients written, [(study_id, error message), ...])
+    """
+    patient_sql, red_flag_sql, cervical_sql = patient_insert_sql(upsert)
+
+    cursor.execute(
+        "SELECT id FROM users WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps([p['created_by'] for p in patients_data if p.get('created_by') is not None]),)
+    )
+    known_users = {row[0] for row in cursor.fetchall()}
+
+    def rows_for(batch):
+        patients, red_flags, cervical = [], [], []
+        for p in batch:
+            creator = p.get('created_by')
+            patients.append((
+                workspace_id, *(p.get(f) for f in PATIENT_FIELDS),
+                creator if creator in known_users else created_by,
+                p.get('created_at') or p.get('created_date') or datetime.now().isoformat()
+            ))
+            if p.get('red_flags'):
+                red_flags.append((
+                    *(p['red_flags'].get(f, False) for f in RED_FLAG_FIELDS), p.get('study_id'), workspace_id
+                ))
+            if p.get('cervical_function_problems'):
+                cervical.append((
+                    *(p['cervical_function_problems'].get(f, False) for f in CERVICAL_FUNCTION_FIELDS),
+                    p.get('study_id'), workspace_id
+                ))
+        return patients, red_flags, cervical
+
+    # Savepoints nest inside the caller's transaction instead of committing on RELEASE
+    if not cursor.connection.in_transaction:
+        cursor.execute("BEGIN")
+
+    conflicts = []
+    if upsert:
+        # The upsert's WHERE leaves such rows alone; name them instead of counting them as imported
+        cursor.execute(
+            "SELECT study_id FROM patients WHERE workspace_id IS NOT ? "
+            "AND study_id IN (SELECT value FROM json_each(?))",
+            (workspace_id, json.dumps([p.get('study_id') for p in patients_data]))
+        )
+        taken = {row[0] for row in cursor.fetchall()}
+        if taken:
+            conflicts = [(p.get('study_id'), 'study_id belongs to another workspace')
+                         for p in patients_data if p.get('study_id') in taken]
+            patients_data = [p for p in patients_data if p.get('study_id') not in taken]
+
+    def write(batch):
+        patients, red_flags, cervical = rows_for(batch)
+        cursor.execute("SAVEPOINT import_patients")
+        try:
+            cursor.executemany(patient_sql, patients)
+            cursor.executemany(red_flag_sql, red_flags)
+            cursor.executemany(cervical_sql, cervical)
+        except sqlite3.Error:
+            cursor.execute("ROLLBACK TO import_patients")
+            raise
+        finally:
+            cursor.execute("RELEASE import_patients")
+
+    try:
+        write(patients_data)
+        return len(patients_data), conflicts
+    except sqlite3.Error:
+        pass
+
+    imported_count, failures = 0, conflicts
+    for patient_data in patients_data:
+        try:
+            write([patient_data])
+            imported_count += 1
+        except sqlite3.Error as e:
+            failures.append((patient_data.get('study_id', 'unknown'), str(e)))
+    return imported_count, failures
+
+# Default listing order of GET /api/patients (server.py): keyset pages are index range scans;
+# red-flag filters and dashboard counts are index lookups
+PATIENT_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_patients_workspace_created ON patients (workspace_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_patients_workspace_red_flags ON patients (workspace_id, has_red_flags)",
+)
+
+def red_flag_mask_sql(alias):
+    """SQL for the red_flag_mask of a patient_red_flags row: bit i set if RED_FLAG_FIELDS[i] = 1"""
+    return ' | '.join(f'(CASE WHEN {alias}.{f} = 1 THEN {1 << i} ELSE 0 END)' for i, f in enumerate(RED_FLAG_FIELDS))
+
+def create_red_flag_status(cursor):
+    """
+    Materialise red-flag status on the patients row (idempotent)
+
+    patients.red_flag_mask holds one bit per RED_FLAG_FIELDS entry and
+    patients.has_red_flags is 1 when any is set. Triggers on
+    patient_red_flags keep both current, so listings and dashboard counts
+    no longer join patient_red_flags and evaluate ten ORs per row. Columns
+    missing from an older database are added and backfilled.
+    """
+    cursor.execute("PRAGMA table_info(patients)")
+    existing = {row[1] for row in cursor.fetchall()}
+    if 'red_flag_mask' not in existing:
+        cursor.execute("ALTER TABLE patients ADD COLUMN red_flag_mask INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE patients ADD COLUMN has_red_flags BOOLEAN NOT NULL DEFAULT 0")
+        cursor.execute(f"""
+            UPDATE patients SET red_flag_mask = COALESCE(
+                (SELECT {red_flag_mask_sql('rf')} FROM patient_red_flags rf WHERE rf.patient_id = patients.id), 0
+            )
+        """)
+        cursor.execute("UPDATE patients SET has_red_flags = (red_flag_mask != 0)")
+
+    def set_status(alias):
+        return f"""
+            UPDATE patients
+            SET red_flag_mask = {red_flag_mask_sql(alias)},
+                has_red_flags = ({red_flag_mask_sql(alias)}) != 0
+            WHERE id = {alias}.patient_id;
+        """
+
+    clear_old = "UPDATE patients SET red_flag_mask = 0, has_red_flags = 0 WHERE id = old.patient_id;"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patient_red_flags_insert AFTER INSERT ON patient_red_flags BEGIN
+            {set_status('new')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patient_red_flags_update AFTER UPDATE ON patient_red_flags BEGIN
+            {clear_old}
+            {set_status('new')}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS patient_red_flags_delete AFTER DELETE ON patient_red_flags BEGIN
+            {clear_old}
+        END
+    """)
+
+def create_patient_indexes(cursor):
+    """Create the patients indexes (idempotent)"""
+    for sql in PATIENT_INDEXES:
+        cursor.execute(sql)
+
+# Scores with a per-workspace histogram in workspace_score_histogram
+HISTOGRAM_FIELDS = ('pain_score', 'rmdq_score', 'ndi_score')
+
+HIGH_PAIN_SCORE = 7
+
+def create_workspace_stats(cursor):
+    """
+    Create the per-workspace statistics tables and their triggers (idempotent)
+
+    workspace_stats holds, per workspace: patient count, count and sum of
+    pain scores (for the average), high-pain (>= HIGH_PAIN_SCORE) and
+    red-flag counts. workspace_score_histogram holds patient counts per
+    value of each HISTOGRAM_FIELDS score. Triggers on patients apply +1/-1
+    deltas on insert, delete and update, so /api/patients/stats reads a
+    handful of rows instead of scanning the workspace. Tables created on an
+    existing database are filled from the current rows.
+
+    Returns:
+        bool: True if the tables were created
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'workspace_stats'")
+    if cursor.fetchone():
+        return False
+
+    cursor.execute("""
+        CREATE TABLE workspace_stats (
+            workspace_id INTEGER PRIMARY KEY,
+            patient_count INTEGER NOT NULL DEFAULT 0,
+            pain_score_count INTEGER NOT NULL DEFAULT 0,
+            pain_score_sum INTEGER NOT NULL DEFAULT 0,
+            high_pain_count INTEGER NOT NULL DEFAULT 0,
+            red_flag_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE workspace_score_histogram (
+            workspace_id INTEGER NOT NULL,
+            score_name VARCHAR(20) NOT NULL,
+            score INTEGER NOT NULL,
+            patient_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (workspace_id, score_name, score)
+        ) WITHOUT ROWID
+    """)
+
+    def apply(row, sign):
+        statements = [f"""
+            INSERT INTO workspace_stats (
+                workspace_id, patient_count, pain_score_count, pain_score_sum, high_pain_count, red_flag_count
+            )
+            SELECT {row}.workspace_id, {sign}, {sign} * ({row}.pain_score IS NOT NULL),
+                   {sign} * COALESCE({row}.pain_score, 0),
+                   {sign} * COALESCE({row}.pain_score >= {HIGH_PAIN_SCORE}, 0),
+                   {sign} * ({row}.has_red_flags = 1)
+            WHERE {row}.workspace_id IS NOT NULL
+            ON CONFLICT (workspace_id) DO UPDATE SET
+                patient_count = patient_count + excluded.patient_count,
+                pain_score_count = pain_score_count + excluded.pain_score_count,
+                pain_score_sum = pain_score_sum + excluded.pain_score_sum,
+                high_pain_count = high_pain_count + excluded.high_pain_count,
+                red_flag_count = red_flag_count + excluded.red_flag_count;
+        """]
+        for field in HISTOGRAM_FIELDS:
+            statements.append(f"""
+                INSERT INTO workspace_score_histogram (workspace_id, score_name, score, patient_count)
+                SELECT {row}.workspace_id, '{field}', {row}.{field}, {sign}
+                WHERE {row}.workspace_id IS NOT NULL AND {row}.{field} IS NOT NULL
+                ON CONFLICT (workspace_id, score_name, score) DO UPDATE SET
+                    patient_count = patient_count + excluded.patient_count;
+            """)
+        return ''.join(statements)
+
+    tracked = ', '.join(('workspace_id', 'has_red_flags', *HISTOGRAM_FIELDS))
+    cursor.execute(f"CREATE TRIGGER workspace_stats_insert AFTER INSERT ON patients BEGIN {apply('new', 1)} END")
+    cursor.execute(f"CREATE TRIGGER workspace_stats_delete AFTER DELETE ON patients BEGIN {apply('old', -1)} END")
+    cursor.execute(f"""
+        CREATE TRIGGER workspace_stats_update AFTER UPDATE OF {tracked} ON patients BEGIN
+            {apply('old', -1)}
+            {apply('new', 1)}
+        END
+    """)
+
+    rebuild_workspace_stats(cursor)
+    return True
+
+def compute_workspace_stats(cursor):
+    """
+    Aggregate workspace_stats and workspace_score_histogram from scratch
+
+    Returns:
+        tuple: ({workspace_id: stats row tuple}, {(workspace_id, score_name, score): count})
+    """
+    cursor.execute(f"""
+        SELECT workspace_id, COUNT(*), COUNT(pain_score), COALESCE(SUM(pain_score), 0),
+               COUNT(CASE WHEN pain_score >= {HIGH_PAIN_SCORE} THEN 1 END),
+               COUNT(CASE WHEN has_red_flags = 1 THEN 1 END)
+        FROM patients WHERE workspace_id IS NOT NULL GROUP BY workspace_id
+    """)
+    stats = {row[0]: tuple(row) for row in cursor.fetchall()}
+
+    histograms = {}
+    for field in HISTOGRAM_FIELDS:
+        cursor.execute(f"""
+            SELECT workspace_id, {field}, COUNT(*) FROM patients
+            WHERE workspace_id IS NOT NULL AND {field} IS NOT NULL
+            GROUP BY workspace_id, {field}
+        """)
+        for workspace_id, score, count in cursor.fetchall():
+            histograms[(workspace_id, field, score)] = count
+    return stats, histograms
+
+def rebuild_workspace_stats(cursor):
+    """Replace the statistics tables' contents with a fresh aggregate"""
+    stats, histograms = compute_workspace_stats(cursor)
+    cursor.execute("DELETE FROM workspace_stats")
+    cursor.execute("DELETE FROM workspace_score_histogram")
+    cursor.executemany("INSERT INTO workspace_stats VALUES (?, ?, ?, ?, ?, ?)", stats.values())
+    cursor.executemany(
+        "INSERT INTO workspace_score_histogram VALUES (?, ?, ?, ?)",
+        [(*key, count) for key, count in histograms.items()]
+    )
+
+def check_workspace_stats(cursor, repair=False):
+    """
+    Compare the maintained statistics with a fresh aggregate
+
+    Drift can only come from writes that bypass the triggers (e.g. a bulk
+    load with triggers dropped, or a restored table). Zero-count rows left
+    behind by deletes are not drift.
+
+    Args:
+        cursor: cursor on an open connection; the caller commits a repair
+        repair: rebuild the tables when they differ
+
+    Returns:
+        list: [(table, key, stored, expected), ...]; empty when consistent
+    """
+    expected_stats, expected_histograms = compute_workspace_stats(cursor)
+
+    cursor.execute("SELECT * FROM workspace_stats WHERE patient_count != 0")
+    stored_stats = {row[0]: tuple(row) for row in cursor.fetchall()}
+    cursor.execute("SELECT workspace_id, score_name, score, patient_count FROM workspace_score_histogram "
+                   "WHERE patient_count != 0")
+    stored_histograms = {tuple(row[:3]): row[3] for row in cursor.fetchall()}
+
+    drift = []
+    for table, stored, expected in (('workspace_stats', stored_stats, expected_stats),
+                                    ('workspace_score_histogram', stored_histograms, expected_histograms)):
+        for key in sorted(set(stored) | set(expected), key=str):
+            if stored.get(key) != expected.get(key):
+                drift.append((table, key, stored.get(key), expected.get(key)))
+
+    if drift and repair:
+        rebuild_workspace_stats(cursor)
+    return drift
+
+# Tables whose row counts /api/system/stats reports (kept in table_counts)
+COUNTED_TABLES = ('users', 'workspaces', 'patients', 'patient_red_flags',
+                  'patient_cervical_function', 'patient_files', 'activity_log')
+
+def create_table_counts(cursor):
+    """
+    Create the table_counts row counters and their triggers (idempotent)
+
+    One row per COUNTED_TABLES entry, moved by AFTER INSERT / AFTER DELETE
+    triggers, so system statistics read seven rows instead of counting
+    seven tables. Rows removed by INSERT OR REPLACE do not fire delete
+    triggers (SQLite only does so with recursive_triggers on), so counted
+    tables are written with ON CONFLICT ... DO UPDATE instead;
+    check_table_counts repairs drift from writes made outside this code.
+
+    Returns:
+        bool: True if the table was created
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'table_counts'")
+    if cursor.fetchone():
+        return False
+
+    cursor.execute("""
+        CREATE TABLE table_counts (
+            table_name VARCHAR(50) PRIMARY KEY,
+            row_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    for table in COUNTED_TABLES:
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_count_insert AFTER INSERT ON {table} BEGIN
+                UPDATE table_counts SET row_count = row_count + 1 WHERE table_name = '{table}';
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_count_delete AFTER DELETE ON {table} BEGIN
+                UPDATE table_counts SET row_count = row_count - 1 WHERE table_name = '{table}';
+            END
+        """)
+
+    rebuild_table_counts(cursor)
+    return True
+
+def rebuild_table_counts(cursor):
+    """Recount every COUNTED_TABLES table into table_counts"""
+    cursor.execute("DELETE FROM table_counts")
+    for table in COUNTED_TABLES:
+        cursor.execute(f"INSERT INTO table_counts SELECT '{table}', COUNT(*) FROM {table}")
+
+def check_table_counts(cursor, repair=False):
+    """
+    Compare table_counts with real row counts
+
+    Returns:
+        list: [('table_counts', table, stored, expected), ...]; empty when consistent
+    """
+    cursor.execute("SELECT table_name, row_count FROM table_counts")
+    stored = dict(cursor.fetchall())
+    drift = []
+    for table in COUNTED_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        expected = cursor.fetchone()[0]
+        if stored.get(table) != expected:
+            drift.append(('table_counts', table, stored.get(table), expected))
+
+    if drift and repair:
+        rebuild_table_counts(cursor)
+    return drift
+
+# Columns searched by GET /api/patients?q= (server.py)
+SEARCH_FIELDS = ('study_id', 'chief_complaint', 'phone')
+
+def create_search_index(cursor):
+    """
+    Create the patients_fts full-text index if it does not exist yet
+
+    FTS5 with the trigram tokenizer indexes every 3-character substring, so
+    Chinese complaint text (腰痛伴左腿放射痛) is searchable without word
+    segmentation and a query matches anywhere inside a field, like the
+    LIKE '%term%' it replaces. It is an external-content table over
+    patients, kept in sync by triggers; an index created on an existing
+    database is filled from the current rows.
+
+    Returns:
+        bool: True if the index was created
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patients_fts'")
+    if cursor.fetchone():
+        return False
+
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{f}' for f in SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{f}' for f in SEARCH_FIELDS)
+    cursor.executescript(f"""
+        BEGIN;
+
+        CREATE VIRTUAL TABLE patients_fts USING fts5(
+            {columns}, content='patients', content_rowid='id', tokenize='trigram'
+        );
+
+        CREATE TRIGGER patients_fts_insert AFTER INSERT ON patients BEGIN
+            INSERT INTO patients_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END;
+
+        CREATE TRIGGER patients_fts_delete AFTER DELETE ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END;
+
+        CREATE TRIGGER patients_fts_update AFTER UPDATE OF {columns} ON patients BEGIN
+            INSERT INTO patients_fts (patients_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO patients_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END;
+
+        INSERT INTO patients_fts (patients_fts) VALUES ('rebuild');
+
+        COMMIT;
+    """)
+    return True
+
 class MedicalDatabase:
     def __init__(self, db_path="database/medical_data.db"):
         self.db_path = db_path
@@ -106,6 +596,10 @@ class MedicalDatabase:
                     -- Notes
                     remarks TEXT,
 
+                    -- Red flags (maintained from patient_red_flags, see create_red_flag_status)
+                    red_flag_mask INTEGER NOT NULL DEFAULT 0,
+                    has_red_flags BOOLEAN NOT NULL DEFAULT 0,
+
                     -- Audit
                     created_by INTEGER REFERENCES users(id),
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -182,7 +676,14 @@ class MedicalDatabase:
                 print(f"Creating table: {table_name}")
                 cursor.execute(sql)
 
+            create_red_flag_status(cursor)
+            create_patient_indexes(cursor)
+            create_workspace_stats(cursor)
+            create_table_counts(cursor)
             conn.commit()
+
+            if create_search_index(cursor):
+                print("Creating table: patients_fts (search index)")
             print("SUCCESS: All database tables created successfully")
             return True
 
@@ -225,9 +726,13 @@ class MedicalDatabase:
 
             for user in users:
                 cursor.execute("""
-                    INSERT OR REPLACE INTO users
+                    INSERT INTO users
                     (username, email, password_hash, role, full_name)
                     VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(username) DO UPDATE SET
+                        email = excluded.email, password_hash = excluded.password_hash,
+                        role = excluded.role, full_name = excluded.full_name,
+                        updated_at = CURRENT_TIMESTAMP
                 """, (
                     user["username"], user["email"], user["password_hash"],
                     user["role"], user["full_name"]
@@ -266,9 +771,12 @@ class MedicalDatabase:
             admin_id = admin_user[0]
 
             cursor.execute("""
-                INSERT OR REPLACE INTO workspaces
+                INSERT INTO workspaces
                 (id, name, description, created_by)
                 VALUES (1, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    name = excluded.name, description = excluded.description,
+                    created_by = excluded.created_by, updated_at = CURRENT_TIMESTAMP
             """, (
                 "HKU Orthopedics Research",
                 "University of Hong Kong orthopedics department research workspace",
@@ -311,105 +819,9 @@ class MedicalDatabase:
             doctor_user = cursor.fetchone()
             doctor_id = doctor_user[0] if doctor_user else 1
 
-            imported_count = 0
-
-            for patient_data in patients_data:
-                try:
-                    # Insert main patient data
-                    cursor.execute("""
-                        INSERT INTO patients (
-                            workspace_id, study_id, age, gender, phone,
-                            chief_complaint, history_type, first_onset_date,
-                            pain_type, aggravating_factors, relieving_factors,
-                            has_radiation, radiation_location, previous_treatment,
-                            condition_progress, pain_score, sitting_tolerance,
-                            standing_tolerance, walking_tolerance, claudication_distance,
-                            rmdq_score, ndi_score, assistive_tools, cervical_posture,
-                            lumbar_posture, distal_pulse, medication_details,
-                            remarks, created_by, created_at
-                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        1,  # workspace_id
-                        patient_data.get('study_id'),
-                        patient_data.get('age'),
-                        patient_data.get('gender'),
-                        patient_data.get('phone'),
-                        patient_data.get('chief_complaint'),
-                        patient_data.get('history_type'),
-                        patient_data.get('first_onset_date'),
-                        patient_data.get('pain_type'),
-                        patient_data.get('aggravating_factors'),
-                        patient_data.get('relieving_factors'),
-                        patient_data.get('has_radiation'),
-                        patient_data.get('radiation_location'),
-                        patient_data.get('previous_treatment'),
-                        patient_data.get('condition_progress'),
-                        patient_data.get('pain_score'),
-                        patient_data.get('sitting_tolerance'),
-                        patient_data.get('standing_tolerance'),
-                        patient_data.get('walking_tolerance'),
-                        patient_data.get('claudication_distance'),
-                        patient_data.get('rmdq_score'),
-                        patient_data.get('ndi_score'),
-                        patient_data.get('assistive_tools'),
-                        patient_data.get('cervical_posture'),
-                        patient_data.get('lumbar_posture'),
-                        patient_data.get('distal_pulse'),
-                        patient_data.get('medication_details'),
-                        patient_data.get('remarks'),
-                        doctor_id,
-                        patient_data.get('created_date', datetime.now().isoformat())
-                    ))
-
-                    patient_id = cursor.lastrowid
-
-                    # Insert red flags data
-                    red_flags = patient_data.get('red_flags', {})
-                    if red_flags:
-                        cursor.execute("""
-                            INSERT INTO patient_red_flags (
-                                patient_id, weight_loss, appetite_loss, fever,
-                                night_pain, bladder_bowel_dysfunction, saddle_numbness,
-                                bilateral_limb_weakness, bilateral_sensory_abnormal,
-                                hand_clumsiness, gait_abnormal
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            patient_id,
-                            red_flags.get('weight_loss', False),
-                            red_flags.get('appetite_loss', False),
-                            red_flags.get('fever', False),
-                            red_flags.get('night_pain', False),
-                            red_flags.get('bladder_bowel_dysfunction', False),
-                            red_flags.get('saddle_numbness', False),
-                            red_flags.get('bilateral_limb_weakness', False),
-                            red_flags.get('bilateral_sensory_abnormal', False),
-                            red_flags.get('hand_clumsiness', False),
-                            red_flags.get('gait_abnormal', False)
-                        ))
-
-                    # Insert cervical function data
-                    cervical_function = patient_data.get('cervical_function_problems', {})
-                    if cervical_function:
-                        cursor.execute("""
-                            INSERT INTO patient_cervical_function (
-                                patient_id, dropping_objects, difficulty_picking_small_items,
-                                writing_difficulty, phone_usage_difficulty, buttoning_difficulty,
-                                chopstick_usage_difficulty
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            patient_id,
-                            cervical_function.get('dropping_objects', False),
-                            cervical_function.get('difficulty_picking_small_items', False),
-                            cervical_function.get('writing_difficulty', False),
-                            cervical_function.get('phone_usage_difficulty', False),
-                            cervical_function.get('buttoning_difficulty', False),
-                            cervical_function.get('chopstick_usage_difficulty', False)
-                        ))
-
-                    imported_count += 1
-
-                except Exception as e:
-                    print(f"WARNING: Failed to import patient {patient_data.get('study_id', 'unknown')}: {e}")
+            imported_count, failures = insert_patients(cursor, patients_data, workspace_id=1, created_by=doctor_id)
+            for study_id, error in failures:
+                print(f"WARNING: Failed to import patient {study_id}: {error}")
 
             conn.commit()
             print(f"SUCCESS: Successfully imported {imported_count} patients")
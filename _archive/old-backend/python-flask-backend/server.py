@@ -5,20 +5,36 @@ Provides REST API endpoints to serve the SQLite database
 """
 
 import sqlite3
+import base64
+import csv
+import io
 import json
 import os
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, request, jsonify, g
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 import hashlib
 
+from database_setup import (
+    check_table_counts, check_workspace_stats, create_patient_indexes, create_red_flag_status,
+    create_search_index, create_table_counts, create_workspace_stats, insert_patients,
+    CERVICAL_FUNCTION_FIELDS, COUNTED_TABLES, HISTOGRAM_FIELDS, PATIENT_FIELDS, RED_FLAG_FIELDS, SEARCH_FIELDS
+)
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend
 
 # Database configuration
 DATABASE = 'database/medical_data.db'
 
+# Bulk import / export
+BULK_MAX_PATIENTS = 10000  # records per POST /api/patients/bulk
+EXPORT_BATCH_SIZE = 500  # rows fetched from the cursor per streamed chunk
+
+# Columns GET /api/patients can sort by
+SORT_FIELDS = ('id', 'workspace_id', *PATIENT_FIELDS, 'created_by', 'created_at', 'updated_at')
+
 def get_db():
     """Get database connection"""
     db = getattr(g, '_database', None)
@@ -34,6 +50,60 @@ def close_connection(exception):
     if db is not None:
         db.close()
 
+def search_conditions(search_term):
+    """
+    Split ?q= into an FTS5 MATCH expression and LIKE fallbacks
+
+    Every whitespace-separated term must match (substring, any search
+    field). Terms of 3+ characters are looked up in the trigram index
+    patients_fts; shorter ones cannot be, and fall back to LIKE.
+
+    Returns:
+        tuple: (MATCH expression or None, [SQL condition], [parameters])
+    """
+    phrases, conditions, params = [], [], []
+    for term in search_term.split():
+        if len(term) >= 3:
+            phrases.append('"' + term.replace('"', '""') + '"')
+        else:
+            conditions.append('(' + ' OR '.join(f'p.{f} LIKE ?' for f in SEARCH_FIELDS) + ')')
+            params.extend([f'%{term}%'] * len(SEARCH_FIELDS))
+    return (' AND '.join(phrases) or None), conditions, params
+
+def encode_cursor(sort, value, last_id, total):
+    """Opaque cursor: the sort it belongs to, the last row's sort value and id, the total"""
+    position = json.dumps([sort, value, last_id, total])
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        sort, value, last_id, total = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return sort, value, last_id, total
+
+def keyset_condition(sort_expr, descending, value, last_id):
+    """
+    WHERE condition for the rows after (value, last_id) in ORDER BY sort_expr, p.id
+
+    SQLite sorts NULL first ascending and last descending; row-value
+    comparison cannot see NULLs, so they are handled explicitly.
+
+    Returns:
+        tuple: (SQL condition, parameters)
+    """
+    op = '<' if descending else '>'
+    if value is None:
+        condition = f'({sort_expr} IS NULL AND p.id {op} ?)'
+        if not descending:
+            condition = f'({condition} OR {sort_expr} IS NOT NULL)'
+        return condition, [last_id]
+    condition = f'(({sort_expr}, p.id) {op} (?, ?)'
+    if descending:
+        condition += f' OR {sort_expr} IS NULL'
+    return condition + ')', [value, last_id]
+
 def query_db(query, args=(), one=False):
     """Execute database query"""
     cur = get_db().execute(query, args)
@@ -88,67 +158,159 @@ def login():
 # Patient endpoints
 @app.route('/api/patients', methods=['GET'])
 def get_patients():
-    """Get all patients with optional filtering"""
+    """
+    Get patients with optional filtering, one page at a time
+
+    Query params:
+        workspace_id, q: filter (q as in search_conditions)
+        red_flags: true/false to list only patients with/without red flags
+        sort, order: any patients column, asc/desc (search results default
+                     to relevance)
+        limit: page size
+        page: page number (OFFSET; fine for the first few pages)
+        cursor: pagination.next_cursor of the previous page (keyset; same
+                cost on every page)
+        include_total: false skips counting, e.g. for infinite scroll
+
+    Totals are worked out on the first page only; cursor pages are keyset
+    scans that never see the whole result and repeat the total carried in
+    the cursor. A search counts in the page query itself (COUNT(*) OVER ()),
+    so the FTS/LIKE filter runs once; unfiltered and red_flags-only listings
+    read patient_count/red_flag_count from workspace_stats and count nothing.
+    """
     try:
         # Get query parameters
         workspace_id = request.args.get('workspace_id', 1)
         search_term = request.args.get('q', '')
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
-        sort = request.args.get('sort', 'created_at')
-        order = request.args.get('order', 'desc')
+        sort = request.args.get('sort')
+        order = request.args.get('order', 'desc').lower()
+        include_total = request.args.get('include_total', 'true').lower() != 'false'
+        red_flags = request.args.get('red_flags')
+        cursor = request.args.get('cursor')
 
-        offset = (page - 1) * limit
+        if sort is not None and sort not in SORT_FIELDS:
+            return jsonify({'error': f'Cannot sort by {sort}'}), 400
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': 'order must be asc or desc'}), 400
 
         # Build query
+        from_clause = 'patients p'
         where_conditions = ['p.workspace_id = ?']
         params = [workspace_id]
 
-        if search_term:
-            where_conditions.append('(p.study_id LIKE ? OR p.chief_complaint LIKE ? OR p.phone LIKE ?)')
-            search_param = f'%{search_term}%'
-            params.extend([search_param, search_param, search_param])
+        match, like_conditions, like_params = search_conditions(search_term)
+        if match:
+            # CROSS JOIN pins the FTS lookup as the outer loop; otherwise the planner may walk
+            # idx_patients_workspace_created and re-run MATCH for every patient
+            from_clause = 'patients_fts CROSS JOIN patients p ON p.id = patients_fts.rowid'
+            where_conditions.insert(0, 'patients_fts MATCH ?')
+            params.insert(0, match)
+        where_conditions.extend(like_conditions)
+        params.extend(like_params)
+
+        has_red_flags = None
+        if red_flags is not None:
+            has_red_flags = 0 if red_flags.lower() in ('0', 'false') else 1
+            where_conditions.append('p.has_red_flags = ?')
+            params.append(has_red_flags)
+
+        # Search results are ranked by relevance (bm25) unless a sort is requested
+        if match and sort is None:
+            sort_key, sort_expr, descending = 'rank', 'patients_fts.rank', False
+        else:
+            sort_key = sort or 'created_at'
+            sort_expr, descending = f'p.{sort_key}', order == 'desc'
+        direction = 'DESC' if descending else 'ASC'
+
+        offset = (page - 1) * limit
+        cursor_total = None
+        if cursor:
+            try:
+                cursor_sort, value, last_id, cursor_total = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            if cursor_sort != [sort_key, direction]:
+                return jsonify({'error': 'Cursor belongs to a different sort order'}), 400
+            condition, condition_params = keyset_condition(sort_expr, descending, value, last_id)
+            where_conditions.append(condition)
+            params.extend(condition_params)
+            offset = 0
 
         where_clause = ' AND '.join(where_conditions)
+        count_window = include_total and not cursor and bool(search_term.split())
 
-        # Get patients with red flags
+        # The page is picked (and counted) on narrow (id, sort value) rows;
+        # only the rows on it are joined to the full patient columns
         query = f"""
+            WITH page AS (
+                SELECT p.id AS _id, {sort_expr} AS _sort_value
+                       {', COUNT(*) OVER () AS _total' if count_window else ''}
+                FROM {from_clause}
+                WHERE {where_clause}
+                ORDER BY {sort_expr} {direction}, p.id {direction}
+                LIMIT ? OFFSET ?
+            )
             SELECT p.*,
                    w.name as workspace_name,
-                   CASE WHEN (
-                       rf.weight_loss = 1 OR rf.appetite_loss = 1 OR rf.fever = 1 OR
-                       rf.night_pain = 1 OR rf.bladder_bowel_dysfunction = 1 OR
-                       rf.saddle_numbness = 1 OR rf.bilateral_limb_weakness = 1 OR
-                       rf.bilateral_sensory_abnormal = 1 OR rf.hand_clumsiness = 1 OR
-                       rf.gait_abnormal = 1
-                   ) THEN 1 ELSE 0 END as has_red_flags
-            FROM patients p
+                   page.*
+            FROM page
+            JOIN patients p ON p.id = page._id
             LEFT JOIN workspaces w ON p.workspace_id = w.id
-            LEFT JOIN patient_red_flags rf ON p.id = rf.patient_id
-            WHERE {where_clause}
-            ORDER BY p.{sort} {order.upper()}
-            LIMIT ? OFFSET ?
+            ORDER BY page._sort_value {direction}, p.id {direction}
         """
 
-        patients = query_db(query, params + [limit, offset])
+        # One extra row tells whether another page follows
+        patients = query_db(query, params + [limit + 1, offset])
+        has_more = len(patients) > limit
+        patients = patients[:limit]
+
+        total = None
+        if count_window and patients:
+            total = patients[0]['_total']
+        elif count_window and offset == 0:
+            total = 0
+        elif include_total and cursor:
+            total = cursor_total
+        elif include_total and not search_term.split():
+            # Trigger-maintained counters (database_setup.create_workspace_stats)
+            stats = query_db(
+                "SELECT patient_count, red_flag_count FROM workspace_stats WHERE workspace_id = ?",
+                [workspace_id], one=True
+            )
+            patient_count, red_flag_count = (stats['patient_count'], stats['red_flag_count']) if stats else (0, 0)
+            if has_red_flags is None:
+                total = patient_count
+            else:
+                total = red_flag_count if has_red_flags else patient_count - red_flag_count
+        elif include_total:
+            # A search page past the end has no row to carry the window total
+            count_query = f"SELECT COUNT(*) as total FROM {from_clause} WHERE {where_clause}"
+            total = query_db(count_query, params, one=True)['total']
 
         # Convert to list of dicts
         patients_list = []
         for patient in patients:
             patient_dict = dict(patient)
+            for key in ('_id', '_sort_value', '_total'):
+                patient_dict.pop(key, None)
             patients_list.append(patient_dict)
 
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM patients p WHERE {where_clause}"
-        total = query_db(count_query, params, one=True)['total']
+        next_cursor = None
+        if has_more:
+            last = patients[-1]
+            next_cursor = encode_cursor([sort_key, direction], last['_sort_value'], last['id'], total)
 
         return jsonify({
             'patients': patients_list,
             'pagination': {
-                'page': page,
+                'page': None if cursor else page,
                 'limit': limit,
                 'total': total,
-                'pages': (total + limit - 1) // limit
+                'pages': (total + limit - 1) // limit if total is not None else None,
+                'has_more': has_more,
+                'next_cursor': next_cursor
             }
         })
 
@@ -205,44 +367,168 @@ def get_patient(patient_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/patients/stats', methods=['GET'])
-def get_patient_stats():
-    """Get patient statistics for dashboard"""
+@app.route('/api/patients/bulk', methods=['POST'])
+def bulk_import_patients():
+    """
+    Import many patients in one transaction
+
+    Body: a JSON array of patients in the generate_patients.py / export
+    format (red_flags and cervical_function_problems nested), or
+    {"patients": [...]}. ?mode=upsert (default) updates patients whose
+    study_id exists in the workspace; ?mode=insert reports them as failed.
+    A study_id owned by another workspace always fails. Rows that fail are
+    skipped and listed, the rest are committed together.
+    """
     try:
+        data = request.get_json(silent=True)
+        patients = data.get('patients') if isinstance(data, dict) else data
         workspace_id = request.args.get('workspace_id', 1)
+        mode = request.args.get('mode', 'upsert')
+
+        if not isinstance(patients, list) or not all(isinstance(p, dict) for p in patients):
+            return jsonify({'error': 'Body must be a JSON array of patient objects'}), 400
+        if len(patients) > BULK_MAX_PATIENTS:
+            return jsonify({'error': f'At most {BULK_MAX_PATIENTS} patients per request'}), 413
+        if mode not in ('upsert', 'insert'):
+            return jsonify({'error': 'mode must be upsert or insert'}), 400
+
+        db = get_db()
+        imported, failures = insert_patients(
+            db.cursor(), patients, workspace_id=workspace_id, upsert=(mode == 'upsert')
+        )
+        db.commit()
 
-        # Total patients
-        total = query_db(
-            'SELECT COUNT(*) as count FROM patients WHERE workspace_id = ?',
-            [workspace_id], one=True
-        )['count']
+        return jsonify({
+            'mode': mode,
+            'imported': imported,
+            'failed': [{'study_id': study_id, 'error': error} for study_id, error in failures]
+        })
 
-        # High pain patients (score >= 7)
-        high_pain = query_db(
-            'SELECT COUNT(*) as count FROM patients WHERE workspace_id = ? AND pain_score >= 7',
-            [workspace_id], one=True
-        )['count']
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        # Patients with red flags
-        red_flags = query_db(
-            '''SELECT COUNT(*) as count FROM patients p
-               INNER JOIN patient_red_flags rf ON p.id = rf.patient_id
-               WHERE p.workspace_id = ? AND (
-                   rf.weight_loss = 1 OR rf.appetite_loss = 1 OR rf.fever = 1 OR
-                   rf.night_pain = 1 OR rf.bladder_bowel_dysfunction = 1 OR
-                   rf.saddle_numbness = 1 OR rf.bilateral_limb_weakness = 1 OR
-                   rf.bilateral_sensory_abnormal = 1 OR rf.hand_clumsiness = 1 OR
-                   rf.gait_abnormal = 1
-               )''',
-            [workspace_id], one=True
-        )['count']
+@app.route('/api/patients/export', methods=['GET'])
+def export_patients():
+    """
+    Stream a workspace's patients as NDJSON (default) or CSV
 
-        # Average pain score
-        avg_pain = query_db(
-            'SELECT AVG(pain_score) as avg FROM patients WHERE workspace_id = ? AND pain_score IS NOT NULL',
+    Red flags and cervical function are joined in: nested objects in NDJSON
+    (the format /api/patients/bulk accepts), "red_flags.fever"-style columns
+    in CSV. Rows are read from one cursor EXPORT_BATCH_SIZE at a time and
+    sent as they arrive instead of being loaded into memory.
+    """
+    try:
+        workspace_id = request.args.get('workspace_id', 1)
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+        nested = [f'rf.{f} AS "red_flags.{f}"' for f in RED_FLAG_FIELDS]
+        nested += [f'cf.{f} AS "cervical_function_problems.{f}"' for f in CERVICAL_FUNCTION_FIELDS]
+        # Own connection: g._database is closed at teardown, before the body is sent
+        conn = sqlite3.connect(DATABASE)
+        cursor = conn.cursor()
+
+        def close():
+            cursor.close()
+            conn.close()
+
+        try:
+            cursor.execute(f"""
+                SELECT p.*, {', '.join(nested)}
+                FROM patients p
+                LEFT JOIN patient_red_flags rf ON p.id = rf.patient_id
+                LEFT JOIN patient_cervical_function cf ON p.id = cf.patient_id
+                WHERE p.workspace_id = ?
+                ORDER BY p.id
+            """, [workspace_id])
+        except Exception:
+            close()
+            raise
+        columns = [d[0] for d in cursor.description]
+
+        def to_record(row):
+            record = {}
+            for key, value in zip(columns, row):
+                group, _, field = key.partition('.')
+                if field:
+                    # No child row: leave the group out, as the import does
+                    if value is not None:
+                        record.setdefault(group, {})[field] = value
+                else:
+                    record[key] = value
+            return record
+
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if export_format == 'csv':
+                buffer.write('\ufeff')  # BOM so Excel opens the Chinese text as UTF-8
+                writer.writerow(columns)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    if export_format == 'csv':
+                        writer.writerow(['' if v is None else v for v in row])
+                    else:
+                        buffer.write(json.dumps(to_record(row), ensure_ascii=False) + '\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+
+        mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        extension = 'csv' if export_format == 'csv' else 'ndjson'
+        response = Response(
+            generate(),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=patients.{extension}'}
+        )
+        response.call_on_close(close)  # after the last row, or on disconnect
+        return response
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/patients/stats', methods=['GET'])
+def get_patient_stats():
+    """
+    Get patient statistics for dashboard
+
+    Counts, the pain average and score histograms are read from
+    workspace_stats / workspace_score_histogram, which triggers keep current
+    (see database_setup.create_workspace_stats), so the cost does not grow
+    with the number of patients. recent24h depends on the clock and is a
+    range count on idx_patients_workspace_created.
+    """
+    try:
+        workspace_id = request.args.get('workspace_id', 1)
+
+        stats = query_db(
+            'SELECT * FROM workspace_stats WHERE workspace_id = ?',
             [workspace_id], one=True
         )
-        avg_pain_score = round(avg_pain['avg'], 1) if avg_pain['avg'] else 0
+        if stats is None:
+            total = high_pain = red_flags = pain_score_count = pain_score_sum = 0
+        else:
+            total = stats['patient_count']
+            high_pain = stats['high_pain_count']
+            red_flags = stats['red_flag_count']
+            pain_score_count = stats['pain_score_count']
+            pain_score_sum = stats['pain_score_sum']
+
+        # Average pain score
+        avg_pain_score = round(pain_score_sum / pain_score_count, 1) if pain_score_count else 0
+
+        histograms = {field: {} for field in HISTOGRAM_FIELDS}
+        for row in query_db(
+            '''SELECT score_name, score, patient_count FROM workspace_score_histogram
+               WHERE workspace_id = ? AND patient_count != 0 ORDER BY score_name, score''',
+            [workspace_id]
+        ):
+            histograms[row['score_name']][row['score']] = row['patient_count']
 
         # Recent patients (last 24 hours)
         recent = query_db(
@@ -256,7 +542,36 @@ def get_patient_stats():
             'highPain': high_pain,
             'redFlags': red_flags,
             'avgPainScore': avg_pain_score,
-            'recent24h': recent
+            'recent24h': recent,
+            'histograms': histograms
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/patients/stats/check', methods=['POST'])
+def check_patient_stats():
+    """
+    Consistency check for the maintained statistics
+
+    Recomputes every workspace's aggregates and every table count and
+    reports any difference; ?repair=true also rebuilds the tables. Meant for a periodic
+    job (cron) and after restoring or hand-editing the database.
+    """
+    try:
+        repair = request.args.get('repair', 'false').lower() == 'true'
+        db = get_db()
+        drift = check_workspace_stats(db.cursor(), repair=repair)
+        drift += check_table_counts(db.cursor(), repair=repair)
+        db.commit()
+
+        return jsonify({
+            'consistent': not drift,
+            'repaired': bool(drift) and repair,
+            'drift': [
+                {'table': table, 'key': key, 'stored': stored, 'expected': expected}
+                for table, key, stored, expected in drift
+            ]
         })
 
     except Exception as e:
@@ -267,11 +582,13 @@ def get_patient_stats():
 def get_workspaces():
     """Get all workspaces"""
     try:
+        # patient_count comes from the trigger-maintained workspace_stats row
         workspaces = query_db(
             '''SELECT w.*, u.full_name as created_by_name,
-                      (SELECT COUNT(*) FROM patients WHERE workspace_id = w.id) as patient_count
+                      COALESCE(s.patient_count, 0) as patient_count
                FROM workspaces w
                LEFT JOIN users u ON w.created_by = u.id
+               LEFT JOIN workspace_stats s ON s.workspace_id = w.id
                ORDER BY w.created_at DESC'''
         )
 
@@ -292,16 +609,11 @@ def health_check():
 
 @app.route('/api/system/stats', methods=['GET'])
 def system_stats():
-    """Get system statistics"""
+    """Get system statistics (row counts from the trigger-maintained table_counts)"""
     try:
-        stats = {}
-
-        tables = ['users', 'workspaces', 'patients', 'patient_red_flags',
-                 'patient_cervical_function', 'patient_files', 'activity_log']
-
-        for table in tables:
-            count = query_db(f'SELECT COUNT(*) as count FROM {table}', one=True)
-            stats[table] = count['count']
+        stats = dict.fromkeys(COUNTED_TABLES, 0)
+        for row in query_db('SELECT table_name, row_count FROM table_counts'):
+            stats[row['table_name']] = row['row_count']
 
         # Get database file size
         db_path = Path(DATABASE)
@@ -330,6 +642,23 @@ if __name__ == '__main__':
         print("ERROR: Database not found. Please run database_setup.py first.")
         exit(1)
 
+    # Databases set up before the red-flag columns, statistics tables and search index
+    # existed get them on first start
+    with sqlite3.connect(DATABASE) as conn:
+        create_red_flag_status(conn.cursor())
+        create_patient_indexes(conn.cursor())
+        if create_workspace_stats(conn.cursor()):
+            print("Statistics tables workspace_stats created")
+        elif check_workspace_stats(conn.cursor(), repair=True):
+            print("WARNING: workspace_stats had drifted from patients; rebuilt")
+        if create_table_counts(conn.cursor()):
+            print("Row counters table_counts created")
+        elif check_table_counts(conn.cursor(), repair=True):
+            print("WARNING: table_counts had drifted; rebuilt")
+        conn.commit()
+        if create_search_index(conn.cursor()):
+            print("Search index patients_fts created")
+
     print("Medical System Backend Server")
     print("=" * 40)
     print(f"Database: {DATABASE}")
@@ -338,7 +667,10 @@ if __name__ == '__main__':
     print("  POST /api/auth/login")
     print("  GET  /api/patients")
     print("  GET  /api/patients/<id>")
+    print("  POST /api/patients/bulk")
+    print("  GET  /api/patients/export")
     print("  GET  /api/patients/stats")
+    print("  POST /api/patients/stats/check")
     print("  GET  /api/workspaces")
     print("  GET  /api/system/health")
     print("  GET  /api/system/stats")
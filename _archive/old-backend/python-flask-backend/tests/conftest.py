@@ -0,0 +1,41 @@
+"""
+Shared fixtures: a fresh database per test for server.py and database_service.py
+
+Run from this directory's parent:
+    python -m pytest tests
+"""
+
+import importlib
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import database_setup  # noqa: E402
+
+
+@pytest.fixture
+def server_client(tmp_path, monkeypatch):
+    """Test client for server.py on a database built by database_setup.py"""
+    db = database_setup.MedicalDatabase(str(tmp_path / 'medical_data.db'))
+    assert db.create_tables() and db.create_initial_users() and db.create_default_workspace()
+
+    import server
+    monkeypatch.setattr(server, 'DATABASE', db.db_path)
+    server.app.config['TESTING'] = True
+    return server.app.test_client()
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """database_service imported against an empty database of its own"""
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'patients.db'))
+    if 'database_service' in sys.modules:
+        module = importlib.reload(sys.modules['database_service'])
+    else:
+        module = importlib.import_module('database_service')
+    module.app.config['TESTING'] = True
+    return module
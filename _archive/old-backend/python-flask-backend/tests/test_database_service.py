@@ -0,0 +1,131 @@
+"""
+database_service.py: listing, bulk import, export, PATCH and storage format
+"""
+
+import importlib
+import json
+import sqlite3
+
+
+def bulk(client, records, mode='upsert'):
+    response = client.post(f'/api/patients/bulk?mode={mode}', json=records)
+    return response.status_code, response.get_json()
+
+
+def seed(client, count):
+    records = [{'id': f'p{i:03d}', 'name': f'患者{i}', 'created_date': f'2024-01-01T00:00:{i:02d}'}
+               for i in range(count)]
+    assert bulk(client, records)[0] == 200
+    return records
+
+
+def test_list_without_paging_params_returns_everyone(service, monkeypatch):
+    monkeypatch.setattr(service, 'DEFAULT_PAGE_SIZE', 3)
+    client = service.app.test_client()
+    seed(client, 7)
+
+    response = client.get('/api/patients')
+    assert len(response.get_json()) == 7
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_cursor_pages_cover_every_patient_once(service):
+    client = service.app.test_client()
+    seed(client, 7)
+
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/patients?limit=3&fields=id' + (f'&cursor={cursor}' if cursor else ''))
+        seen += [p['id'] for p in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    assert seen == [f'p{i:03d}' for i in reversed(range(7))]
+
+
+def test_version_1_database_loses_data_json_column(service, tmp_path, monkeypatch):
+    path = tmp_path / 'v1.db'
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'CREATE TABLE patients (id TEXT PRIMARY KEY, study_id TEXT, name TEXT, gender TEXT, age INTEGER, '
+        'phone TEXT, onset_date TEXT, chief_complaint TEXT, medical_history TEXT, pain_areas TEXT, '
+        'subjective_exam TEXT, objective_exam TEXT, functional_scores TEXT, intervention TEXT, '
+        'ai_posture_analysis TEXT, remarks TEXT, created_date TEXT NOT NULL, last_sync_timestamp TEXT, '
+        'workspace_id TEXT, data_json TEXT)'
+    )
+    record = {'id': 'old', 'name': '张三', 'age': 45, 'created_date': '2023-05-01T08:00:00', 'notes': '夜间痛'}
+    conn.execute(
+        'INSERT INTO patients (id, name, age, created_date, data_json) VALUES (?, ?, ?, ?, ?)',
+        ('old', '张三', 45, '2023-05-01T08:00:00', json.dumps(record, ensure_ascii=False))
+    )
+    conn.execute('PRAGMA user_version = 1')
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setenv('DB_PATH', str(path))
+    module = importlib.reload(service)
+
+    conn = sqlite3.connect(path)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(patients)')}
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == module.SCHEMA_VERSION
+    conn.close()
+    assert 'data_json' not in columns
+
+    patients = module.app.test_client().get('/api/patients').get_json()
+    assert [{k: p[k] for k in record} for p in patients] == [record]
+    assert 'data_json' not in patients[0]
+
+
+def test_patch_changes_only_sent_fields(service):
+    client = service.app.test_client()
+    bulk(client, [{'id': 'p1', 'name': '李四', 'age': 50, 'phone': '123', 'notes': '久坐'}])
+
+    response = client.patch('/api/patients/p1', json={'age': 51, 'phone': None, 'pain_level': 7})
+    assert response.status_code == 200
+    patient = client.get('/api/patients/p1').get_json()
+    assert (patient['name'], patient['age'], patient['phone']) == ('李四', 51, None)
+    assert (patient['notes'], patient['pain_level']) == ('久坐', 7)
+
+
+def test_patch_if_match_rejects_stale_writes(service):
+    client = service.app.test_client()
+    bulk(client, [{'id': 'p1', 'name': '李四'}])
+    etag = client.patch('/api/patients/p1', json={'age': 50}).headers['ETag']
+
+    assert client.patch('/api/patients/p1', json={'age': 51}, headers={'If-Match': etag}).status_code == 200
+    stale = client.patch('/api/patients/p1', json={'age': 52}, headers={'If-Match': etag})
+    assert stale.status_code == 412
+    assert client.get('/api/patients/p1').get_json()['age'] == 51
+    assert client.patch('/api/patients/nobody', json={'age': 1}).status_code == 404
+
+
+def test_bulk_upsert_merges_and_insert_rejects_whole_batch(service):
+    client = service.app.test_client()
+    assert bulk(client, [{'id': 'p1', 'name': '王五', 'age': 30, 'notes': '久坐'}])[0] == 200
+
+    status, body = bulk(client, [{'id': 'p1', 'age': 31, 'notes': None}, {'id': 'p2', 'name': '赵六'}])
+    assert status == 200 and body['ids'] == ['p1', 'p2']
+    patient = client.get('/api/patients/p1').get_json()
+    assert (patient['name'], patient['age'], patient.get('notes')) == ('王五', 31, None)
+
+    status, _ = bulk(client, [{'id': 'p3'}, {'id': 'p1'}], mode='insert')
+    assert status == 409
+    assert client.get('/api/patients/p3').status_code == 404
+    assert bulk(client, {'patients': 'x'})[0] == 400
+
+
+def test_ndjson_export_reimports_unchanged(service):
+    client = service.app.test_client()
+    records = seed(client, 3)
+    bulk(client, [{'id': 'p001', 'pain_areas': ['腰'], 'notes': '夜间痛'}])
+
+    exported = client.get('/api/patients/export').get_data(as_text=True)
+    lines = [json.loads(line) for line in exported.splitlines()]
+    assert [p['id'] for p in lines] == [r['id'] for r in records]
+    assert lines[1]['notes'] == '夜间痛'
+
+    client.delete('/api/patients/p001')
+    assert bulk(client, lines, mode='insert')[0] == 409
+    assert bulk(client, lines)[0] == 200
+    assert {k: v for k, v in client.get('/api/patients/p001').get_json().items() if k != 'last_sync_timestamp'} == \
+           {k: v for k, v in lines[1].items() if k != 'last_sync_timestamp'}
@@ -0,0 +1,19 @@
+"""
+database_setup.py: seeding and the table_counts row counters
+"""
+
+import sqlite3
+
+import database_setup
+
+
+def test_reseeding_keeps_table_counts_exact(tmp_path):
+    db = database_setup.MedicalDatabase(str(tmp_path / 'medical_data.db'))
+    assert db.create_tables()
+    for _ in range(2):
+        assert db.create_initial_users() and db.create_default_workspace()
+
+    with sqlite3.connect(db.db_path) as conn:
+        assert database_setup.check_table_counts(conn.cursor()) == []
+        counts = dict(conn.execute("SELECT table_name, row_count FROM table_counts"))
+    assert counts['users'] == 2 and counts['workspaces'] == 1
@@ -0,0 +1,106 @@
+"""
+server.py: bulk import, export, listing and search
+"""
+
+import json
+
+import server
+
+
+def patient(study_id, **fields):
+    return {'study_id': study_id, 'age': 40, 'gender': '男', 'pain_score': 5, **fields}
+
+
+def export_records(client, workspace_id=1):
+    response = client.get(f'/api/patients/export?workspace_id={workspace_id}')
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_export_import_round_trip_keeps_records(server_client):
+    imported = server_client.post('/api/patients/bulk', json=[
+        patient('RT-1', created_at='2024-01-02 03:04:05', created_by=2, red_flags={'fever': True}),
+        patient('RT-2', created_date='2024-02-03T04:05:06', cervical_function_problems={'writing_difficulty': True}),
+    ]).get_json()
+    assert imported['imported'] == 2 and imported['failed'] == []
+
+    before = export_records(server_client)
+    assert [r['created_at'] for r in before] == ['2024-01-02 03:04:05', '2024-02-03T04:05:06']
+    assert before[0]['created_by'] == 2
+
+    # Re-import into another workspace; study_ids are unique, so move the originals aside
+    with server.app.app_context():
+        db = server.get_db()
+        db.execute("INSERT INTO workspaces (id, name) VALUES (2, 'copy')")
+        db.execute("UPDATE patients SET study_id = 'OLD-' || study_id")
+        db.commit()
+    result = server_client.post('/api/patients/bulk?workspace_id=2', json=before).get_json()
+    assert result['imported'] == 2 and result['failed'] == []
+
+    skip = {'id', 'workspace_id', 'updated_at'}
+    after = export_records(server_client, workspace_id=2)
+    assert [{k: v for k, v in r.items() if k not in skip} for r in after] == \
+           [{k: v for k, v in r.items() if k not in skip} for r in before]
+
+
+def test_unknown_creator_falls_back_to_importer(server_client):
+    server_client.post('/api/patients/bulk', json=[patient('RT-3', created_by=999)])
+    assert export_records(server_client)[0]['created_by'] is None
+
+
+def test_bulk_modes_and_validation(server_client):
+    assert server_client.post('/api/patients/bulk', json={'patients': 'x'}).status_code == 400
+    assert server_client.post('/api/patients/bulk?mode=merge', json=[]).status_code == 400
+
+    server_client.post('/api/patients/bulk', json=[patient('B-1')])
+    result = server_client.post('/api/patients/bulk?mode=insert', json=[patient('B-1'), patient('B-2')]).get_json()
+    assert result['imported'] == 1 and [f['study_id'] for f in result['failed']] == ['B-1']
+
+    result = server_client.post('/api/patients/bulk', json=[patient('B-1', age=70)]).get_json()
+    assert result['imported'] == 1 and result['failed'] == []
+    assert [r['age'] for r in export_records(server_client)] == [70, 40]
+
+
+def test_csv_export_flattens_nested_records(server_client):
+    server_client.post('/api/patients/bulk', json=[patient('C-1', red_flags={'fever': True})])
+    response = server_client.get('/api/patients/export?format=csv')
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    header, row = response.get_data(as_text=True).lstrip('\ufeff').splitlines()
+    assert row.split(',')[header.split(',').index('red_flags.fever')] == '1'
+    assert server_client.get('/api/patients/export?format=xml').status_code == 400
+
+
+def search(client, q, **params):
+    response = client.get('/api/patients', query_string={'q': q, **params})
+    assert response.status_code == 200
+    body = response.get_json()
+    return sorted(p['study_id'] for p in body['patients']), body['pagination']
+
+
+def test_search_matches_substrings_through_the_index(server_client):
+    server_client.post('/api/patients/bulk', json=[
+        patient('S-1', chief_complaint='腰痛伴左腿放射痛'),
+        patient('S-2', chief_complaint='颈痛三月', phone='91234567'),
+        patient('S-3', chief_complaint='右腿麻木'),
+    ])
+    assert search(server_client, '左腿放射')[0] == ['S-1']
+    assert search(server_client, '腿')[0] == ['S-1', 'S-3']
+    assert search(server_client, '腰痛 腿')[0] == ['S-1']
+    assert search(server_client, '1234')[0] == ['S-2']
+    assert search(server_client, '"无此')[0] == []
+
+    ids, pagination = search(server_client, '痛', limit=1)
+    assert len(ids) == 1 and pagination['total'] == 2 and pagination['has_more']
+
+
+def test_search_follows_updates_and_deletes(server_client):
+    server_client.post('/api/patients/bulk', json=[patient('S-4', chief_complaint='腰痛伴左腿放射痛')])
+    server_client.post('/api/patients/bulk', json=[patient('S-4', chief_complaint='膝关节疼痛')])
+    assert search(server_client, '放射痛')[0] == []
+    assert search(server_client, '膝关节')[0] == ['S-4']
+
+    with server.app.app_context():
+        db = server.get_db()
+        db.execute("DELETE FROM patients WHERE study_id = 'S-4'")
+        db.commit()
+    assert search(server_client, '膝关节')[0] == []
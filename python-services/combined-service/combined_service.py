@@ -0,0 +1,100 @@
+"""
+Combined OCR + Pose Service for Medical System
+
+Optional single-process deployment of ocr_service.py and pose_service.py.
+Both blueprints are mounted on one Flask app, so OpenCV, NumPy, PIL and the
+Python runtime are loaded once instead of once per container. Every
+existing URL is unchanged; point both VITE_OCR_SERVICE_URL and
+VITE_POSE_SERVICE_URL at this service.
+
+Both services decode uploads and create their worker pools through
+vision_common.py, so each pool exists once per process.
+Concurrency stays independent: OCR work is bounded by its own pools
+(OCR_MAX_WORKERS, OCR_TILE_WORKERS, OCR_JOB_WORKERS) and pose analysis by
+the MediaPipe lock in pose_service.py, so a burst of scans cannot starve
+posture requests or vice versa.
+
+Port: 5000 (PORT)
+Endpoints:
+  - GET  /health               (merged OCR + pose status)
+  - all /ocr/*, /metrics       (see ocr_service.py)
+  - POST /pose/analyze-static  (see pose_service.py)
+
+If MediaPipe is not installed or fails to initialise, the service starts
+with OCR only.
+
+Author: Low Back Pain System
+Date: 2025-11-26
+"""
+
+from flask import Flask, jsonify
+from flask_cors import CORS
+import os
+import sys
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Docker images copy the service files next to this one; in the repo they are siblings
+for service_dir in ('ocr-service', 'mediapipe-service'):
+    sys.path.insert(0, os.path.join(SERVICES_DIR, service_dir))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ocr_service  # noqa: E402
+
+try:
+    import pose_service  # noqa: E402
+except Exception as e:  # not installed (ImportError) or MediaPipe failed to start (RuntimeError)
+    print(f"[WARN] Pose service unavailable ({e}); running OCR only")
+    pose_service = None
+
+app = Flask(__name__)
+CORS(app)
+
+app.register_blueprint(ocr_service.ocr_bp)
+if pose_service is not None:
+    app.register_blueprint(pose_service.pose_bp)
+
+# ============================================================
+# API Endpoints
+# ============================================================
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """
+    Health check endpoint
+
+    Reports each mounted service's own /health payload; unhealthy if any
+    service is.
+    """
+    services = {'ocr': ocr_service.health_check}
+    if pose_service is not None:
+        services['pose'] = pose_service.health_check
+
+    statuses = {}
+    healthy = True
+    for name, check in services.items():
+        response = app.make_response(check())
+        statuses[name] = response.get_json()
+        healthy = healthy and response.status_code == 200
+
+    return jsonify({
+        'status': 'healthy' if healthy else 'unhealthy',
+        'service': 'combined',
+        'services': statuses
+    }), 200 if healthy else 500
+
+# ============================================================
+# Run Server
+# ============================================================
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5000))
+    print()
+    print("Combined services:")
+    print("  [OK] OCR (Tesseract)")
+    print(f"  [{'OK' if pose_service is not None else '--'}] Pose (MediaPipe)")
+    print()
+    print(f"[START] Starting combined server on http://0.0.0.0:{port}")
+    print("=" * 60)
+    # No reloader: it would import both services (and their models) a second time
+    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
@@ -14,21 +14,35 @@ Author: Low Back Pain System
 Date: 2025-10-17
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, request, jsonify
 from flask_cors import CORS
+from functools import wraps
 import mediapipe as mp
 import cv2
 import numpy as np
-import base64
 import math
-from PIL import Image
-import io
-import sys
+import os
+import threading
+import time
 import traceback
 
+# Decode helpers and worker pools shared with the OCR service. Each service directory
+# carries an identical copy so its Docker build stays self-contained.
+from vision_common import decode_base64_payload, decode_image_array, shared_executor
+
 app = Flask(__name__)
 CORS(app)
 
+# Requests waiting for or holding the MediaPipe graph before new ones get 429
+POSE_MAX_PENDING = int(os.environ.get('POSE_MAX_PENDING', 4))
+# Photos decoded ahead of the graph (the flexion photo while the standing one is analysed)
+POSE_DECODE_WORKERS = int(os.environ.get('POSE_DECODE_WORKERS', 2))
+
+decode_executor = shared_executor('pose-decode', POSE_DECODE_WORKERS)
+
+# Routes live on a blueprint so combined_service.py can mount them beside the OCR service
+pose_bp = Blueprint('pose', __name__)
+
 # ============================================================
 # MediaPipe Initialization
 # ============================================================
@@ -38,6 +52,10 @@ print("MediaPipe Pose Service for Low Back Pain Assessment")
 print("=" * 60)
 print()
 
+# One graph instance: MediaPipe solutions must not process two frames at once,
+# so pose requests queue here independently of any other work in the process
+pose_lock = threading.Lock()
+
 try:
     mp_pose = mp.solutions.pose
     mp_drawing = mp.solutions.drawing_utils
@@ -58,8 +76,9 @@ try:
     print("    - 33 landmarks per person")
     print()
 except Exception as e:
+    # Raised rather than exiting so combined_service.py can start without pose
     print(f"[ERROR] Failed to initialize MediaPipe Pose: {str(e)}")
-    sys.exit(1)
+    raise RuntimeError(f"MediaPipe Pose initialization failed: {e}") from e
 
 # ============================================================
 # Landmark Index Reference (MediaPipe Pose - 33 landmarks)
@@ -111,27 +130,7 @@ def decode_base64_image(base64_string):
         numpy array: BGR image
     """
     try:
-        # Remove data URI prefix if present
-        if base64_string.startswith('data:image'):
-            base64_string = base64_string.split(',')[1]
-
-        # Decode base64
-        image_bytes = base64.b64decode(base64_string)
-
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(image_bytes))
-
-        # Convert to RGB (PIL uses RGB, OpenCV uses BGR)
-        image_rgb = np.array(image)
-
-        # Convert RGB to BGR for OpenCV
-        if len(image_rgb.shape) == 3 and image_rgb.shape[2] == 3:
-            image_bgr = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
-        else:
-            image_bgr = image_rgb
-
-        return image_bgr
-
+        return decode_image_array(decode_base64_payload(base64_string))
     except Exception as e:
         raise ValueError(f"Failed to decode image: {str(e)}")
 
@@ -158,7 +157,8 @@ def process_image(image_bgr):
         height, width, _ = image_rgb.shape
 
         # Process with MediaPipe
-        results = pose_static.process(image_rgb)
+        with pose_lock:
+            results = pose_static.process(image_rgb)
 
         if not results.pose_landmarks:
             return {
@@ -473,6 +473,45 @@ def generate_recommendations(rom_assessment, compensations):
     return "；".join(recommendations)
 
 
+# ============================================================
+# Admission Control
+# ============================================================
+
+# Frames are processed one at a time (pose_lock), so queued requests only hold
+# decoded photos in memory; shed load beyond POSE_MAX_PENDING instead
+pose_pending = 0
+pose_rejected = 0
+pose_avg_seconds = 2.0  # EWMA of request duration, seeded with a rough guess
+pose_pending_lock = threading.Lock()
+
+def pose_admission(view):
+    """
+    Route decorator: answer 429 + Retry-After when too many requests are pending
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        global pose_pending, pose_rejected, pose_avg_seconds
+        with pose_pending_lock:
+            if pose_pending >= POSE_MAX_PENDING:
+                pose_rejected += 1
+                retry_after = max(1, math.ceil(pose_avg_seconds * pose_pending))
+                print(f"[ADMISSION] Rejected pose request (retry after {retry_after}s)")
+                return jsonify({
+                    'success': False,
+                    'error': 'Pose service is busy, retry later',
+                    'retry_after': retry_after
+                }), 429, {'Retry-After': str(retry_after)}
+            pose_pending += 1
+
+        started = time.perf_counter()
+        try:
+            return view(*args, **kwargs)
+        finally:
+            with pose_pending_lock:
+                pose_pending -= 1
+                pose_avg_seconds = 0.8 * pose_avg_seconds + 0.2 * (time.perf_counter() - started)
+    return wrapper
+
 # ============================================================
 # API Endpoints
 # ============================================================
@@ -491,6 +530,11 @@ def health_check():
         'mediapipe_version': mp.__version__,
         'model_complexity': 2,
         'landmarks_count': 33,
+        'queue': {
+            'pending': pose_pending,
+            'max_pending': POSE_MAX_PENDING,
+            'rejected': pose_rejected
+        },
         'endpoints': {
             'health': 'GET /health',
             'analyze': 'POST /pose/analyze-static'
@@ -498,7 +542,8 @@ def health_check():
     })
 
 
-@app.route('/pose/analyze-static', methods=['POST'])
+@pose_bp.route('/pose/analyze-static', methods=['POST'])
+@pose_admission
 def analyze_static_pose():
     """
     Analyze two static posture photos (standing + flexion)
@@ -553,6 +598,9 @@ def analyze_static_pose():
         print(f"[INFO] Standing image size: {len(standing_image_b64)} characters")
         print(f"[INFO] Flexion image size: {len(flexion_image_b64)} characters")
 
+        # The flexion photo decodes on the pool while the standing one is analysed
+        flexion_decode = decode_executor.submit(decode_base64_image, flexion_image_b64)
+
         # Process standing image
         print("[PROCESS] Decoding standing image...")
         standing_img = decode_base64_image(standing_image_b64)
@@ -561,6 +609,7 @@ def analyze_static_pose():
         standing_result = process_image(standing_img)
 
         if not standing_result['success']:
+            flexion_decode.cancel()
             return jsonify({
                 'success': False,
                 'error': f"Standing image analysis failed: {standing_result.get('error')}"
@@ -568,7 +617,7 @@ def analyze_static_pose():
 
         # Process flexion image
         print("[PROCESS] Decoding flexion image...")
-        flexion_img = decode_base64_image(flexion_image_b64)
+        flexion_img = flexion_decode.result()
 
         print("[PROCESS] Analyzing flexion pose...")
         flexion_result = process_image(flexion_img)
@@ -667,6 +716,8 @@ def analyze_static_pose():
 # Main Entry Point
 # ============================================================
 
+app.register_blueprint(pose_bp)
+
 if __name__ == '__main__':
     print("Features:")
     print("  [OK] MediaPipe Pose (33 landmarks)")
@@ -674,6 +725,7 @@ if __name__ == '__main__':
     print("  [OK] Pelvic tilt measurement")
     print("  [OK] ROM calculation")
     print("  [OK] Compensation detection")
+    print(f"  [OK] Load shedding beyond {POSE_MAX_PENDING} pending requests")
     print()
     print("[START] Starting server on http://localhost:5002")
     print("=" * 60)
@@ -8,91 +8,2434 @@ Port: 5001
 Endpoints:
   - GET  /health
   - POST /ocr/process
+  - POST /ocr/batch
+  - GET  /ocr/templates
+  - POST /ocr/templates
+  - DELETE /ocr/templates/<name>
+  - POST /ocr/region
+  - POST /ocr/extract
+  - GET  /metrics
+  - POST /ocr/jobs
+  - GET  /ocr/jobs/<job_id>
 
 Author: Low Back Pain System
 Date: 2025-11-26
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, request, jsonify, make_response, Response
 from flask_cors import CORS
+from collections import OrderedDict, deque
+from concurrent.futures import as_completed
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from itertools import islice
 import pytesseract
 from PIL import Image
 import cv2
 import numpy as np
-import base64
+import hashlib
 import io
+import json
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
 import traceback
+import urllib.parse
+import urllib.request
+import uuid
+
+# Decode helpers and worker pools shared with the pose service. Each service directory
+# carries an identical copy so its Docker build stays self-contained.
+from vision_common import decode_base64_payload, decode_image_array, shared_executor
 
 app = Flask(__name__)
 CORS(app)
 
-# ============================================================
-# Tesseract OCR Initialization
-# ============================================================
+# Routes live on a blueprint so combined_service.py can mount them beside the pose service
+ocr_bp = Blueprint('ocr', __name__)
+
+# Tesseract runs as a subprocess, so a thread pool gives real parallelism
+OCR_MAX_WORKERS = int(os.environ.get('OCR_MAX_WORKERS', os.cpu_count() or 2))
+OCR_MAX_BATCH_SIZE = int(os.environ.get('OCR_MAX_BATCH_SIZE', 50))
+
+ocr_executor = shared_executor('ocr', OCR_MAX_WORKERS)
+
+# Result cache: set OCR_CACHE_MAX_ENTRIES=0 to disable, OCR_CACHE_DIR to add a disk tier
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', 256))
+OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+OCR_CACHE_DIR = os.environ.get('OCR_CACHE_DIR', '')
+
+# Pages above OCR_TILE_MAX_PIXELS are processed as overlapping grayscale strips
+OCR_TILE_MAX_PIXELS = int(os.environ.get('OCR_TILE_MAX_PIXELS', 12_000_000))
+OCR_TILE_HEIGHT = int(os.environ.get('OCR_TILE_HEIGHT', 2048))
+OCR_TILE_OVERLAP = int(os.environ.get('OCR_TILE_OVERLAP', 160))  # must exceed one text line
+OCR_TILE_WORKERS = int(os.environ.get('OCR_TILE_WORKERS', 1))  # strips in flight per page
+OCR_STREAM_STRIP_HEIGHT = int(os.environ.get('OCR_STREAM_STRIP_HEIGHT', 800))  # rows per streamed chunk
+
+# Confidence-aware second pass: lines holding words below the threshold are re-read
+OCR_REFINE_THRESHOLD = float(os.environ.get('OCR_REFINE_THRESHOLD', 60))
+OCR_REFINE_MAX_LINES = int(os.environ.get('OCR_REFINE_MAX_LINES', 20))  # per page, lowest confidence first
+OCR_REFINE_TARGET_HEIGHT = int(os.environ.get('OCR_REFINE_TARGET_HEIGHT', 48))  # line height to upscale to
+
+# Language auto-detection ("languages": "auto" or "auto_languages": true)
+AUTO_LANGUAGE_CANDIDATES = ['chi_sim', 'chi_tra', 'eng']
+OSD_THUMBNAIL_SIZE = int(os.environ.get('OCR_OSD_THUMBNAIL_SIZE', 1200))
+OSD_MIN_SCRIPT_CONFIDENCE = float(os.environ.get('OCR_OSD_MIN_SCRIPT_CONFIDENCE', 1.0))
+# OSD reports "Han" for both simplified and traditional text
+OCR_HAN_LANGUAGE = os.environ.get('OCR_HAN_LANGUAGE', 'chi_sim')
+
+# Orientation/skew normalisation before recognition: off unless requested ("orient": true)
+# or enabled service-wide
+OCR_ORIENT_DEFAULT = os.environ.get('OCR_ORIENT_DEFAULT', 'false').lower() == 'true'
+OCR_ORIENT_MIN_CONFIDENCE = float(os.environ.get('OCR_ORIENT_MIN_CONFIDENCE', 2.0))
+OCR_DESKEW_MAX_ANGLE = float(os.environ.get('OCR_DESKEW_MAX_ANGLE', 10.0))
+OCR_DESKEW_MIN_ANGLE = 0.3  # below this a rotation costs more accuracy than it gains
+
+# Telemetry: callers tag requests (e.g. by clinic) with X-OCR-Source or "source"
+OCR_METRICS_MAX_SOURCES = int(os.environ.get('OCR_METRICS_MAX_SOURCES', 50))
+
+# Admission control: bound in-flight requests and the request bytes they hold
+OCR_MAX_INFLIGHT = int(os.environ.get('OCR_MAX_INFLIGHT', OCR_MAX_WORKERS * 2))
+OCR_MAX_INFLIGHT_BYTES = int(os.environ.get('OCR_MAX_INFLIGHT_BYTES', 256 * 1024 * 1024))
+OCR_INTERACTIVE_RESERVED = int(os.environ.get('OCR_INTERACTIVE_RESERVED', max(1, OCR_MAX_INFLIGHT // 4)))
+OCR_ADMISSION_WAIT_SECONDS = float(os.environ.get('OCR_ADMISSION_WAIT_SECONDS', 2.0))  # interactive only
+
+# Asynchronous jobs are queued in a local SQLite file so they survive restarts
+# (point OCR_JOB_DB at a persistent volume in production; created on first use)
+OCR_JOB_DB = os.environ.get('OCR_JOB_DB', os.path.join(tempfile.gettempdir(), 'ocr-service', 'ocr_jobs.db'))
+OCR_JOB_WORKERS = int(os.environ.get('OCR_JOB_WORKERS', 1))  # jobs in flight; pages use the OCR pool
+OCR_JOB_MAX_QUEUED = int(os.environ.get('OCR_JOB_MAX_QUEUED', 100))
+OCR_JOB_MAX_RETAINED = int(os.environ.get('OCR_JOB_MAX_RETAINED', 500))
+OCR_JOB_RETENTION_SECONDS = int(os.environ.get('OCR_JOB_RETENTION_SECONDS', 24 * 3600))
+OCR_JOB_CALLBACK_RETRIES = int(os.environ.get('OCR_JOB_CALLBACK_RETRIES', 3))
+# Hosts (host or host:port, comma-separated) job results may be POSTed to; empty disables callbacks
+OCR_JOB_CALLBACK_HOSTS = {
+    host.strip().lower() for host in os.environ.get('OCR_JOB_CALLBACK_HOSTS', '').split(',') if host.strip()
+}
+
+# Registered form layouts are kept in memory; set OCR_TEMPLATE_FILE to persist them
+OCR_TEMPLATE_FILE = os.environ.get('OCR_TEMPLATE_FILE', '')
+
+# ============================================================
+# Tesseract OCR Initialization
+# ============================================================
+
+print("=" * 60)
+print("Tesseract OCR Service for Medical System")
+print("=" * 60)
+print()
+print("Features:")
+print("  [OK] Chinese (Simplified & Traditional) text recognition")
+print("  [OK] English text recognition")
+print("  [OK] Image preprocessing for better accuracy")
+print("  [OK] Confidence filtering")
+print("  [OK] Base64 image support")
+print("  [OK] Result cache (image hash + languages + preprocess)")
+print("  [OK] Language auto-detection (OSD script pre-pass)")
+print("  [OK] Structured medical field extraction")
+print("  [OK] Memory-bounded tiled OCR for large scans")
+print("  [OK] Latency and quality telemetry (/metrics)")
+print("  [OK] Asynchronous OCR jobs with progress and callbacks")
+print("  [OK] Orientation and skew normalisation")
+print("  [OK] Streaming line-by-line results (NDJSON / SSE)")
+print("  [OK] Admission control (429 + Retry-After, interactive before batch)")
+print("  [OK] Selective re-OCR of low-confidence lines")
+print()
+print("API Endpoints:")
+print("  GET  /health              - Health check")
+print("  POST /ocr/process         - Process single image (\"stream\" for live lines)")
+print("  POST /ocr/batch           - Process multiple images concurrently")
+print("  GET  /ocr/templates       - List registered form layouts")
+print("  POST /ocr/templates       - Register form layout (field -> box)")
+print("  POST /ocr/region          - OCR only the fields of a form layout")
+print("  POST /ocr/extract         - Extract patient fields from OCR output")
+print("  GET  /metrics             - Prometheus metrics (?format=json)")
+print("  POST /ocr/jobs            - Queue a multi-page OCR job")
+print("  GET  /ocr/jobs/<id>       - Job status, progress and results")
+print()
+print("=" * 60)
+
+# Test Tesseract installation
+try:
+    tesseract_version = pytesseract.get_tesseract_version()
+    print(f"Tesseract version: {tesseract_version}")
+    print("[OK] Tesseract OCR initialized successfully")
+except Exception as e:
+    print(f"[ERROR] Tesseract initialization failed: {e}")
+
+print("=" * 60)
+print()
+
+# ============================================================
+# Helper Functions
+# ============================================================
+
+def preprocess_image(image):
+    """
+    Preprocess image for better OCR accuracy
+
+    The OCR path hands in 8-bit grayscale straight from decode_image_gray;
+    RGB input (direct run_ocr callers) is converted first.
+    """
+    gray = np.asarray(image)
+    if gray.ndim == 3:
+        gray = cv2.cvtColor(gray, cv2.COLOR_RGB2GRAY)
+
+    # Apply thresholding
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    # Denoise
+    denoised = cv2.fastNlMeansDenoising(binary, None, 10, 7, 21)
+
+    return Image.fromarray(denoised)
+
+def decode_base64_image(base64_string):
+    """
+    Decode base64 string to PIL Image
+    """
+    return decode_image_bytes(decode_base64_payload(base64_string))
+
+def decode_image_bytes(image_data):
+    """
+    Decode raw image bytes (e.g. a multipart upload) to PIL Image
+    """
+    image = Image.open(io.BytesIO(image_data))
+
+    # Convert to RGB if needed
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    return image
+
+def decode_image_gray(image_data):
+    """
+    Decode raw image bytes to an 8-bit grayscale ('L') PIL Image
+    """
+    return Image.fromarray(decode_image_array(image_data, grayscale=True))
+
+def recognize_image(image, languages, preprocess=True, timings=None):
+    """
+    Run the Tesseract pipeline on a decoded image without confidence filtering
+
+    Args:
+        image: PIL Image
+        languages: List of Tesseract language codes
+        preprocess: Apply grayscale/threshold/denoise before recognition
+        timings: Optional dict to accumulate stage durations into
+
+    Returns:
+        dict: {text, details} with every recognised word
+    """
+    # Preprocess if requested
+    if preprocess:
+        with timed(timings, 'preprocess'):
+            image = preprocess_image(image)
+
+    with timed(timings, 'recognize'):
+        return recognize_preprocessed(image, languages)
+
+def recognize_preprocessed(image, languages):
+    """
+    Tesseract word boxes and full text for an already preprocessed image
+    """
+    # Configure Tesseract
+    lang_string = '+'.join(languages)
+    custom_config = r'--oem 3 --psm 6'  # LSTM OCR Engine, Assume uniform block of text
+
+    # Get detailed OCR data
+    ocr_data = pytesseract.image_to_data(
+        image,
+        lang=lang_string,
+        config=custom_config,
+        output_type=pytesseract.Output.DICT
+    )
+
+    details = []
+
+    n_boxes = len(ocr_data['text'])
+    for i in range(n_boxes):
+        text = ocr_data['text'][i].strip()
+
+        if text:
+            details.append({
+                'text': text,
+                'confidence': float(ocr_data['conf'][i]),
+                'box': [
+                    int(ocr_data['left'][i]),
+                    int(ocr_data['top'][i]),
+                    int(ocr_data['width'][i]),
+                    int(ocr_data['height'][i])
+                ]
+            })
+
+    # Get simple text extraction as fallback
+    simple_text = pytesseract.image_to_string(
+        image,
+        lang=lang_string,
+        config=custom_config
+    ).strip()
+
+    return {'text': simple_text, 'details': details}
+
+def filter_ocr_result(raw, languages, min_confidence=0):
+    """
+    Build the API result from a raw recognition, applying min_confidence
+
+    Returns:
+        dict: {text, details, word_count, languages_used}
+        plus image_info, and orientation / language_detection / tiles /
+        refinement when those stages ran
+    """
+    details = [d for d in raw['details'] if d['confidence'] >= min_confidence]
+
+    result = {
+        'text': raw['text'] if raw['text'] else ' '.join(d['text'] for d in details),
+        'details': details,
+        'word_count': len(details),
+        'languages_used': raw.get('languages', languages)
+    }
+    for key in ('image_info', 'orientation', 'language_detection', 'tiles', 'refinement'):
+        if key in raw:
+            result[key] = raw[key]
+    return result
+
+def run_ocr(image, languages, preprocess=True, min_confidence=0):
+    """
+    Recognise a decoded image and filter words by min_confidence
+    """
+    raw = recognize_image(image, languages, preprocess)
+    return filter_ocr_result(raw, languages, min_confidence)
+
+def ocr_image_bytes(image_data, languages, preprocess=True, min_confidence=0, use_cache=True,
+                    auto_languages=False, tiled=None, orient=None, refine=False,
+                    refine_threshold=OCR_REFINE_THRESHOLD, timings=None):
+    """
+    OCR raw image bytes, serving repeated uploads from the result cache
+
+    The cache holds the unfiltered recognition, so callers asking for a
+    different min_confidence still hit it. With auto_languages, languages is
+    the candidate set and the detected subset is cached with the result.
+    tiled=None tiles only pages larger than OCR_TILE_MAX_PIXELS. Pages are
+    rotated/deskewed first when orient is true (default OCR_ORIENT_DEFAULT,
+    off). With refine, lines holding words below refine_threshold get a
+    second, line-level pass.
+    Stage durations are accumulated into timings when given.
+
+    Returns:
+        dict: filter_ocr_result output plus a 'cached' flag
+    """
+    if orient is None:
+        orient = OCR_ORIENT_DEFAULT
+    digest = hashlib.sha256(image_data).hexdigest()
+
+    cache_key = None
+    if use_cache and ocr_cache.enabled:
+        key_languages = ['auto'] + languages if auto_languages else languages
+        variant = ('' if tiled is None else ('tiled' if tiled else 'full')) + (':orient' if orient else '')
+        if refine:
+            variant += f':refine{refine_threshold:g}'
+        cache_key = ocr_cache.make_key(digest, key_languages, preprocess, variant)
+        raw = ocr_cache.get(cache_key)
+        if raw is not None:
+            return {**filter_ocr_result(raw, languages, min_confidence), 'cached': True}
+
+    with timed(timings, 'decode'):
+        # Image.open only parses the header, so the size check is free
+        image = Image.open(io.BytesIO(image_data))
+        if tiled is None:
+            tiled = image.width * image.height > OCR_TILE_MAX_PIXELS
+
+        # Preprocessed and tiled pages only ever need one channel, so decode
+        # straight to 8-bit grayscale (a third of RGB, no cvtColor later)
+        image = decode_image_gray(image_data) if tiled or preprocess else decode_image_bytes(image_data)
+        source_size = image.size
+
+    osd = None
+    orientation = None
+    if orient:
+        with timed(timings, 'orient'):
+            image, orientation, osd = normalize_orientation(image, digest)
+    image_info = page_image_info(source_size, image, orientation)
+
+    detection = None
+    if auto_languages:
+        with timed(timings, 'detect'):
+            languages_used, detection = detect_languages(image, languages, osd)
+    else:
+        languages_used = languages
+
+    if tiled:
+        gray = np.array(image)
+        image = None  # release the PIL copy before strips are processed
+        raw = recognize_tiled(gray, languages_used, preprocess, timings)
+    else:
+        raw = recognize_image(image, languages_used, preprocess, timings)
+
+    if refine:
+        if not tiled:
+            gray = np.array(image if image.mode == 'L' else image.convert('L'))
+        raw['details'], raw['refinement'] = refine_low_confidence(
+            gray, raw['details'], languages_used, refine_threshold, timings
+        )
+        if raw['refinement']['improved']:
+            raw['text'] = '\n'.join(line['text'] for line in group_lines(raw['details']))
+
+    raw['image_info'] = image_info
+    if orientation is not None:
+        raw['orientation'] = orientation
+    if detection is not None:
+        raw['languages'] = languages_used
+        raw['language_detection'] = detection
+
+    if cache_key is not None:
+        ocr_cache.put(cache_key, raw)
+
+    return {**filter_ocr_result(raw, languages, min_confidence), 'cached': False}
+
+def parse_ocr_options(data):
+    """
+    Recognition options shared by /ocr/process and /ocr/batch
+
+    Returns:
+        dict: keyword arguments for ocr_image_bytes
+    """
+    languages, auto_languages = normalize_languages(
+        data.get('languages', ['chi_sim', 'eng']),
+        data.get('auto_languages', False)
+    )
+    return {
+        'languages': languages,
+        'auto_languages': auto_languages,
+        'preprocess': data.get('preprocess', True),
+        'min_confidence': data.get('min_confidence', 0),
+        'use_cache': data.get('cache', True),
+        'tiled': data.get('tiled'),
+        'orient': data.get('orient'),
+        'refine': data.get('refine', False),
+        'refine_threshold': float(data.get('refine_threshold', OCR_REFINE_THRESHOLD))
+    }
+
+def run_batch_item(index, name, image_source, ocr_options, source='unknown', include_timings=False,
+                   endpoint='batch'):
+    """
+    OCR one batch item, capturing failures instead of raising
+
+    image_source is either a base64 string or raw bytes from a multipart upload.
+    """
+    timings = {}
+    started = time.perf_counter()
+    try:
+        with timed(timings, 'decode'):
+            if isinstance(image_source, bytes):
+                image_data = image_source
+            else:
+                image_data = decode_base64_payload(image_source)
+
+        result = ocr_image_bytes(image_data, **ocr_options, timings=timings)
+        timings['total'] = time.perf_counter() - started
+        ocr_metrics.record(endpoint, source, True, timings, result)
+
+        item = {'index': index, 'name': name, 'success': True, **result}
+        if include_timings:
+            item['timings'] = timings_ms(timings)
+        return item
+
+    except Exception as e:
+        timings['total'] = time.perf_counter() - started
+        ocr_metrics.record(endpoint, source, False, timings)
+        print(f"[ERROR] Batch item {index} ({name}) failed: {e}")
+        return {'index': index, 'name': name, 'success': False, 'error': str(e)}
+
+def parse_batch_request():
+    """
+    Collect batch items and options from a JSON or multipart request
+
+    Returns:
+        tuple: (items, ocr_options, request_options) where items is a list
+        of (name, image_source) and request_options holds stream/timings
+    """
+    if request.files:
+        # Multipart: every uploaded file is an item, options come from form fields
+        items = [
+            (f.filename or f'image_{i}', f.read())
+            for i, f in enumerate(request.files.getlist('images') or request.files.values())
+        ]
+        form = request.form
+        tiled = form.get('tiled')
+        orient = form.get('orient')
+        data = {
+            'languages': form.get('languages', 'chi_sim+eng'),
+            'auto_languages': form.get('auto_languages', 'false').lower() == 'true',
+            'preprocess': form.get('preprocess', 'true').lower() != 'false',
+            'min_confidence': float(form.get('min_confidence', 0)),
+            'cache': form.get('cache', 'true').lower() != 'false',
+            'tiled': None if tiled is None else tiled.lower() == 'true',
+            'orient': None if orient is None else orient.lower() == 'true',
+            'refine': form.get('refine', 'false').lower() == 'true',
+            'refine_threshold': form.get('refine_threshold', OCR_REFINE_THRESHOLD)
+        }
+        request_options = {
+            'stream': form.get('stream', 'false').lower() == 'true',
+            'timings': form.get('timings', 'false').lower() == 'true'
+        }
+        return items, parse_ocr_options(data), request_options
+
+    data = request.get_json(silent=True) or {}
+    items = []
+    for i, entry in enumerate(data.get('images', [])):
+        # Accept bare base64 strings or {"name": ..., "image": ...} objects
+        if isinstance(entry, dict):
+            items.append((entry.get('name', f'image_{i}'), entry.get('image', '')))
+        else:
+            items.append((f'image_{i}', entry))
+
+    request_options = {
+        'stream': data.get('stream', False),
+        'timings': data.get('timings', False)
+    }
+    return items, parse_ocr_options(data), request_options
+
+# ============================================================
+# Tiled OCR (Large Scans)
+# ============================================================
+
+tile_executor = shared_executor('ocr-tile', OCR_TILE_WORKERS)
+
+def page_threshold(gray):
+    """
+    Otsu threshold computed once on a thumbnail so every strip binarises alike
+    """
+    scale = min(1.0, 1024 / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+    threshold, _ = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return threshold
+
+def plan_strips(height, width, strip_height=OCR_TILE_HEIGHT):
+    """
+    Split a page into overlapping full-width strips
+
+    Each strip owns the rows between the midpoints of its overlaps, so a word
+    seen in two strips is kept exactly once (by its vertical centre).
+
+    Returns:
+        list of (start, end, own_top, own_bottom) row ranges
+    """
+    strip_height = min(strip_height, max(OCR_TILE_MAX_PIXELS // max(width, 1), 1))
+    strip_height = max(strip_height, OCR_TILE_OVERLAP * 2)
+    step = strip_height - OCR_TILE_OVERLAP
+
+    strips = []
+    start = 0
+    while True:
+        end = min(start + strip_height, height)
+        last = end >= height
+        own_top = 0 if start == 0 else start + OCR_TILE_OVERLAP // 2
+        own_bottom = height if last else end - OCR_TILE_OVERLAP // 2
+        strips.append((start, end, own_top, own_bottom))
+        if last:
+            return strips
+        start += step
+
+def recognize_strip(gray, strip, threshold, languages, preprocess, timings=None):
+    """
+    Preprocess and OCR one strip, returning words in page coordinates
+    """
+    start, end, own_top, own_bottom = strip
+    tile = gray[start:end]
+
+    if preprocess:
+        with timed(timings, 'preprocess'):
+            _, tile = cv2.threshold(tile, threshold, 255, cv2.THRESH_BINARY)
+            tile = cv2.fastNlMeansDenoising(tile, None, 10, 7, 21)
+
+    with timed(timings, 'recognize'):
+        ocr_data = pytesseract.image_to_data(
+            Image.fromarray(tile),
+            lang='+'.join(languages),
+            config=r'--oem 3 --psm 6',
+            output_type=pytesseract.Output.DICT
+        )
+
+    words = []
+    for i in range(len(ocr_data['text'])):
+        text = ocr_data['text'][i].strip()
+        if not text:
+            continue
+        top = int(ocr_data['top'][i]) + start
+        height = int(ocr_data['height'][i])
+        if not own_top <= top + height / 2 < own_bottom:
+            continue  # the neighbouring strip owns this word
+        words.append({
+            'text': text,
+            'confidence': float(ocr_data['conf'][i]),
+            'box': [int(ocr_data['left'][i]), top, int(ocr_data['width'][i]), height]
+        })
+    return words
+
+def iter_strip_words(gray, strips, threshold, languages, preprocess, strip_timings):
+    """
+    Recognise strips in page order, yielding each strip's words when ready
+
+    With OCR_TILE_WORKERS <= 1 strips run inline in the caller's thread.
+    Otherwise at most OCR_TILE_WORKERS strips of this page are queued on
+    tile_executor at a time, so concurrent streams take turns on the pool
+    instead of one page queueing all of its strips ahead of the others.
+    Strips not yet started are cancelled when the consumer stops early.
+    """
+    jobs = zip(strips, strip_timings)
+    if OCR_TILE_WORKERS <= 1:
+        for strip, st in jobs:
+            yield recognize_strip(gray, strip, threshold, languages, preprocess, st)
+        return
+
+    def submit(count):
+        for strip, st in islice(jobs, count):
+            pending.append(tile_executor.submit(recognize_strip, gray, strip, threshold, languages, preprocess, st))
+
+    pending = deque()
+    try:
+        submit(OCR_TILE_WORKERS)
+        while pending:
+            words = pending.popleft().result()
+            submit(1)  # keep the window full while this strip is sent
+            yield words
+    finally:
+        for future in pending:
+            future.cancel()
+
+def recognize_tiled(gray, languages, preprocess=True, timings=None):
+    """
+    OCR a large grayscale page strip by strip in bounded memory
+
+    Only one strip (per tile worker) plus its preprocessed copies exists at
+    a time; the full page is held once as 8-bit grayscale. Stage timings
+    are summed over strips (CPU time, not wall time, when run in parallel).
+
+    Returns:
+        dict: {text, details, tiles} like recognize_image
+    """
+    height, width = gray.shape[:2]
+    strips = plan_strips(height, width)
+    with timed(timings, 'preprocess'):
+        threshold = page_threshold(gray) if preprocess else None
+
+    print(f"[TILE] {width}x{height} page -> {len(strips)} strips")
+
+    strip_timings = [{} for _ in strips]
+    if OCR_TILE_WORKERS > 1:
+        futures = [
+            tile_executor.submit(recognize_strip, gray, strip, threshold, languages, preprocess, st)
+            for strip, st in zip(strips, strip_timings)
+        ]
+        strip_words = [future.result() for future in futures]
+    else:
+        strip_words = [
+            recognize_strip(gray, strip, threshold, languages, preprocess, st)
+            for strip, st in zip(strips, strip_timings)
+        ]
+
+    if timings is not None:
+        for st in strip_timings:
+            for stage, seconds in st.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+
+    details = [word for words in strip_words for word in words]
+    text = '\n'.join(line['text'] for line in group_lines(details))
+
+    return {'text': text, 'details': details, 'tiles': len(strips)}
+
+# ============================================================
+# Confidence-Aware Refinement
+# ============================================================
+
+def mean_confidence(words):
+    """
+    Mean Tesseract confidence of words, ignoring non-text boxes (-1)
+    """
+    confidences = [w['confidence'] for w in words if w['confidence'] >= 0]
+    return sum(confidences) / len(confidences) if confidences else -1.0
+
+def refine_line(gray, line, languages):
+    """
+    Re-read one line crop: upscaled, adaptively binarised, as a single text line
+
+    Adaptive thresholding copes with shadows and faint print that the page's
+    global Otsu threshold loses; PSM 7 stops Tesseract from re-segmenting.
+
+    Returns:
+        list of words in page coordinates
+    """
+    xs = [w['box'][0] for w in line['words']]
+    ys = [w['box'][1] for w in line['words']]
+    x_ends = [w['box'][0] + w['box'][2] for w in line['words']]
+    y_ends = [w['box'][1] + w['box'][3] for w in line['words']]
+    line_height = max(max(y_ends) - min(ys), 1)
+
+    pad = max(4, line_height // 4)
+    height, width = gray.shape[:2]
+    x0, y0 = max(0, min(xs) - pad), max(0, min(ys) - pad)
+    x1, y1 = min(width, max(x_ends) + pad), min(height, max(y_ends) + pad)
+    crop = gray[y0:y1, x0:x1]
+    if crop.size == 0:
+        return []
+
+    scale = min(max(OCR_REFINE_TARGET_HEIGHT / line_height, 1.0), 4.0)
+    if scale > 1.0:
+        crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+    block = max(15, int(line_height * scale) // 2 * 2 + 1)
+    crop = cv2.adaptiveThreshold(crop, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, 10)
+
+    ocr_data = pytesseract.image_to_data(
+        Image.fromarray(crop),
+        lang='+'.join(languages),
+        config=r'--oem 3 --psm 7',
+        output_type=pytesseract.Output.DICT
+    )
+
+    words = []
+    for i in range(len(ocr_data['text'])):
+        text = ocr_data['text'][i].strip()
+        if not text:
+            continue
+        words.append({
+            'text': text,
+            'confidence': float(ocr_data['conf'][i]),
+            'box': [
+                int(ocr_data['left'][i] / scale) + x0,
+                int(ocr_data['top'][i] / scale) + y0,
+                int(ocr_data['width'][i] / scale),
+                int(ocr_data['height'][i] / scale)
+            ]
+        })
+    return words
+
+def refine_low_confidence(gray, details, languages, threshold=OCR_REFINE_THRESHOLD, timings=None):
+    """
+    Second pass over only the lines that hold low-confidence words
+
+    Up to OCR_REFINE_MAX_LINES such lines (lowest confidence first) are
+    re-read with refine_line. A line's words are replaced only when the
+    re-read scores a higher mean confidence; replacements keep the
+    original reading-order position.
+
+    Args:
+        gray: Grayscale page as a numpy array (the same page the boxes refer to)
+        details: Word list from the first pass
+        threshold: Words below this confidence mark their line for refinement
+
+    Returns:
+        tuple: (details, {threshold, candidates, improved})
+    """
+    lines = group_lines(details)
+    candidates = [line for line in lines if any(0 <= w['confidence'] < threshold for w in line['words'])]
+    candidates = sorted(candidates, key=lambda line: mean_confidence(line['words']))[:OCR_REFINE_MAX_LINES]
+    stats = {'threshold': threshold, 'candidates': len(candidates), 'improved': 0}
+    if not candidates:
+        return details, stats
+
+    with timed(timings, 'refine'):
+        if OCR_TILE_WORKERS > 1:
+            reread = list(tile_executor.map(lambda line: refine_line(gray, line, languages), candidates))
+        else:
+            reread = [refine_line(gray, line, languages) for line in candidates]
+
+    owner = {}  # id(first-pass word) -> index of the candidate line replacing it
+    for index, (line, words) in enumerate(zip(candidates, reread)):
+        if words and mean_confidence(words) > mean_confidence(line['words']):
+            stats['improved'] += 1
+            for word in line['words']:
+                owner[id(word)] = index
+
+    if not owner:
+        return details, stats
+
+    refined, emitted = [], set()
+    for word in details:
+        index = owner.get(id(word))
+        if index is None:
+            refined.append(word)
+        elif index not in emitted:
+            emitted.add(index)
+            refined.extend(reread[index])
+
+    print(f"[REFINE] {stats['improved']}/{stats['candidates']} low-confidence lines improved")
+    return refined, stats
+
+# ============================================================
+# Streaming OCR
+# ============================================================
+
+def stream_line(line):
+    """
+    Wire format of one grouped line: text, mean confidence, union box, words
+    """
+    xs = [w['box'][0] for w in line['words']]
+    ys = [w['box'][1] for w in line['words']]
+    x_ends = [w['box'][0] + w['box'][2] for w in line['words']]
+    y_ends = [w['box'][1] + w['box'][3] for w in line['words']]
+    return {
+        'text': line['text'],
+        'confidence': round(sum(w['confidence'] for w in line['words']) / len(line['words']), 2),
+        'box': [min(xs), min(ys), max(x_ends) - min(xs), max(y_ends) - min(ys)],
+        'words': line['words']
+    }
+
+def stream_ocr_events(image_data, languages, preprocess=True, min_confidence=0, use_cache=True,
+                      auto_languages=False, tiled=None, orient=None, refine=False,
+                      refine_threshold=OCR_REFINE_THRESHOLD, extract=False, timings=None, summary=None):
+    """
+    OCR a page top to bottom, yielding recognised lines as each strip finishes
+
+    The page is cut into OCR_STREAM_STRIP_HEIGHT strips (with the tiled
+    overlap/ownership rules) and strips are emitted in reading order, so a
+    client can fill the top of a form while the rest is still recognised.
+    The assembled result is cached like ocr_image_bytes; a cache hit is
+    replayed as a single "lines" event. tiled is accepted for option
+    parity but streaming always works in strips. When summary is given it
+    receives the final filter_ocr_result output (for metrics).
+
+    Yields:
+        dict events: start, lines (per strip), then done or error
+    """
+    if orient is None:
+        orient = OCR_ORIENT_DEFAULT
+    digest = hashlib.sha256(image_data).hexdigest()
+
+    cache_key = None
+    raw = None
+    if use_cache and ocr_cache.enabled:
+        key_languages = ['auto'] + languages if auto_languages else languages
+        variant = 'stream' + (':orient' if orient else '') + (f':refine{refine_threshold:g}' if refine else '')
+        cache_key = ocr_cache.make_key(digest, key_languages, preprocess, variant)
+        raw = ocr_cache.get(cache_key)
+
+    cached = raw is not None
+    if cached:
+        result = filter_ocr_result(raw, languages, min_confidence)
+        yield {'event': 'start', 'strips': 1, 'cached': True,
+               **{k: result[k] for k in ('image_info', 'orientation', 'languages_used') if k in result}}
+        yield {'event': 'lines', 'strip': 0, 'lines': [stream_line(l) for l in group_lines(result['details'])]}
+    else:
+        with timed(timings, 'decode'):
+            image = decode_image_gray(image_data)
+            source_size = image.size
+
+        orientation = None
+        osd = None
+        if orient:
+            with timed(timings, 'orient'):
+                image, orientation, osd = normalize_orientation(image, digest)
+        image_info = page_image_info(source_size, image, orientation)
+
+        detection = None
+        languages_used = languages
+        if auto_languages:
+            with timed(timings, 'detect'):
+                languages_used, detection = detect_languages(image, languages, osd)
+
+        gray = np.array(image)
+        image = None
+        height, width = gray.shape[:2]
+        strips = plan_strips(height, width, OCR_STREAM_STRIP_HEIGHT)
+        with timed(timings, 'preprocess'):
+            threshold = page_threshold(gray) if preprocess else None
+
+        start_event = {'event': 'start', 'strips': len(strips), 'cached': False,
+                       'image_info': image_info, 'languages_used': languages_used}
+        if orientation is not None:
+            start_event['orientation'] = orientation
+        yield start_event
+
+        strip_timings = [{} for _ in strips]
+        strip_words = iter_strip_words(gray, strips, threshold, languages_used, preprocess, strip_timings)
+        details = []
+        refinement = {'threshold': refine_threshold, 'candidates': 0, 'improved': 0}
+        try:
+            for index, words in enumerate(strip_words):
+                if refine:
+                    words, strip_refinement = refine_low_confidence(
+                        gray, words, languages_used, refine_threshold, timings
+                    )
+                    refinement['candidates'] += strip_refinement['candidates']
+                    refinement['improved'] += strip_refinement['improved']
+                details.extend(words)
+                kept = [w for w in words if w['confidence'] >= min_confidence]
+                yield {'event': 'lines', 'strip': index, 'lines': [stream_line(l) for l in group_lines(kept)]}
+        finally:
+            # The client may disconnect mid-page; do not OCR strips nobody reads
+            strip_words.close()
+
+        if timings is not None:
+            for st in strip_timings:
+                for stage, seconds in st.items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+
+        raw = {
+            'text': '\n'.join(line['text'] for line in group_lines(details)),
+            'details': details,
+            'tiles': len(strips),
+            'image_info': image_info
+        }
+        if orientation is not None:
+            raw['orientation'] = orientation
+        if detection is not None:
+            raw['languages'] = languages_used
+            raw['language_detection'] = detection
+        if refine:
+            raw['refinement'] = refinement
+        if cache_key is not None:
+            ocr_cache.put(cache_key, raw)
+        result = filter_ocr_result(raw, languages, min_confidence)
+
+    done = {
+        'event': 'done',
+        'success': True,
+        'text': result['text'],
+        'word_count': result['word_count'],
+        'languages_used': result['languages_used'],
+        'cached': cached
+    }
+    if 'refinement' in result:
+        done['refinement'] = result['refinement']
+    if extract:
+        with timed(timings, 'postprocess'):
+            done['medical_data'] = extract_medical_fields(result['details'])
+    if summary is not None:
+        summary.update(result, cached=cached)
+    yield done
+
+def format_stream_event(event, sse):
+    """
+    Serialise a stream event as one NDJSON line or one SSE message
+    """
+    payload = json.dumps(event, ensure_ascii=False)
+    if sse:
+        return f"event: {event['event']}\ndata: {payload}\n\n"
+    return payload + '\n'
+
+# ============================================================
+# Orientation and Skew Normalisation
+# ============================================================
+
+# OSD "rotate" is the clockwise correction; PIL transposes are counter-clockwise
+ROTATE_TRANSPOSE = {
+    90: Image.Transpose.ROTATE_270,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_90
+}
+
+orientation_cache = OrderedDict()  # image digest -> {'rotate', 'skew'}
+orientation_cache_lock = threading.Lock()
+ORIENTATION_CACHE_SIZE = 1024
+
+def estimate_skew(thumbnail):
+    """
+    Small-angle skew by projection profile: the correction angle that makes
+    text rows sharpest (maximum variance of row ink sums)
+
+    Args:
+        thumbnail: Grayscale PIL Image, already upright
+
+    Returns:
+        float: counter-clockwise correction in degrees
+    """
+    gray = np.array(thumbnail)
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if ink.sum() == 0:
+        return 0.0
+
+    height, width = ink.shape
+    center = (width / 2, height / 2)
+
+    def score(angle):
+        matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+        rotated = cv2.warpAffine(ink, matrix, (width, height), flags=cv2.INTER_NEAREST)
+        return float(np.var(rotated.sum(axis=1)))
+
+    # Coarse 1 degree sweep, then refine to 0.1 degree around the best angle
+    coarse = np.arange(-OCR_DESKEW_MAX_ANGLE, OCR_DESKEW_MAX_ANGLE + 0.5, 1.0)
+    best = max(coarse, key=score)
+    fine = np.arange(best - 1.0, best + 1.05, 0.1)
+    best = max(fine, key=score)
+    return round(float(best), 2)
+
+def decide_orientation(image):
+    """
+    Run OSD and skew estimation on a thumbnail
+
+    Returns:
+        tuple: (decision {'rotate', 'skew', 'method'}, osd output)
+    """
+    thumbnail = osd_thumbnail(image)
+    osd = run_osd(thumbnail)
+
+    rotate = 0
+    method = 'osd'
+    if 'error' in osd:
+        method = 'skew-only'
+    elif float(osd.get('orientation_conf', 0)) >= OCR_ORIENT_MIN_CONFIDENCE:
+        rotate = int(osd.get('rotate', 0)) % 360
+    else:
+        method = 'low-confidence'
+
+    if rotate in ROTATE_TRANSPOSE:
+        thumbnail = thumbnail.transpose(ROTATE_TRANSPOSE[rotate])
+
+    return {'rotate': rotate, 'skew': estimate_skew(thumbnail), 'method': method}, osd
+
+def normalize_orientation(image, digest):
+    """
+    Rotate a page upright and remove small skew before recognition
+
+    Decisions are cached by image digest, so re-uploads and re-runs with
+    different OCR options skip the OSD and skew passes.
+
+    Returns:
+        tuple: (corrected image, decision dict with 'cached', OSD output or None)
+    """
+    with orientation_cache_lock:
+        decision = orientation_cache.get(digest)
+        if decision is not None:
+            orientation_cache.move_to_end(digest)
+
+    osd = None
+    cached = decision is not None
+    if decision is None:
+        decision, osd = decide_orientation(image)
+        with orientation_cache_lock:
+            orientation_cache[digest] = decision
+            while len(orientation_cache) > ORIENTATION_CACHE_SIZE:
+                orientation_cache.popitem(last=False)
+
+    if decision['rotate'] in ROTATE_TRANSPOSE:
+        image = image.transpose(ROTATE_TRANSPOSE[decision['rotate']])
+
+    if abs(decision['skew']) >= OCR_DESKEW_MIN_ANGLE:
+        fill = 255 if image.mode == 'L' else (255, 255, 255)
+        image = image.rotate(decision['skew'], resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+    return image, {**decision, 'cached': cached}, osd
+
+def page_image_info(source_size, image, orientation):
+    """
+    image_info for a result: the size of the page its word boxes refer to
+
+    Boxes are in the frame of the normalised page. When orientation ran,
+    the uploaded size and the rotation/skew actually applied are reported
+    too, so a client can map boxes back onto the original image (the
+    deskew canvas is expanded around the centre).
+    """
+    info = {'width': image.width, 'height': image.height}
+    if orientation is not None:
+        skew = orientation['skew'] if abs(orientation['skew']) >= OCR_DESKEW_MIN_ANGLE else 0.0
+        info.update({
+            'source_width': source_size[0],
+            'source_height': source_size[1],
+            'rotate': orientation['rotate'] if orientation['rotate'] in ROTATE_TRANSPOSE else 0,
+            'skew': skew
+        })
+    return info
+
+# ============================================================
+# Language Auto-Detection
+# ============================================================
+
+# Tesseract OSD script names -> candidate language models, in preference order
+SCRIPT_LANGUAGES = {
+    'Han': [OCR_HAN_LANGUAGE, 'chi_sim', 'chi_tra'],
+    'Latin': ['eng']
+}
+
+@lru_cache(maxsize=1)
+def get_installed_languages():
+    """
+    Language models installed for Tesseract (queried once per process)
+    """
+    try:
+        return frozenset(pytesseract.get_languages(config=''))
+    except Exception as e:
+        print(f"[WARN] Could not list Tesseract languages: {e}")
+        return frozenset(AUTO_LANGUAGE_CANDIDATES)
+
+def normalize_languages(languages, auto_languages=False):
+    """
+    Resolve the request's languages option
+
+    "auto" (or ["auto"]) selects auto-detection over all supported
+    languages; otherwise languages is used as-is, or as the candidate set
+    when auto_languages is true.
+
+    Returns:
+        tuple: (languages list, auto_languages flag)
+    """
+    if languages == 'auto' or languages == ['auto']:
+        return list(AUTO_LANGUAGE_CANDIDATES), True
+    if isinstance(languages, str):
+        languages = languages.split('+')
+    return list(languages), bool(auto_languages)
+
+def osd_thumbnail(image):
+    """
+    Downscaled grayscale copy of a page for OSD / skew estimation
+    """
+    thumbnail = image.convert('L') if image.mode != 'L' else image.copy()
+    thumbnail.thumbnail((OSD_THUMBNAIL_SIZE, OSD_THUMBNAIL_SIZE))
+    return thumbnail
+
+def run_osd(thumbnail):
+    """
+    Tesseract orientation and script detection
+
+    Returns:
+        dict: OSD output, or {'error': message} when Tesseract finds too little text
+    """
+    try:
+        return pytesseract.image_to_osd(
+            thumbnail,
+            config='--psm 0',
+            output_type=pytesseract.Output.DICT
+        )
+    except Exception as e:
+        return {'error': str(e).strip()}
+
+def detect_languages(image, candidates, osd=None):
+    """
+    Pick the minimal language set for a page with an OSD pass on a thumbnail
+
+    Args:
+        image: PIL Image (full resolution)
+        candidates: Languages the caller allows
+        osd: OSD output already computed for this page (e.g. by orientation)
+
+    Returns:
+        tuple: (languages list, detection info dict)
+    """
+    installed = get_installed_languages()
+    candidates = [lang for lang in candidates if lang in installed] or list(candidates)
+
+    if osd is None:
+        osd = run_osd(osd_thumbnail(image))
+
+    if 'error' in osd:
+        # OSD needs a minimum amount of text; fall back to all candidates
+        return candidates, {'method': 'fallback', 'reason': osd['error'], 'candidates': candidates}
+
+    script = osd.get('script')
+    script_conf = float(osd.get('script_conf', 0))
+    detection = {
+        'method': 'osd',
+        'script': script,
+        'script_confidence': script_conf,
+        'candidates': candidates
+    }
+
+    if script_conf < OSD_MIN_SCRIPT_CONFIDENCE:
+        detection['method'] = 'fallback'
+        detection['reason'] = 'low script confidence'
+        return candidates, detection
+
+    for lang in SCRIPT_LANGUAGES.get(script, []):
+        if lang in candidates:
+            return [lang], detection
+
+    detection['method'] = 'fallback'
+    detection['reason'] = f'no candidate language for script {script}'
+    return candidates, detection
+
+# ============================================================
+# Medical Field Extraction
+# ============================================================
+
+# Labels a name may run into when a form line has no separators ("姓名：张伟性别：男")
+FIELD_LABELS = '姓名|患者|病人|性别|年龄|电话|手机|联系方式|主诉|症状|不适'
+
+# One compiled alternation scanned once per line; group names identify the field.
+# Label-anchored alternatives come first so they win over bare values at the same position.
+# Durations skip dates: no 4-digit years ("2023年") and no month/day parts ("2023年3月5日").
+FIELD_SCANNER = re.compile(
+    r'(?:姓名[：:]?|(?:患者|病人)[：:])\s*'
+    rf'(?P<name>[一-鿿]{{2,4}}?(?={FIELD_LABELS}|[^一-鿿]|$)|[一-鿿]{{2,4}})'
+    r'|性别[：:]?\s*(?P<gender>[男女])'
+    r'|年龄[：:]?\s*(?P<age>\d{1,3})'
+    r'|(?:电话|手机|联系方式)[：:]?\s*(?P<phone>1[3-9]\d{9})'
+    r'|(?:主诉|症状|不适)[：:]\s*(?P<chief_complaint>[^。！？]+)'
+    r'|(?P<age_suffix>\d{1,3})\s*岁'
+    r'|(?P<phone_bare>1[3-9]\d{9})'
+    r'|(?P<pain_nature>钝痛|刺痛|胀痛|酸痛|灼痛|绞痛|放射痛)'
+    r'|(?<![\d年])(?P<duration>\d{1,3})\s*(?P<duration_unit>个?月|周|天|年)(?![\d日号])'
+)
+
+# Labels printed with their value on the next line (common on boxed intake forms)
+BARE_LABEL = re.compile(r'(?P<label>姓名|性别|年龄|电话|主诉)[：:]?\s*$')
+BARE_LABEL_FIELDS = {'姓名': 'name', '性别': 'gender', '年龄': 'age', '电话': 'phone', '主诉': 'chief_complaint'}
+VALUE_PATTERNS = {
+    'name': re.compile(r'[一-鿿]{2,4}'),
+    'gender': re.compile(r'[男女]'),
+    'age': re.compile(r'\d{1,3}'),
+    'phone': re.compile(r'1[3-9]\d{9}'),
+    'chief_complaint': re.compile(r'[^。！？]+')
+}
+
+PAIN_LOCATIONS = [('腰', '腰部'), ('臀', '臀部'), ('下肢', '下肢'), ('腿', '下肢'), ('颈', '颈部')]
+
+# How much a match is trusted depending on how it was anchored
+ANCHOR_WEIGHTS = {'label': 1.0, 'label_below': 0.9, 'bare': 0.6, 'keyword': 0.8}
+
+def group_lines(details):
+    """
+    Cluster word boxes into reading-order lines by vertical overlap
+
+    Returns:
+        list of dicts: {text, words, spans} where spans[i] is the
+        (start, end) character range of words[i] within text
+    """
+    words = sorted(details, key=lambda d: (d['box'][1], d['box'][0]))
+    rows = []
+    for word in words:
+        x, y, w, h = word['box']
+        center = y + h / 2
+        for row in rows:
+            if abs(center - row['center']) <= max(row['height'], h) / 2:
+                row['words'].append(word)
+                break
+        else:
+            rows.append({'center': center, 'height': h, 'words': [word]})
+
+    lines = []
+    for row in sorted(rows, key=lambda r: r['center']):
+        row_words = sorted(row['words'], key=lambda d: d['box'][0])
+        text, spans = '', []
+        previous = None
+        for word in row_words:
+            # Keep a space between Latin tokens and across visible gaps so values do not fuse
+            if previous is not None:
+                gap = word['box'][0] - (previous['box'][0] + previous['box'][2])
+                if gap > 0.8 * max(word['box'][3], 1) or (text[-1].isascii() and word['text'][0].isascii()):
+                    text += ' '
+            spans.append((len(text), len(text) + len(word['text'])))
+            text += word['text']
+            previous = word
+
+        xs = [d['box'][0] for d in row_words]
+        x_ends = [d['box'][0] + d['box'][2] for d in row_words]
+        lines.append({
+            'text': text,
+            'words': row_words,
+            'spans': spans,
+            'x_range': (min(xs), max(x_ends)),
+            'center': row['center'],
+            'height': row['height']
+        })
+    return lines
+
+def words_in_span(line, start, end):
+    """
+    Word boxes of a line overlapping the character range [start, end)
+    """
+    return [
+        word for word, (w_start, w_end) in zip(line['words'], line['spans'])
+        if w_start < end and w_end > start
+    ]
+
+def make_candidate(value, words, anchor):
+    """
+    Field candidate with confidence = mean OCR confidence x anchor weight
+    """
+    confidences = [w['confidence'] for w in words if w['confidence'] >= 0]
+    ocr_conf = sum(confidences) / len(confidences) / 100 if confidences else 1.0
+    box = None
+    if words:
+        x0 = min(w['box'][0] for w in words)
+        y0 = min(w['box'][1] for w in words)
+        x1 = max(w['box'][0] + w['box'][2] for w in words)
+        y1 = max(w['box'][1] + w['box'][3] for w in words)
+        box = [x0, y0, x1 - x0, y1 - y0]
+
+    return {
+        'value': value,
+        'confidence': round(ocr_conf * ANCHOR_WEIGHTS[anchor], 3),
+        'box': box,
+        'anchor': anchor
+    }
+
+def value_below(lines, index, pattern):
+    """
+    Match pattern against the nearest line under lines[index] that overlaps it horizontally
+    """
+    label = lines[index]
+    for line in lines[index + 1:]:
+        if line['center'] - label['center'] > 2.5 * max(label['height'], line['height']):
+            break
+        if line['x_range'][0] <= label['x_range'][1] and line['x_range'][1] >= label['x_range'][0]:
+            match = pattern.search(line['text'])
+            if match:
+                return match.group(0), words_in_span(line, match.start(), match.end())
+            return None
+    return None
+
+def extract_medical_fields(details):
+    """
+    Build a structured patient draft from OCR word boxes in one pass per line
+
+    Args:
+        details: List of {text, confidence, box} from recognition
+
+    Returns:
+        dict: {patient_draft, fields} where fields carries per-field
+        confidence, source box and how the value was anchored
+    """
+    lines = group_lines(details)
+    candidates = {}
+
+    def offer(field, candidate):
+        best = candidates.get(field)
+        if best is None or candidate['confidence'] > best['confidence']:
+            candidates[field] = candidate
+
+    def scan(line, start, end):
+        for match in FIELD_SCANNER.finditer(line['text'], start, end):
+            field = match.lastgroup
+            if field == 'duration_unit':
+                field = 'duration'
+            value = match.group(field).strip()
+            words = words_in_span(line, match.start(field), match.end(field))
+
+            if field == 'age_suffix':
+                offer('age', make_candidate(value, words, 'bare'))
+            elif field == 'phone_bare':
+                offer('phone', make_candidate(value, words, 'bare'))
+            elif field == 'pain_nature':
+                offer('pain_nature', make_candidate(value, words, 'keyword'))
+            elif field == 'duration':
+                unit = match.group('duration_unit')
+                unit = '个月' if '月' in unit else unit
+                offer('pain_duration', make_candidate(f'{value}{unit}', words, 'keyword'))
+            else:
+                offer(field, make_candidate(value, words, 'label'))
+                if field == 'chief_complaint':
+                    # The complaint usually carries pain nature and duration itself
+                    scan(line, match.start(field), match.end(field))
+
+    for index, line in enumerate(lines):
+        scan(line, 0, len(line['text']))
+
+        label_match = BARE_LABEL.search(line['text'])
+        if label_match:
+            field = BARE_LABEL_FIELDS[label_match.group('label')]
+            found = value_below(lines, index, VALUE_PATTERNS[field])
+            if found:
+                offer(field, make_candidate(found[0], found[1], 'label_below'))
+
+    full_text = ''.join(line['text'] for line in lines)
+
+    # Pain location and unlabeled gender are whole-page keyword checks
+    locations = []
+    for keyword, location in PAIN_LOCATIONS:
+        if keyword in full_text and location not in locations:
+            locations.append(location)
+    if locations:
+        candidates['pain_location'] = {'value': '、'.join(locations), 'confidence': ANCHOR_WEIGHTS['keyword'],
+                                       'box': None, 'anchor': 'keyword'}
+
+    if 'gender' not in candidates and ('男' in full_text) != ('女' in full_text):
+        candidates['gender'] = {'value': '男' if '男' in full_text else '女', 'confidence': 0.5,
+                                'box': None, 'anchor': 'bare'}
+
+    if 'chief_complaint' not in candidates and '腰痛' in full_text:
+        candidates['chief_complaint'] = {'value': '腰痛', 'confidence': 0.5, 'box': None, 'anchor': 'keyword'}
+
+    if 'age' in candidates:
+        candidates['age']['value'] = int(candidates['age']['value'])
+    if 'phone' in candidates:
+        phone = candidates['phone']['value']
+        candidates['phone']['value'] = phone[:3] + '****' + phone[7:]
+
+    draft_fields = ['name', 'age', 'gender', 'phone', 'chief_complaint',
+                    'pain_location', 'pain_nature', 'pain_duration']
+    patient_draft = {field: candidates[field]['value'] if field in candidates else None
+                     for field in draft_fields}
+
+    return {'patient_draft': patient_draft, 'fields': candidates}
+
+def details_from_text(text):
+    """
+    Fake word boxes for plain text so extraction works without OCR details
+    """
+    return [
+        {'text': line.strip(), 'confidence': -1, 'box': [0, i * 20, len(line.strip()), 20]}
+        for i, line in enumerate(text.splitlines()) if line.strip()
+    ]
+
+# ============================================================
+# Form Templates (Region OCR)
+# ============================================================
+
+# Single-line fields (姓名, 年龄, 电话) read best with PSM 7; free text uses PSM 6
+DEFAULT_FIELD_PSM = 7
+REGION_PADDING = 4
+MIN_ALIGNMENT_MATCHES = 12
+
+orb_detector = cv2.ORB_create(nfeatures=1500)
+orb_matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+
+form_templates = {}
+form_templates_lock = threading.Lock()
+
+def build_template(spec):
+    """
+    Validate a template registration and precompute alignment features
+
+    spec:
+    {
+        "name": "intake_v1",
+        "width": 2480, "height": 3508,          // template coordinate frame
+        "reference_image": "base64...",          // optional, enables alignment
+        "fields": {
+            "name": {"box": [x, y, w, h]},       // psm defaults to 7
+            "age": {"box": [...], "psm": 7, "whitelist": "0123456789"},
+            "chief_complaint": {"box": [...], "psm": 6}
+        }
+    }
+    """
+    name = spec.get('name')
+    fields = spec.get('fields')
+    if not name or not isinstance(fields, dict) or not fields:
+        raise ValueError('Template requires a name and a non-empty fields object')
+
+    template = {
+        'name': name,
+        'width': spec.get('width'),
+        'height': spec.get('height'),
+        'fields': {},
+        'reference_image': spec.get('reference_image'),
+        'keypoints': None,
+        'descriptors': None
+    }
+
+    for field_name, field in fields.items():
+        box = field.get('box')
+        if not isinstance(box, list) or len(box) != 4:
+            raise ValueError(f'Field {field_name} requires box [x, y, w, h]')
+        template['fields'][field_name] = {
+            'box': [int(v) for v in box],
+            'psm': int(field.get('psm', DEFAULT_FIELD_PSM)),
+            'languages': field.get('languages'),
+            'whitelist': field.get('whitelist')
+        }
+
+    if template['reference_image']:
+        reference = decode_image_array(decode_base64_payload(template['reference_image']), grayscale=True)
+        template['width'], template['height'] = reference.shape[1], reference.shape[0]
+        template['keypoints'], template['descriptors'] = orb_detector.detectAndCompute(reference, None)
+
+    if not template['width'] or not template['height']:
+        raise ValueError('Template requires width and height or a reference_image')
+
+    return template
+
+def template_summary(template):
+    """
+    Public view of a template (no reference image or features)
+    """
+    return {
+        'name': template['name'],
+        'width': template['width'],
+        'height': template['height'],
+        'alignment': 'homography' if template['descriptors'] is not None else 'scale',
+        'fields': template['fields']
+    }
+
+def save_templates():
+    """
+    Persist template specs to OCR_TEMPLATE_FILE (if configured)
+    """
+    if not OCR_TEMPLATE_FILE:
+        return
+    with form_templates_lock:
+        specs = [
+            {**template_summary(t), 'reference_image': t['reference_image']}
+            for t in form_templates.values()
+        ]
+    try:
+        with open(OCR_TEMPLATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(specs, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"[WARN] Failed to save form templates: {e}")
+
+def load_templates():
+    """
+    Load template specs from OCR_TEMPLATE_FILE on startup
+    """
+    if not OCR_TEMPLATE_FILE or not os.path.exists(OCR_TEMPLATE_FILE):
+        return
+    try:
+        with open(OCR_TEMPLATE_FILE, 'r', encoding='utf-8') as f:
+            for spec in json.load(f):
+                form_templates[spec['name']] = build_template(spec)
+        print(f"[OK] Loaded {len(form_templates)} form templates")
+    except Exception as e:
+        print(f"[WARN] Failed to load form templates: {e}")
+
+def align_to_template(gray, template):
+    """
+    Warp a grayscale scan into the template coordinate frame
+
+    Uses ORB features + RANSAC homography against the reference image when
+    one was registered, otherwise (or when matching fails) a plain resize.
+
+    Returns:
+        tuple: (aligned numpy array, method)
+    """
+    size = (template['width'], template['height'])
+
+    if template['descriptors'] is not None:
+        keypoints, descriptors = orb_detector.detectAndCompute(gray, None)
+        if descriptors is not None:
+            matches = sorted(orb_matcher.match(descriptors, template['descriptors']), key=lambda m: m.distance)
+            if len(matches) >= MIN_ALIGNMENT_MATCHES:
+                src = np.float32([keypoints[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
+                dst = np.float32([template['keypoints'][m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
+                homography, _ = cv2.findHomography(src, dst, cv2.RANSAC, 5.0)
+                if homography is not None:
+                    return cv2.warpPerspective(gray, homography, size, borderValue=255), 'homography'
+
+    if (gray.shape[1], gray.shape[0]) == size:
+        return gray, 'none'
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA), 'scale'
+
+def recognize_region(gray, field, languages, preprocess, min_confidence):
+    """
+    OCR one field box of an aligned page
+
+    Returns:
+        dict: {text, confidence, box, words}
+    """
+    x, y, w, h = field['box']
+    height, width = gray.shape[:2]
+    x0, y0 = max(0, x - REGION_PADDING), max(0, y - REGION_PADDING)
+    x1, y1 = min(width, x + w + REGION_PADDING), min(height, y + h + REGION_PADDING)
+
+    crop = gray[y0:y1, x0:x1]
+    if crop.size == 0:
+        return {'text': '', 'confidence': 0.0, 'box': field['box'], 'words': []}
+
+    if preprocess:
+        _, crop = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    config = f"--oem 3 --psm {field['psm']}"
+    if field['whitelist']:
+        config += f" -c tessedit_char_whitelist={field['whitelist']}"
+
+    ocr_data = pytesseract.image_to_data(
+        Image.fromarray(crop),
+        lang='+'.join(field['languages'] or languages),
+        config=config,
+        output_type=pytesseract.Output.DICT
+    )
+
+    words = []
+    for i in range(len(ocr_data['text'])):
+        text = ocr_data['text'][i].strip()
+        conf = float(ocr_data['conf'][i])
+        if text and conf >= min_confidence:
+            words.append({
+                'text': text,
+                'confidence': conf,
+                'box': [
+                    int(ocr_data['left'][i]) + x0,
+                    int(ocr_data['top'][i]) + y0,
+                    int(ocr_data['width'][i]),
+                    int(ocr_data['height'][i])
+                ]
+            })
+
+    # Chinese words come back as separate glyph runs; only Latin text needs spaces
+    joiner = ' ' if all(w['text'].isascii() for w in words) else ''
+
+    return {
+        'text': joiner.join(w['text'] for w in words),
+        'confidence': round(sum(w['confidence'] for w in words) / len(words), 2) if words else 0.0,
+        'box': field['box'],
+        'words': words
+    }
+
+load_templates()
+
+# ============================================================
+# OCR Result Cache
+# ============================================================
+
+class OCRResultCache:
+    """
+    LRU cache of raw recognition results with an optional disk tier
+
+    Keyed on the SHA-256 of the uploaded bytes plus languages and preprocess
+    flag. A byte hash is used rather than a perceptual one: intake forms share
+    a template, so visually similar scans from different patients must never
+    collide.
+    """
+
+    def __init__(self, max_entries, max_bytes, cache_dir=''):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()  # key -> (raw_result, size_bytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(digest, languages, preprocess, variant=''):
+        """
+        digest is the SHA-256 hex digest of the uploaded image bytes
+        """
+        return f"{digest}:{'+'.join(languages)}:{int(bool(preprocess))}:{variant}"
+
+    def _disk_path(self, key):
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{name}.json')
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        raw = self._disk_get(key)
+
+        with self.lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        # Promote disk hits back into memory
+        self._memory_put(key, raw)
+        return raw
+
+    def put(self, key, raw):
+        self._memory_put(key, raw)
+
+        if self.cache_dir:
+            try:
+                tmp_path = self._disk_path(key) + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(raw, f, ensure_ascii=False)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError as e:
+                print(f"[WARN] OCR cache disk write failed: {e}")
+
+    def _memory_put(self, key, raw):
+        size = len(json.dumps(raw, ensure_ascii=False).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+
+            self.entries[key] = (raw, size)
+            self.total_bytes += size
+
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def _disk_get(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': self.enabled,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'disk_tier': bool(self.cache_dir),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+ocr_cache = OCRResultCache(OCR_CACHE_MAX_ENTRIES, OCR_CACHE_MAX_BYTES, OCR_CACHE_DIR)
+
+# ============================================================
+# Asynchronous OCR Jobs
+# ============================================================
+
+job_wakeup = threading.Condition()
+job_workers = []
+job_workers_lock = threading.Lock()
+job_store_ready = False
+job_store_lock = threading.Lock()
+
+def get_job_connection():
+    """
+    Open a connection to the job queue database, creating it on first use
+    """
+    global job_store_ready
+    if not job_store_ready:
+        with job_store_lock:
+            if not job_store_ready:
+                init_job_store()
+                job_store_ready = True
+    conn = sqlite3.connect(OCR_JOB_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_job_store():
+    """
+    Create job tables and requeue jobs interrupted by a restart
+    """
+    directory = os.path.dirname(OCR_JOB_DB)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(OCR_JOB_DB, timeout=30)
+    try:
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS ocr_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                finished_at REAL,
+                options TEXT NOT NULL,
+                source TEXT,
+                callback_url TEXT,
+                callback_status TEXT,
+                total_pages INTEGER NOT NULL,
+                completed_pages INTEGER NOT NULL DEFAULT 0,
+                failed_pages INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_ocr_jobs_status ON ocr_jobs(status, created_at);
+            CREATE TABLE IF NOT EXISTS ocr_job_pages (
+                job_id TEXT NOT NULL REFERENCES ocr_jobs(id) ON DELETE CASCADE,
+                page_index INTEGER NOT NULL,
+                name TEXT,
+                image BLOB,
+                status TEXT NOT NULL DEFAULT 'queued',
+                result TEXT,
+                PRIMARY KEY (job_id, page_index)
+            );
+        ''')
+        requeued = conn.execute(
+            "UPDATE ocr_jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+            (time.time(),)
+        ).rowcount
+        conn.commit()
+        if requeued:
+            print(f"[JOBS] Requeued {requeued} interrupted jobs")
+    finally:
+        conn.close()
+
+def ensure_job_workers():
+    """
+    Start job worker threads on first use (keeps the reloader parent idle)
+    """
+    with job_workers_lock:
+        if job_workers:
+            return
+        for i in range(max(OCR_JOB_WORKERS, 1)):
+            worker = threading.Thread(target=job_worker_loop, name=f'ocr-job-{i}', daemon=True)
+            worker.start()
+            job_workers.append(worker)
+
+def claim_next_job():
+    """
+    Atomically move the oldest queued job to running
+
+    Returns:
+        str or None: job id
+    """
+    conn = get_job_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(
+            "SELECT id FROM ocr_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        conn.execute(
+            "UPDATE ocr_jobs SET status = 'running', updated_at = ? WHERE id = ?",
+            (time.time(), row['id'])
+        )
+        conn.commit()
+        return row['id']
+    finally:
+        conn.close()
+
+def job_worker_loop():
+    """
+    Pull queued jobs and run them until the process exits
+    """
+    while True:
+        try:
+            job_id = claim_next_job()
+        except Exception as e:
+            print(f"[ERROR] Job queue unavailable: {e}")
+            job_id = None
+
+        if job_id is None:
+            purge_expired_jobs()
+            with job_wakeup:
+                job_wakeup.wait(timeout=5)
+            continue
+
+        # Tracked for stats; job workers do not compete with requests for slots
+        ticket = admission.admit('job')
+        try:
+            run_job(job_id)
+        except Exception as e:
+            print(f"[ERROR] Job {job_id} crashed: {e}")
+            traceback.print_exc()
+            conn = get_job_connection()
+            try:
+                conn.execute(
+                    "UPDATE ocr_jobs SET status = 'failed', error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                    (str(e), time.time(), time.time(), job_id)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            send_job_callback(job_id)
+        finally:
+            admission.release(ticket)
+
+def run_job(job_id):
+    """
+    OCR every unfinished page of a job on the OCR pool, recording progress per page
+    """
+    conn = get_job_connection()
+    try:
+        job = conn.execute('SELECT * FROM ocr_jobs WHERE id = ?', (job_id,)).fetchone()
+        pages = conn.execute(
+            "SELECT page_index, name, image FROM ocr_job_pages WHERE job_id = ? AND status = 'queued' "
+            "ORDER BY page_index",
+            (job_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    ocr_options = json.loads(job['options'])
+    source = job['source'] or 'unknown'
+
+    print(f"[JOBS] Running {job_id}: {len(pages)} of {job['total_pages']} pages left")
+
+    futures = {
+        ocr_executor.submit(run_batch_item, page['page_index'], page['name'], bytes(page['image']),
+                            ocr_options, source, False, 'job'): page['page_index']
+        for page in pages
+    }
+
+    for future in as_completed(futures):
+        result = future.result()
+        conn = get_job_connection()
+        try:
+            conn.execute(
+                "UPDATE ocr_job_pages SET status = ?, result = ?, image = NULL WHERE job_id = ? AND page_index = ?",
+                ('completed' if result['success'] else 'failed',
+                 json.dumps(result, ensure_ascii=False), job_id, futures[future])
+            )
+            column = 'completed_pages' if result['success'] else 'failed_pages'
+            conn.execute(
+                f'UPDATE ocr_jobs SET {column} = {column} + 1, updated_at = ? WHERE id = ?',
+                (time.time(), job_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    conn = get_job_connection()
+    try:
+        conn.execute(
+            "UPDATE ocr_jobs SET status = 'completed', updated_at = ?, finished_at = ? WHERE id = ?",
+            (time.time(), time.time(), job_id)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"[JOBS] Completed {job_id}")
+    send_job_callback(job_id)
+
+def load_job(job_id, include_results=True):
+    """
+    Job status document returned by GET /ocr/jobs/<id> and sent to callbacks
+    """
+    conn = get_job_connection()
+    try:
+        job = conn.execute('SELECT * FROM ocr_jobs WHERE id = ?', (job_id,)).fetchone()
+        if job is None:
+            return None
+        pages = conn.execute(
+            'SELECT page_index, name, status, result FROM ocr_job_pages WHERE job_id = ? ORDER BY page_index',
+            (job_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    done = job['completed_pages'] + job['failed_pages']
+    document = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'finished_at': job['finished_at'],
+        'progress': {
+            'total_pages': job['total_pages'],
+            'completed_pages': job['completed_pages'],
+            'failed_pages': job['failed_pages'],
+            'percent': round(100 * done / job['total_pages'], 1) if job['total_pages'] else 100.0
+        },
+        'pages': [{'index': p['page_index'], 'name': p['name'], 'status': p['status']} for p in pages]
+    }
+    if job['error']:
+        document['error'] = job['error']
+    if job['callback_url']:
+        document['callback_status'] = job['callback_status']
+
+    if include_results and job['status'] in ('completed', 'failed'):
+        document['results'] = [json.loads(p['result']) for p in pages if p['result']]
+        document['summary'] = {
+            'total': job['total_pages'],
+            'success': job['completed_pages'],
+            'failed': job['failed_pages']
+        }
+    return document
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Refuse redirects so a callback cannot be bounced to a host off the allow-list"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+callback_opener = urllib.request.build_opener(NoRedirectHandler)
+
+def callback_url_allowed(url):
+    """
+    Whether job results may be sent to url: http(s) to a host in OCR_JOB_CALLBACK_HOSTS
+    """
+    try:
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return False
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return False
+    host = parts.hostname.lower()
+    return host in OCR_JOB_CALLBACK_HOSTS or (port is not None and f'{host}:{port}' in OCR_JOB_CALLBACK_HOSTS)
+
+def send_job_callback(job_id):
+    """
+    POST the finished job document to its callback URL, retrying with backoff
+
+    The URL is checked against the allow-list again, since it may have been
+    stored before the service was reconfigured.
+    """
+    conn = get_job_connection()
+    try:
+        row = conn.execute('SELECT callback_url FROM ocr_jobs WHERE id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or not row['callback_url']:
+        return
+
+    status = 'failed'
+    if not callback_url_allowed(row['callback_url']):
+        print(f"[WARN] Job {job_id} callback host not allowed, not sent")
+        status = 'rejected'
+    else:
+        body = json.dumps(load_job(job_id), ensure_ascii=False).encode('utf-8')
+        for attempt in range(OCR_JOB_CALLBACK_RETRIES):
+            try:
+                callback = urllib.request.Request(
+                    row['callback_url'], data=body, method='POST',
+                    headers={'Content-Type': 'application/json'}
+                )
+                with callback_opener.open(callback, timeout=10) as response:
+                    if 200 <= response.status < 300:
+                        status = 'delivered'
+                        break
+            except Exception as e:
+                print(f"[WARN] Job {job_id} callback attempt {attempt + 1} failed: {e}")
+            if attempt + 1 < OCR_JOB_CALLBACK_RETRIES:
+                time.sleep(2 ** attempt)
+
+    conn = get_job_connection()
+    try:
+        conn.execute('UPDATE ocr_jobs SET callback_status = ? WHERE id = ?', (status, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def purge_expired_jobs():
+    """
+    Drop finished jobs past the retention window or beyond the retained-job cap
+    """
+    conn = get_job_connection()
+    try:
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute(
+            "DELETE FROM ocr_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (time.time() - OCR_JOB_RETENTION_SECONDS,)
+        )
+        conn.execute(
+            '''DELETE FROM ocr_jobs WHERE id IN (
+                   SELECT id FROM ocr_jobs WHERE finished_at IS NOT NULL
+                   ORDER BY finished_at DESC LIMIT -1 OFFSET ?
+               )''',
+            (OCR_JOB_MAX_RETAINED,)
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[WARN] Job purge failed: {e}")
+    finally:
+        conn.close()
+
+def enqueue_job(items, ocr_options, source, callback_url):
+    """
+    Persist a job and its page payloads, then wake a worker
+
+    Returns:
+        str or None: job id, or None when the queue is full
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = get_job_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        queued = conn.execute(
+            "SELECT COUNT(*) FROM ocr_jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()[0]
+        if queued >= OCR_JOB_MAX_QUEUED:
+            conn.rollback()
+            return None
+
+        conn.execute(
+            '''INSERT INTO ocr_jobs (id, status, created_at, updated_at, options, source, callback_url, total_pages)
+               VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)''',
+            (job_id, now, now, json.dumps(ocr_options), source, callback_url, len(items))
+        )
+        conn.executemany(
+            'INSERT INTO ocr_job_pages (job_id, page_index, name, image) VALUES (?, ?, ?, ?)',
+            [(job_id, index, name, image_data) for index, (name, image_data) in enumerate(items)]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    with job_wakeup:
+        job_wakeup.notify()
+    return job_id
+
+def job_queue_depth():
+    """
+    Jobs waiting or running (for autoscaling)
+    """
+    conn = get_job_connection()
+    try:
+        return conn.execute(
+            "SELECT COUNT(*) FROM ocr_jobs WHERE status IN ('queued', 'running')"
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+@ocr_bp.before_app_request
+def start_job_workers():
+    ensure_job_workers()
+
+# ============================================================
+# Telemetry
+# ============================================================
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONFIDENCE_BUCKETS = (20, 40, 60, 70, 80, 90, 95)
+
+@contextmanager
+def timed(timings, stage):
+    """
+    Accumulate the wall time of a block into timings[stage] (no-op if timings is None)
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def timings_ms(timings):
+    """
+    Stage timings rounded to milliseconds for API responses
+    """
+    return {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+
+def request_source():
+    """
+    Metrics label for the caller (clinic / scanner), from header or body
+    """
+    source = request.headers.get('X-OCR-Source')
+    if not source:
+        data = request.get_json(silent=True) if request.is_json else None
+        source = (data or {}).get('source') or request.form.get('source')
+    source = re.sub(r'[^A-Za-z0-9_.-]', '_', str(source or 'unknown'))[:64]
+    return source
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'buckets': dict(zip([str(b) for b in self.buckets], self.counts))
+        }
+
+class OCRMetrics:
+    """
+    Per-request OCR telemetry aggregated in memory
+
+    Tracks request counts, per-stage latency histograms, image size, word
+    count and mean confidence, broken down by endpoint, source and language
+    set. Sources beyond OCR_METRICS_MAX_SOURCES are folded into "other".
+    """
+
+    def __init__(self, max_sources):
+        self.max_sources = max_sources
+        self.lock = threading.Lock()
+        self.requests = {}  # (endpoint, source, status) -> count
+        self.languages = {}  # "chi_sim+eng" -> count
+        self.stage_seconds = {}  # stage -> Histogram
+        self.confidence = Histogram(CONFIDENCE_BUCKETS)
+        self.sources = {}  # source -> aggregates
+        self.cached = 0
+
+    def _source_key(self, source):
+        if source in self.sources or len(self.sources) < self.max_sources:
+            return source
+        return 'other'
+
+    def record(self, endpoint, source, success, timings, result=None):
+        status = 'success' if success else 'error'
+        result = result or {}
+
+        confidences = [d['confidence'] for d in result.get('details', []) if d['confidence'] >= 0]
+        mean_confidence = sum(confidences) / len(confidences) if confidences else None
+        info = result.get('image_info') or {}
+        pixels = info.get('width', 0) * info.get('height', 0)
+
+        with self.lock:
+            source = self._source_key(source)
+            key = (endpoint, source, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+            for stage, seconds in timings.items():
+                self.stage_seconds.setdefault(stage, Histogram(LATENCY_BUCKETS)).observe(seconds)
+
+            agg = self.sources.setdefault(source, {
+                'requests': 0, 'errors': 0, 'seconds': 0.0, 'pixels': 0,
+                'words': 0, 'confidence_sum': 0.0, 'confidence_count': 0
+            })
+            agg['requests'] += 1
+            agg['errors'] += 0 if success else 1
+            agg['seconds'] += timings.get('total', 0.0)
+            agg['pixels'] += pixels
+
+            if not success:
+                return
+
+            if result.get('cached'):
+                self.cached += 1
+
+            languages = '+'.join(result.get('languages_used') or [])
+            if languages:
+                self.languages[languages] = self.languages.get(languages, 0) + 1
 
-print("=" * 60)
-print("Tesseract OCR Service for Medical System")
-print("=" * 60)
-print()
-print("Features:")
-print("  [OK] Chinese (Simplified & Traditional) text recognition")
-print("  [OK] English text recognition")
-print("  [OK] Image preprocessing for better accuracy")
-print("  [OK] Confidence filtering")
-print("  [OK] Base64 image support")
-print()
-print("API Endpoints:")
-print("  GET  /health              - Health check")
-print("  POST /ocr/process         - Process single image")
-print()
-print("=" * 60)
+            agg['words'] += len(result.get('details', []))
+            if mean_confidence is not None:
+                self.confidence.observe(mean_confidence)
+                agg['confidence_sum'] += mean_confidence
+                agg['confidence_count'] += 1
 
-# Test Tesseract installation
-try:
-    tesseract_version = pytesseract.get_tesseract_version()
-    print(f"Tesseract version: {tesseract_version}")
-    print("[OK] Tesseract OCR initialized successfully")
-except Exception as e:
-    print(f"[ERROR] Tesseract initialization failed: {e}")
+        if mean_confidence is not None:
+            print(f"[OCR] {endpoint} source={source} {info.get('width')}x{info.get('height')} "
+                  f"words={len(confidences)} conf={mean_confidence:.1f} "
+                  f"total={timings.get('total', 0.0):.2f}s")
 
-print("=" * 60)
-print()
+    def snapshot(self):
+        with self.lock:
+            return {
+                'requests': [
+                    {'endpoint': e, 'source': s, 'status': st, 'count': c}
+                    for (e, s, st), c in self.requests.items()
+                ],
+                'languages': dict(self.languages),
+                'cached': self.cached,
+                'stage_seconds': {stage: h.to_dict() for stage, h in self.stage_seconds.items()},
+                'mean_confidence': self.confidence.to_dict(),
+                'sources': {
+                    source: {
+                        'requests': agg['requests'],
+                        'errors': agg['errors'],
+                        'avg_seconds': round(agg['seconds'] / agg['requests'], 4),
+                        'avg_megapixels': round(agg['pixels'] / agg['requests'] / 1e6, 2),
+                        'words': agg['words'],
+                        'mean_confidence': round(agg['confidence_sum'] / agg['confidence_count'], 2)
+                        if agg['confidence_count'] else None
+                    }
+                    for source, agg in self.sources.items()
+                },
+                'workers': OCR_MAX_WORKERS
+            }
+
+    def to_prometheus(self):
+        snap = self.snapshot()
+        lines = [
+            '# TYPE ocr_requests_total counter'
+        ]
+        for r in snap['requests']:
+            lines.append(
+                f'ocr_requests_total{{endpoint="{r["endpoint"]}",source="{r["source"]}",'
+                f'status="{r["status"]}"}} {r["count"]}'
+            )
+
+        lines.append('# TYPE ocr_stage_seconds histogram')
+        for stage, h in snap['stage_seconds'].items():
+            for bound, count in h['buckets'].items():
+                lines.append(f'ocr_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'ocr_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h["count"]}')
+            lines.append(f'ocr_stage_seconds_sum{{stage="{stage}"}} {h["sum"]}')
+            lines.append(f'ocr_stage_seconds_count{{stage="{stage}"}} {h["count"]}')
+
+        h = snap['mean_confidence']
+        lines.append('# TYPE ocr_mean_confidence histogram')
+        for bound, count in h['buckets'].items():
+            lines.append(f'ocr_mean_confidence_bucket{{le="{bound}"}} {count}')
+        lines.append(f'ocr_mean_confidence_bucket{{le="+Inf"}} {h["count"]}')
+        lines.append(f'ocr_mean_confidence_sum {h["sum"]}')
+        lines.append(f'ocr_mean_confidence_count {h["count"]}')
+
+        lines.append('# TYPE ocr_language_requests_total counter')
+        for languages, count in snap['languages'].items():
+            lines.append(f'ocr_language_requests_total{{languages="{languages}"}} {count}')
+
+        lines.append('# TYPE ocr_source_avg_seconds gauge')
+        lines.append('# TYPE ocr_source_mean_confidence gauge')
+        for source, agg in snap['sources'].items():
+            lines.append(f'ocr_source_avg_seconds{{source="{source}"}} {agg["avg_seconds"]}')
+            if agg['mean_confidence'] is not None:
+                lines.append(f'ocr_source_mean_confidence{{source="{source}"}} {agg["mean_confidence"]}')
+
+        cache = ocr_cache.stats()
+        lines.extend([
+            '# TYPE ocr_cache_hits_total counter',
+            f'ocr_cache_hits_total {cache["hits"]}',
+            '# TYPE ocr_cache_misses_total counter',
+            f'ocr_cache_misses_total {cache["misses"]}',
+            '# TYPE ocr_workers gauge',
+            f'ocr_workers {snap["workers"]}'
+        ])
+
+        load = admission.stats()
+        lines.append('# TYPE ocr_inflight_requests gauge')
+        for kind, count in load['inflight'].items():
+            lines.append(f'ocr_inflight_requests{{class="{kind}"}} {count}')
+        lines.append('# TYPE ocr_admission_rejected_total counter')
+        for kind, count in load['rejected'].items():
+            lines.append(f'ocr_admission_rejected_total{{class="{kind}"}} {count}')
+        lines.extend([
+            '# TYPE ocr_inflight_bytes gauge',
+            f'ocr_inflight_bytes {load["inflight_bytes"]}',
+            '# TYPE ocr_max_inflight gauge',
+            f'ocr_max_inflight {load["max_inflight"]}',
+            '# TYPE ocr_job_queue_depth gauge',
+            f'ocr_job_queue_depth {job_queue_depth()}'
+        ])
+        return '\n'.join(lines) + '\n'
+
+ocr_metrics = OCRMetrics(OCR_METRICS_MAX_SOURCES)
 
 # ============================================================
-# Helper Functions
+# Admission Control
 # ============================================================
 
-def preprocess_image(image):
+class AdmissionController:
     """
-    Preprocess image for better OCR accuracy
+    Bounds in-flight OCR work by request count and request bytes
+
+    Two request classes share the budget. Interactive requests (one image,
+    a user waiting) may take every slot and wait briefly for one to free
+    up. Batch uploads may not take the last `reserved` slots or the
+    matching share of the byte budget, so a burst of batches cannot lock
+    out single uploads. Rejected HTTP requests get 429 with a Retry-After
+    estimated from recent durations.
+
+    Running jobs are tracked as a third class for stats only: the job
+    workers are already bounded by OCR_JOB_WORKERS and do not take request
+    slots, so a running job never turns batch uploads away.
     """
-    # Convert to grayscale
-    gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
 
-    # Apply thresholding
-    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    KINDS = ('interactive', 'batch', 'job')
 
-    # Denoise
-    denoised = cv2.fastNlMeansDenoising(binary, None, 10, 7, 21)
+    def __init__(self, max_inflight, max_bytes, reserved, wait_seconds):
+        self.max_inflight = max(max_inflight, 1)
+        self.max_bytes = max_bytes
+        self.reserved = min(max(reserved, 0), self.max_inflight - 1)
+        self.wait_seconds = wait_seconds
+        self.cond = threading.Condition()
+        self.inflight = {kind: 0 for kind in self.KINDS}
+        self.bytes = 0
+        self.admitted = {kind: 0 for kind in self.KINDS}
+        self.rejected = {kind: 0 for kind in self.KINDS}
+        self.avg_seconds = {'interactive': 1.0, 'batch': 10.0, 'job': 30.0}  # EWMA, seeded with rough guesses
 
-    return Image.fromarray(denoised)
+    def _limits(self, kind):
+        if kind == 'batch':
+            share = 1 - self.reserved / self.max_inflight
+            return self.max_inflight - self.reserved, int(self.max_bytes * share)
+        return self.max_inflight, self.max_bytes
 
-def decode_base64_image(base64_string):
-    """
-    Decode base64 string to PIL Image
-    """
-    # Remove data URL prefix if present
-    if ',' in base64_string:
-        base64_string = base64_string.split(',')[1]
+    def _requests_inflight(self):
+        return self.inflight['interactive'] + self.inflight['batch']
 
-    image_data = base64.b64decode(base64_string)
-    image = Image.open(io.BytesIO(image_data))
+    def _fits(self, kind, size):
+        if kind == 'job':
+            return True
+        slots, byte_limit = self._limits(kind)
+        if self._requests_inflight() >= slots:
+            return False
+        # A request larger than the whole budget is still admitted once the service is idle
+        return self.bytes + size <= byte_limit or self.bytes == 0
 
-    # Convert to RGB if needed
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
+    def admit(self, kind, size=0, timeout=0.0):
+        """
+        Take a slot for `size` request bytes, waiting up to timeout seconds
+        (None waits indefinitely)
 
-    return image
+        Returns:
+            dict ticket for release(), or None when rejected
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while not self._fits(kind, size):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.rejected[kind] += 1
+                    return None
+                self.cond.wait(remaining)
+            self.inflight[kind] += 1
+            self.bytes += size
+            self.admitted[kind] += 1
+        return {'kind': kind, 'size': size, 'started': time.perf_counter(), 'released': False}
+
+    def release(self, ticket):
+        elapsed = time.perf_counter() - ticket['started']
+        with self.cond:
+            if ticket['released']:
+                return
+            ticket['released'] = True
+            kind = ticket['kind']
+            self.inflight[kind] -= 1
+            self.bytes -= ticket['size']
+            self.avg_seconds[kind] = 0.8 * self.avg_seconds[kind] + 0.2 * elapsed
+            self.cond.notify_all()
+
+    def retry_after(self, kind):
+        """
+        Seconds until the work ahead of a new request has likely drained
+        """
+        with self.cond:
+            slots = self._limits(kind)[0]
+            ahead = self._requests_inflight()
+            return max(1, math.ceil(self.avg_seconds[kind] * ahead / slots))
+
+    def stats(self):
+        with self.cond:
+            return {
+                'inflight': dict(self.inflight),
+                'inflight_bytes': self.bytes,
+                'max_inflight': self.max_inflight,
+                'max_inflight_bytes': self.max_bytes,
+                'interactive_reserved': self.reserved,
+                'admitted': dict(self.admitted),
+                'rejected': dict(self.rejected),
+                'avg_seconds': {kind: round(v, 3) for kind, v in self.avg_seconds.items()}
+            }
+
+admission = AdmissionController(
+    OCR_MAX_INFLIGHT, OCR_MAX_INFLIGHT_BYTES, OCR_INTERACTIVE_RESERVED, OCR_ADMISSION_WAIT_SECONDS
+)
+
+def admission_controlled(kind):
+    """
+    Route decorator: admit the request as `kind` or answer 429 + Retry-After
+
+    The slot is held until the response is closed, so streamed bodies
+    count as in flight until the last line is sent.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            timeout = admission.wait_seconds if kind == 'interactive' else 0.0
+            ticket = admission.admit(kind, request.content_length or 0, timeout)
+            if ticket is None:
+                retry_after = admission.retry_after(kind)
+                print(f"[ADMISSION] Rejected {kind} {request.path} (retry after {retry_after}s)")
+                response = jsonify({
+                    'success': False,
+                    'error': 'OCR service is busy, retry later',
+                    'retry_after': retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                admission.release(ticket)
+                raise
+            response.call_on_close(lambda: admission.release(ticket))
+            return response
+        return wrapper
+    return decorator
 
 # ============================================================
 # API Endpoints
@@ -110,7 +2453,8 @@ def health_check():
             'service': 'ocr',
             'engine': 'tesseract',
             'version': str(version),
-            'languages': ['chi_sim', 'chi_tra', 'eng']
+            'languages': sorted(get_installed_languages()),
+            'cache': ocr_cache.stats()
         }), 200
     except Exception as e:
         return jsonify({
@@ -118,7 +2462,8 @@ def health_check():
             'error': str(e)
         }), 500
 
-@app.route('/ocr/process', methods=['POST'])
+@ocr_bp.route('/ocr/process', methods=['POST'])
+@admission_controlled('interactive')
 def process_ocr():
     """
     Process single image for OCR
@@ -126,9 +2471,19 @@ def process_ocr():
     Request body:
     {
         "image": "base64_encoded_image_string",
-        "languages": ["chi_sim", "eng"],  // optional, default: chi_sim+eng
+        "languages": ["chi_sim", "eng"],  // optional, default: chi_sim+eng; "auto" to detect
+        "auto_languages": false,           // optional, treat languages as candidates to detect from
         "preprocess": true,                // optional, default: true
-        "min_confidence": 0               // optional, default: 0 (no filtering)
+        "min_confidence": 0,              // optional, default: 0 (no filtering)
+        "cache": true,                    // optional, default: true
+        "tiled": null,                     // optional, force/skip strip processing (default: by size)
+        "orient": false,                   // optional, rotate/deskew before recognition (default: OCR_ORIENT_DEFAULT)
+        "refine": false,                   // optional, re-read low-confidence lines
+        "refine_threshold": 60,            // optional, confidence below which a line is re-read
+        "extract": false,                  // optional, add medical_data (see /ocr/extract)
+        "timings": false,                  // optional, add per-stage timings in ms
+        "source": "clinic-a",              // optional, metrics label (or X-OCR-Source header)
+        "stream": false                   // optional, true/"ndjson" or "sse" to stream lines
     }
 
     Response:
@@ -141,9 +2496,268 @@ def process_ocr():
                 "confidence": 95.5,
                 "box": [x, y, w, h]
             }
+        ],
+        "cached": false
+    }
+
+    With "stream" the page is recognised in strips and events are sent as
+    each finishes, top to bottom (NDJSON lines, or Server-Sent Events for
+    "sse" / Accept: text/event-stream):
+        {"event": "start", "strips": 4, "image_info": {...}, ...}
+        {"event": "lines", "strip": 0, "lines": [{"text", "confidence", "box", "words"}]}
+        {"event": "done", "success": true, "text": "...", "word_count": 42, ...}
+    A failure after the stream has started is sent as {"event": "error"}.
+    """
+    timings = {}
+    started = time.perf_counter()
+    source = request_source()
+
+    try:
+        data = request.get_json()
+
+        if not data or 'image' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'No image data provided'
+            }), 400
+
+        # Decode payload; the image itself is only decoded on a cache miss
+        with timed(timings, 'decode'):
+            image_data = decode_base64_payload(data['image'])
+
+        stream = data.get('stream', False)
+        if stream:
+            sse = stream == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+            summary = {}
+            events = stream_ocr_events(image_data, **parse_ocr_options(data), extract=data.get('extract', False),
+                                       timings=timings, summary=summary)
+            # Decode/orientation run before the first event, so bad uploads still get a JSON error
+            first_event = next(events)
+            return Response(
+                generate_ocr_stream(first_event, events, data, sse, source, timings, started, summary),
+                mimetype='text/event-stream' if sse else 'application/x-ndjson',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
+        result = ocr_image_bytes(image_data, **parse_ocr_options(data), timings=timings)
+
+        with timed(timings, 'postprocess'):
+            if data.get('extract', False):
+                result['medical_data'] = extract_medical_fields(result['details'])
+
+        timings['total'] = time.perf_counter() - started
+        ocr_metrics.record('process', source, True, timings, result)
+
+        if data.get('timings', False):
+            result['timings'] = timings_ms(timings)
+
+        return jsonify({'success': True, **result}), 200
+
+    except Exception as e:
+        timings['total'] = time.perf_counter() - started
+        ocr_metrics.record('process', source, False, timings)
+        print(f"[ERROR] OCR processing failed: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+def generate_ocr_stream(first_event, events, data, sse, source, timings, started, summary):
+    """
+    Response body for a streamed /ocr/process request
+    """
+    try:
+        yield format_stream_event(first_event, sse)
+        for event in events:
+            if event['event'] == 'done':
+                timings['total'] = time.perf_counter() - started
+                if data.get('timings', False):
+                    event['timings'] = timings_ms(timings)
+            yield format_stream_event(event, sse)
+
+        ocr_metrics.record('process', source, True, timings, summary)
+
+    except Exception as e:
+        timings['total'] = time.perf_counter() - started
+        ocr_metrics.record('process', source, False, timings)
+        print(f"[ERROR] Streaming OCR failed: {e}")
+        traceback.print_exc()
+        yield format_stream_event({'event': 'error', 'success': False, 'error': str(e)}, sse)
+
+@ocr_bp.route('/ocr/batch', methods=['POST'])
+@admission_controlled('batch')
+def batch_process_ocr():
+    """
+    Process multiple images concurrently
+
+    Request body (JSON):
+    {
+        "images": ["base64...", {"name": "page2.png", "image": "base64..."}],
+        "languages": ["chi_sim", "eng"],  // optional, shared by all images
+        "preprocess": true,                // optional
+        "min_confidence": 0,              // optional
+        "cache": true,                    // optional
+        "tiled": null,                     // optional
+        "orient": false,                   // optional
+        "refine": false,                   // optional
+        "timings": false,                  // optional, per-item stage timings
+        "stream": false                   // optional, NDJSON as items finish
+    }
+
+    Multipart uploads are also accepted: send files under "images" and the
+    options as form fields (languages joined with "+").
+
+    Response:
+    {
+        "success": true,
+        "results": [
+            {"index": 0, "name": "image_0", "success": true, "text": "...", ...},
+            {"index": 1, "name": "page2.png", "success": false, "error": "..."}
+        ],
+        "summary": {"total": 2, "success": 1, "failed": 1}
+    }
+
+    With "stream": true the response is application/x-ndjson: one result
+    object per line in completion order, followed by a {"summary": {...}} line.
+    """
+    try:
+        items, ocr_options, request_options = parse_batch_request()
+        source = request_source()
+
+        if not items:
+            return jsonify({
+                'success': False,
+                'error': 'No images provided'
+            }), 400
+
+        if len(items) > OCR_MAX_BATCH_SIZE:
+            return jsonify({
+                'success': False,
+                'error': f'Batch too large: {len(items)} images (max {OCR_MAX_BATCH_SIZE})'
+            }), 413
+
+        print(f"[BATCH] Processing {len(items)} images with {OCR_MAX_WORKERS} workers...")
+
+        futures = [
+            ocr_executor.submit(
+                run_batch_item, index, name, image_source, ocr_options,
+                source, request_options['timings']
+            )
+            for index, (name, image_source) in enumerate(items)
         ]
+
+        if request_options['stream']:
+            def generate():
+                success_count = 0
+                for future in as_completed(futures):
+                    result = future.result()
+                    success_count += result['success']
+                    yield json.dumps(result, ensure_ascii=False) + '\n'
+
+                yield json.dumps({'summary': {
+                    'total': len(futures),
+                    'success': success_count,
+                    'failed': len(futures) - success_count
+                }}) + '\n'
+
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        results = [future.result() for future in futures]
+        success_count = sum(1 for r in results if r['success'])
+
+        print(f"[BATCH] Done: {success_count}/{len(results)} succeeded")
+
+        return jsonify({
+            'success': True,
+            'results': results,
+            'summary': {
+                'total': len(results),
+                'success': success_count,
+                'failed': len(results) - success_count
+            }
+        }), 200
+
+    except Exception as e:
+        print(f"[ERROR] Batch OCR processing failed: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+@ocr_bp.route('/ocr/templates', methods=['GET'])
+def list_templates():
+    """
+    List registered form layouts
+    """
+    with form_templates_lock:
+        templates = [template_summary(t) for t in form_templates.values()]
+    return jsonify({'success': True, 'templates': templates}), 200
+
+@ocr_bp.route('/ocr/templates', methods=['POST'])
+def register_template():
+    """
+    Register (or replace) a form layout
+
+    Request body: see build_template
+    """
+    try:
+        template = build_template(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    with form_templates_lock:
+        form_templates[template['name']] = template
+    save_templates()
+
+    print(f"[TEMPLATE] Registered {template['name']} with {len(template['fields'])} fields")
+    return jsonify({'success': True, 'template': template_summary(template)}), 201
+
+@ocr_bp.route('/ocr/templates/<name>', methods=['DELETE'])
+def delete_template(name):
+    """
+    Remove a registered form layout
+    """
+    with form_templates_lock:
+        template = form_templates.pop(name, None)
+    if template is None:
+        return jsonify({'success': False, 'error': 'Template not found'}), 404
+    save_templates()
+    return jsonify({'success': True}), 200
+
+@ocr_bp.route('/ocr/region', methods=['POST'])
+@admission_controlled('interactive')
+def process_region_ocr():
+    """
+    OCR only the fields of a registered form layout
+
+    Request body:
+    {
+        "image": "base64_encoded_image_string",
+        "template": "intake_v1",
+        "fields": ["name", "age"],         // optional, default: all fields
+        "languages": ["chi_sim", "eng"],  // optional, per-field override in template
+        "preprocess": true,                // optional
+        "min_confidence": 0               // optional
+    }
+
+    Response:
+    {
+        "success": true,
+        "template": "intake_v1",
+        "alignment": "homography",
+        "fields": {
+            "name": {"text": "张伟", "confidence": 91.0, "box": [x, y, w, h], "words": [...]}
+        }
     }
     """
+    timings = {}
+    started = time.perf_counter()
+    source = request_source()
+
     try:
         data = request.get_json()
 
@@ -153,69 +2767,187 @@ def process_ocr():
                 'error': 'No image data provided'
             }), 400
 
-        # Decode image
-        image = decode_base64_image(data['image'])
+        with form_templates_lock:
+            template = form_templates.get(data.get('template'))
+        if template is None:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown template: {data.get('template')}"
+            }), 404
 
-        # Get parameters
         languages = data.get('languages', ['chi_sim', 'eng'])
         preprocess = data.get('preprocess', True)
         min_confidence = data.get('min_confidence', 0)
+        field_names = data.get('fields') or list(template['fields'])
 
-        # Preprocess if requested
-        if preprocess:
-            image = preprocess_image(image)
+        unknown = [f for f in field_names if f not in template['fields']]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown fields for template {template['name']}: {unknown}"
+            }), 400
 
-        # Configure Tesseract
-        lang_string = '+'.join(languages)
-        custom_config = r'--oem 3 --psm 6'  # LSTM OCR Engine, Assume uniform block of text
+        with timed(timings, 'decode'):
+            gray = decode_image_array(decode_base64_payload(data['image']), grayscale=True)
+        with timed(timings, 'preprocess'):
+            aligned, alignment = align_to_template(gray, template)
 
-        # Get detailed OCR data
-        ocr_data = pytesseract.image_to_data(
-            image,
-            lang=lang_string,
-            config=custom_config,
-            output_type=pytesseract.Output.DICT
-        )
+        with timed(timings, 'recognize'):
+            futures = {
+                field_name: ocr_executor.submit(
+                    recognize_region, aligned, template['fields'][field_name],
+                    languages, preprocess, min_confidence
+                )
+                for field_name in field_names
+            }
+            fields = {field_name: future.result() for field_name, future in futures.items()}
 
-        # Extract text with confidence filtering
-        full_text = []
-        details = []
+        timings['total'] = time.perf_counter() - started
+        ocr_metrics.record('region', source, True, timings, {
+            'image_info': {'width': gray.shape[1], 'height': gray.shape[0]},
+            'details': [word for field in fields.values() for word in field['words']],
+            'languages_used': languages
+        })
 
-        n_boxes = len(ocr_data['text'])
-        for i in range(n_boxes):
-            text = ocr_data['text'][i].strip()
-            conf = float(ocr_data['conf'][i])
-
-            if text and conf >= min_confidence:
-                full_text.append(text)
-                details.append({
-                    'text': text,
-                    'confidence': conf,
-                    'box': [
-                        int(ocr_data['left'][i]),
-                        int(ocr_data['top'][i]),
-                        int(ocr_data['width'][i]),
-                        int(ocr_data['height'][i])
-                    ]
-                })
+        return jsonify({
+            'success': True,
+            'template': template['name'],
+            'alignment': alignment,
+            'fields': fields
+        }), 200
+
+    except Exception as e:
+        timings['total'] = time.perf_counter() - started
+        ocr_metrics.record('region', source, False, timings)
+        print(f"[ERROR] Region OCR processing failed: {e}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+@ocr_bp.route('/ocr/extract', methods=['POST'])
+@admission_controlled('interactive')
+def extract_medical_data():
+    """
+    Extract structured patient fields from OCR output
+
+    Request body (either details from /ocr/process or plain text):
+    {
+        "details": [{"text": "姓名:", "confidence": 90, "box": [x, y, w, h]}, ...],
+        "text": "姓名: 张伟 ..."
+    }
+
+    Response:
+    {
+        "success": true,
+        "patient_draft": {"name": "张伟", "age": 45, "phone": "138****5678", ...},
+        "fields": {"name": {"value": "张伟", "confidence": 0.88, "box": [...], "anchor": "label"}, ...}
+    }
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+
+        if data.get('details'):
+            details = data['details']
+        elif data.get('text'):
+            details = details_from_text(data['text'])
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Provide OCR details or text'
+            }), 400
 
-        # Get simple text extraction as fallback
-        simple_text = pytesseract.image_to_string(
-            image,
-            lang=lang_string,
-            config=custom_config
-        ).strip()
+        return jsonify({'success': True, **extract_medical_fields(details)}), 200
 
+    except Exception as e:
+        print(f"[ERROR] Medical data extraction failed: {e}")
+        traceback.print_exc()
         return jsonify({
-            'success': True,
-            'text': simple_text if simple_text else ' '.join(full_text),
-            'details': details,
-            'word_count': len(details),
-            'languages_used': languages
+            'success': False,
+            'error': str(e),
+            'traceback': traceback.format_exc()
+        }), 500
+
+@ocr_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    OCR telemetry in Prometheus text format, or JSON with ?format=json
+    """
+    if request.args.get('format') == 'json':
+        return jsonify({
+            **ocr_metrics.snapshot(),
+            'cache': ocr_cache.stats(),
+            'admission': {**admission.stats(), 'job_queue_depth': job_queue_depth()}
         }), 200
+    return Response(ocr_metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@ocr_bp.route('/ocr/jobs', methods=['POST'])
+def create_ocr_job():
+    """
+    Queue a (multi-page) OCR job and return immediately
+
+    Request body: same as /ocr/batch (JSON or multipart), plus
+    {
+        "image": "base64...",                    // single page shorthand
+        "callback_url": "http://host/ocr-done"   // optional, POSTed the final job document
+                                                 // (host must be listed in OCR_JOB_CALLBACK_HOSTS)
+    }
+
+    Response (202):
+    {
+        "success": true,
+        "job_id": "9f1c...",
+        "status": "queued",
+        "status_url": "/ocr/jobs/9f1c..."
+    }
+    """
+    try:
+        items, ocr_options, _ = parse_batch_request()
+        data = request.get_json(silent=True) or {}
+        if not items and data.get('image'):
+            items = [('image_0', data['image'])]
+        callback_url = data.get('callback_url') or request.form.get('callback_url')
+
+        if not items:
+            return jsonify({
+                'success': False,
+                'error': 'No images provided'
+            }), 400
+
+        if callback_url and not callback_url_allowed(callback_url):
+            return jsonify({
+                'success': False,
+                'error': 'callback_url must be an http(s) URL on a host allowed by OCR_JOB_CALLBACK_HOSTS'
+            }), 400
+
+        # Store raw bytes so workers never re-parse base64
+        items = [
+            (name, image_source if isinstance(image_source, bytes) else decode_base64_payload(image_source))
+            for name, image_source in items
+        ]
+
+        job_id = enqueue_job(items, ocr_options, request_source(), callback_url)
+        if job_id is None:
+            retry_after = admission.retry_after('batch')
+            return jsonify({
+                'success': False,
+                'error': 'OCR job queue is full, retry later',
+                'retry_after': retry_after
+            }), 429, {'Retry-After': str(retry_after)}
+
+        print(f"[JOBS] Queued {job_id} with {len(items)} pages")
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/ocr/jobs/{job_id}'
+        }), 202
 
     except Exception as e:
-        print(f"[ERROR] OCR processing failed: {e}")
+        print(f"[ERROR] Failed to queue OCR job: {e}")
         traceback.print_exc()
         return jsonify({
             'success': False,
@@ -223,10 +2955,25 @@ def process_ocr():
             'traceback': traceback.format_exc()
         }), 500
 
+@ocr_bp.route('/ocr/jobs/<job_id>', methods=['GET'])
+def get_ocr_job(job_id):
+    """
+    Job status with per-page progress; results once finished
+
+    Pass ?results=false to poll progress without the page results.
+    """
+    include_results = request.args.get('results', 'true').lower() != 'false'
+    job = load_job(job_id, include_results)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, **job}), 200
+
 # ============================================================
 # Run Server
 # ============================================================
 
+app.register_blueprint(ocr_bp)
+
 if __name__ == '__main__':
     print()
     print("[START] Starting server on http://0.0.0.0:5001")
@@ -0,0 +1,28 @@
+"""
+Fixtures for ocr_service tests that run without a Tesseract binary
+
+Run from this directory's parent:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+
+@pytest.fixture(scope='session')
+def ocr_service(tmp_path_factory):
+    """The service module, with its job database in a temporary directory"""
+    os.environ['OCR_JOB_DB'] = str(tmp_path_factory.mktemp('jobs') / 'ocr_jobs.db')
+    import ocr_service as module
+    module.app.config['TESTING'] = True
+    return module
+
+
+@pytest.fixture
+def client(ocr_service):
+    return ocr_service.app.test_client()
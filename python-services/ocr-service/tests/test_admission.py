@@ -0,0 +1,48 @@
+"""
+Admission control: reserved interactive slots and 429 + Retry-After
+"""
+
+import pytest
+
+
+@pytest.fixture
+def admission(ocr_service, monkeypatch):
+    """Two slots, one reserved for interactive requests, no waiting"""
+    controller = ocr_service.AdmissionController(2, 1000, 1, 0.0)
+    monkeypatch.setattr(ocr_service, 'admission', controller)
+    return controller
+
+
+def test_batches_leave_the_reserved_slot_to_interactive(admission):
+    batch = admission.admit('batch')
+    assert batch is not None
+    assert admission.admit('batch') is None
+    interactive = admission.admit('interactive')
+    assert interactive is not None
+    assert admission.admit('interactive') is None
+
+    admission.release(batch)
+    admission.release(batch)  # a second release is ignored
+    assert admission.stats()['inflight'] == {'interactive': 1, 'batch': 0, 'job': 0}
+    assert admission.stats()['rejected'] == {'interactive': 1, 'batch': 1, 'job': 0}
+
+
+def test_byte_budget_admits_oversized_request_only_when_idle(admission):
+    big = admission.admit('interactive', size=5000)
+    assert big is not None
+    assert admission.admit('interactive', size=1) is None
+    admission.release(big)
+    assert admission.admit('interactive', size=1) is not None
+
+
+def test_busy_service_answers_429_with_retry_after(admission, client):
+    held = admission.admit('batch')
+    with client.post('/ocr/batch', json={'images': []}) as response:
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+
+    admission.release(held)
+    with client.post('/ocr/batch', json={'images': []}) as response:
+        assert response.status_code == 400
+    assert admission.stats()['inflight']['batch'] == 0
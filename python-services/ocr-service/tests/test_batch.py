@@ -0,0 +1,27 @@
+"""
+/ocr/batch request validation and per-item failures
+
+Responses are closed (with ...) so their admission slots are released, as a
+WSGI server does after sending the body.
+"""
+
+
+def test_empty_batch_is_rejected(client):
+    with client.post('/ocr/batch', json={'images': []}) as response:
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'No images provided'
+
+
+def test_oversized_batch_is_rejected(ocr_service, client, monkeypatch):
+    monkeypatch.setattr(ocr_service, 'OCR_MAX_BATCH_SIZE', 2)
+    with client.post('/ocr/batch', json={'images': ['a', 'b', 'c']}) as response:
+        assert response.status_code == 413
+        assert 'max 2' in response.get_json()['error']
+
+
+def test_undecodable_item_fails_alone(client):
+    with client.post('/ocr/batch', json={'images': [{'name': 'scan.png', 'image': 'bm90IGFuIGltYWdl'}]}) as response:
+        body = response.get_json()
+    assert response.status_code == 200
+    assert body['summary'] == {'total': 1, 'success': 0, 'failed': 1}
+    assert body['results'][0]['name'] == 'scan.png' and not body['results'][0]['success']
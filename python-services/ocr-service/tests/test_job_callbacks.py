@@ -0,0 +1,67 @@
+"""
+Job callback URLs: only http(s) hosts listed in OCR_JOB_CALLBACK_HOSTS
+"""
+
+import time
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def allowed_hosts(ocr_service, monkeypatch):
+    monkeypatch.setattr(ocr_service, 'OCR_JOB_CALLBACK_HOSTS', {'hooks.clinic.local', 'localhost:9000'})
+
+
+def count_jobs(ocr_service):
+    conn = ocr_service.get_job_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM ocr_jobs').fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('url, allowed', [
+    ('https://hooks.clinic.local/ocr-done', True),
+    ('http://HOOKS.clinic.local:8080/ocr-done', True),
+    ('http://localhost:9000/ocr-done', True),
+    ('http://localhost/ocr-done', False),
+    ('http://localhost:9001/ocr-done', False),
+    ('http://hooks.clinic.local.evil.example/ocr-done', False),
+    ('ftp://hooks.clinic.local/ocr-done', False),
+    ('http://localhost:port/ocr-done', False),
+    ('hooks.clinic.local/ocr-done', False),
+])
+def test_callback_url_allowed(ocr_service, allowed_hosts, url, allowed):
+    assert ocr_service.callback_url_allowed(url) is allowed
+
+
+def test_job_with_disallowed_callback_is_not_queued(ocr_service, allowed_hosts, client):
+    before = count_jobs(ocr_service)
+    response = client.post('/ocr/jobs', json={'image': 'aGVsbG8=', 'callback_url': 'http://169.254.169.254/latest'})
+    assert response.status_code == 400
+    assert 'OCR_JOB_CALLBACK_HOSTS' in response.get_json()['error']
+    assert count_jobs(ocr_service) == before
+
+
+def test_stored_callback_is_rechecked_before_sending(ocr_service, allowed_hosts):
+    job_id = uuid.uuid4().hex
+    conn = ocr_service.get_job_connection()
+    try:
+        conn.execute(
+            '''INSERT INTO ocr_jobs (id, status, created_at, updated_at, options, source, callback_url, total_pages)
+               VALUES (?, 'done', ?, ?, '{}', 'test', 'http://removed.example/ocr-done', 0)''',
+            (job_id, time.time(), time.time())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    ocr_service.send_job_callback(job_id)
+
+    conn = ocr_service.get_job_connection()
+    try:
+        status = conn.execute('SELECT callback_status FROM ocr_jobs WHERE id = ?', (job_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    assert status == 'rejected'
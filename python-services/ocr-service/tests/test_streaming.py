@@ -0,0 +1,67 @@
+"""
+Streamed recognition: strips in order, bounded per request, cancelled on disconnect
+"""
+
+import threading
+import time
+
+import numpy as np
+
+
+def fake_strip(calls, delay=0.0):
+    lock = threading.Lock()
+    state = {'running': 0, 'peak': 0}
+
+    def recognize_strip(gray, strip, threshold, languages, preprocess, timings=None):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        time.sleep(delay)
+        with lock:
+            state['running'] -= 1
+            calls.append((strip, threading.current_thread().name))
+        return [{'text': f'strip{strip}', 'confidence': 90, 'box': [0, strip, 1, 1]}]
+
+    return recognize_strip, state
+
+
+def test_single_worker_recognises_strips_inline(ocr_service, monkeypatch):
+    calls = []
+    recognize, _ = fake_strip(calls)
+    monkeypatch.setattr(ocr_service, 'recognize_strip', recognize)
+    monkeypatch.setattr(ocr_service, 'OCR_TILE_WORKERS', 1)
+
+    words = list(ocr_service.iter_strip_words(np.zeros((4, 4)), [0, 1, 2], None, ['eng'], False, [{}, {}, {}]))
+
+    assert [w[0]['text'] for w in words] == ['strip0', 'strip1', 'strip2']
+    assert {name for _, name in calls} == {threading.current_thread().name}
+
+
+def test_parallel_strips_stay_within_the_window(ocr_service, monkeypatch):
+    calls = []
+    recognize, state = fake_strip(calls, delay=0.02)
+    monkeypatch.setattr(ocr_service, 'recognize_strip', recognize)
+    monkeypatch.setattr(ocr_service, 'OCR_TILE_WORKERS', 2)
+    monkeypatch.setattr(ocr_service, 'tile_executor', ocr_service.shared_executor('test-tile', 4))
+
+    strips = list(range(6))
+    words = list(ocr_service.iter_strip_words(np.zeros((4, 4)), strips, None, ['eng'], False, [{} for _ in strips]))
+
+    assert [w[0]['text'] for w in words] == [f'strip{i}' for i in strips]
+    assert state['peak'] <= 2
+
+
+def test_disconnect_cancels_queued_strips(ocr_service, monkeypatch):
+    calls = []
+    recognize, _ = fake_strip(calls, delay=0.05)
+    monkeypatch.setattr(ocr_service, 'recognize_strip', recognize)
+    monkeypatch.setattr(ocr_service, 'OCR_TILE_WORKERS', 2)
+    monkeypatch.setattr(ocr_service, 'tile_executor', ocr_service.shared_executor('test-tile-1', 1))
+
+    strips = list(range(10))
+    words = ocr_service.iter_strip_words(np.zeros((4, 4)), strips, None, ['eng'], False, [{} for _ in strips])
+    next(words)
+    words.close()  # what the server does when the client goes away
+    time.sleep(0.3)
+
+    assert len(calls) < len(strips)
@@ -0,0 +1,41 @@
+"""
+vision_common.py: shared decoding, and the per-service copies staying identical
+"""
+
+import base64
+import io
+import os
+
+from PIL import Image
+
+import vision_common
+
+SERVICES_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def encoded(image_format):
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 10), 'red').save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def test_service_copies_match():
+    copies = [os.path.join(SERVICES_DIR, d, 'vision_common.py') for d in ('ocr-service', 'mediapipe-service')]
+    with open(copies[0], 'rb') as ocr_copy, open(copies[1], 'rb') as pose_copy:
+        assert ocr_copy.read() == pose_copy.read()
+
+
+def test_decode_data_url_to_bgr():
+    payload = 'data:image/png;base64,' + base64.b64encode(encoded('PNG')).decode()
+    image = vision_common.decode_image_array(vision_common.decode_base64_payload(payload))
+    assert image.shape == (10, 20, 3)
+    assert tuple(image[0, 0]) == (0, 0, 255)  # BGR
+
+
+def test_formats_opencv_cannot_read_fall_back_to_pil():
+    assert vision_common.decode_image_array(encoded('GIF'), grayscale=True).shape == (10, 20)
+
+
+def test_executors_are_shared_by_name():
+    first = vision_common.shared_executor('test-shared', 2)
+    assert vision_common.shared_executor('test-shared', 8) is first
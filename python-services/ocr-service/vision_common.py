@@ -0,0 +1,70 @@
+"""
+Shared Image Decoding and Worker Pools for the Vision Services
+
+Used by ocr_service.py and pose_service.py, standalone or mounted together
+by combined_service.py. Both decode uploads the same way (OpenCV straight
+to the channel layout they need, PIL for formats OpenCV cannot read), and
+worker pools are registered by name so one process never starts two pools
+for the same work.
+
+ocr-service/ and mediapipe-service/ each hold an identical copy, so either
+directory still builds on its own; change both together (the OCR tests
+check they match).
+
+Author: Low Back Pain System
+Date: 2025-11-26
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import cv2
+import numpy as np
+import base64
+import io
+import threading
+
+executors = {}
+executors_lock = threading.Lock()
+
+def decode_base64_payload(base64_string):
+    """
+    Decode base64 string (with or without data URL prefix) to raw bytes
+    """
+    # Remove data URL prefix if present
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
+
+    return base64.b64decode(base64_string)
+
+def decode_image_array(image_data, grayscale=False):
+    """
+    Decode raw image bytes to a numpy array: 3-channel BGR, or one 8-bit channel
+
+    OpenCV decodes straight into the requested layout, so no intermediate
+    RGB frame is allocated for grayscale. EXIF orientation is ignored, as
+    the PIL path always did (OCR pages are normalised separately). Formats
+    OpenCV cannot read (e.g. GIF) fall back to PIL.
+    """
+    flags = (cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR) | cv2.IMREAD_IGNORE_ORIENTATION
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flags)
+    if image is None:
+        pil_image = Image.open(io.BytesIO(image_data))
+        if grayscale:
+            image = np.array(pil_image.convert('L'))
+        else:
+            image = cv2.cvtColor(np.array(pil_image.convert('RGB')), cv2.COLOR_RGB2BGR)
+    return image
+
+def shared_executor(name, max_workers):
+    """
+    Thread pool registered under name, created on first request
+
+    Later callers asking for the same name get the existing pool (its
+    size is fixed by the first caller).
+    """
+    with executors_lock:
+        executor = executors.get(name)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix=name)
+            executors[name] = executor
+        return executor
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Database Service Concurrency Benchmark
+
+Runs the same concurrent read/write workload against two copies of the
+patients database used by _archive/old-backend/python-flask-backend/database_service.py:
+
+  legacy  - a fresh sqlite3.connect() per operation, rollback journal
+  pooled  - database_service's ConnectionPool (WAL, synchronous=NORMAL,
+            page cache, mmap, busy timeout, statement cache)
+
+Readers page through the patient list (keyset, fields=summary) and fetch
+single patients; writers update patients the way autosave does. Reports
+throughput, p50/p95 latency and lock errors per operation.
+
+Usage:
+    python scripts/testing/benchmark_database_service.py
+    python scripts/testing/benchmark_database_service.py --patients 20000 --readers 8 --writers 2 --seconds 10
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / 'scripts' / 'data-generation'))
+sys.path.insert(0, str(REPO_ROOT / '_archive' / 'old-backend' / 'python-flask-backend'))
+
+import generate_patients  # noqa: E402
+
+LIST_SQL = ('SELECT id, study_id, name, gender, age, created_date, workspace_id FROM patients '
+            'WHERE (created_date, id) < (?, ?) ORDER BY created_date DESC, id DESC LIMIT 50')
+GET_SQL = 'SELECT * FROM patients WHERE id = ?'
+UPDATE_SQL = 'UPDATE patients SET remarks = ?, last_sync_timestamp = ? WHERE id = ?'
+
+# ============================================================
+# Setup
+# ============================================================
+
+def load_service(db_path):
+    """Import database_service against db_path (creates schema, enables WAL)"""
+    os.environ['DB_PATH'] = db_path
+    if 'database_service' in sys.modules:
+        return importlib.reload(sys.modules['database_service'])
+    return importlib.import_module('database_service')
+
+
+def seed(service, db_path, count, seed_value):
+    """Insert generated patients in one transaction, in database_service's row format"""
+    random.seed(seed_value)
+    columns = list(service.PATIENT_COLUMNS) + ['extra_json']
+    rows = []
+    for i in range(count):
+        p = generate_patients.generate_realistic_patient(i + 1)
+        p['id'] = f'patient-{i:06d}'
+        values, extra_json = service.split_patient(p)
+        values['extra_json'] = extra_json
+        rows.append(tuple(values.get(c) for c in columns))
+
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        rows
+    )
+    conn.commit()
+    conn.close()
+    id_index, created_index = columns.index('id'), columns.index('created_date')
+    return [r[id_index] for r in rows], max(r[created_index] for r in rows)
+
+# ============================================================
+# Workload
+# ============================================================
+
+def run_workload(acquire, release, ids, newest, readers, writers, seconds):
+    """Run reader and writer threads for `seconds`; return per-operation latencies"""
+    stop = time.perf_counter() + seconds
+    results = {'list': [], 'get': [], 'update': []}
+    errors = {'list': 0, 'get': 0, 'update': 0}
+    lock = threading.Lock()
+
+    def record(op, started, failed=False):
+        elapsed = time.perf_counter() - started
+        with lock:
+            if failed:
+                errors[op] += 1
+            else:
+                results[op].append(elapsed)
+
+    def reader(rng):
+        while time.perf_counter() < stop:
+            op = 'list' if rng.random() < 0.5 else 'get'
+            started = time.perf_counter()
+            try:
+                conn = acquire()
+                try:
+                    if op == 'list':
+                        conn.execute(LIST_SQL, (newest, 'z')).fetchall()
+                    else:
+                        conn.execute(GET_SQL, (rng.choice(ids),)).fetchone()
+                finally:
+                    release(conn)
+                record(op, started)
+            except sqlite3.OperationalError:
+                record(op, started, failed=True)
+
+    def writer(rng):
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            try:
+                conn = acquire()
+                try:
+                    conn.execute(UPDATE_SQL, (f'autosave {rng.random()}', datetime.now().isoformat(), rng.choice(ids)))
+                    conn.commit()
+                finally:
+                    release(conn)
+                record('update', started)
+            except sqlite3.OperationalError:
+                record('update', started, failed=True)
+
+    threads = [threading.Thread(target=reader, args=(random.Random(i),)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(random.Random(1000 + i),)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def summarize(name, results, errors, seconds):
+    rows = {}
+    for op, latencies in results.items():
+        rows[f'{name}|{op}'] = {
+            'ops_per_s': round(len(latencies) / seconds, 1),
+            'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 2) if latencies else 0.0,
+            'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 2) if latencies else 0.0,
+            'errors': errors[op]
+        }
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark database_service connection handling')
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the report as JSON')
+    args = parser.parse_args()
+
+    print("Database Service Benchmark")
+    print("=" * 80)
+
+    workdir = tempfile.mkdtemp(prefix='lbp_db_bench_')
+    legacy_path = os.path.join(workdir, 'legacy.db')
+    pooled_path = os.path.join(workdir, 'pooled.db')
+
+    # Legacy copy: same schema, default rollback journal
+    service = load_service(legacy_path)
+    conn = sqlite3.connect(legacy_path)
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.close()
+    ids, newest = seed(service, legacy_path, args.patients, args.seed)
+
+    service = load_service(pooled_path)
+    seed(service, pooled_path, args.patients, args.seed)
+    print(f"Seeded {args.patients} patients into {workdir}")
+    print(f"Workload: {args.readers} readers, {args.writers} writers, {args.seconds:g}s per mode")
+
+    def legacy_acquire():
+        conn = sqlite3.connect(legacy_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    report = {}
+    print("\n[RUN] legacy")
+    results, errors = run_workload(legacy_acquire, lambda c: c.close(), ids, newest,
+                                   args.readers, args.writers, args.seconds)
+    report.update(summarize('legacy', results, errors, args.seconds))
+
+    print("[RUN] pooled")
+    pool = service.ConnectionPool(service.DB_POOL_SIZE)
+    results, errors = run_workload(pool.acquire, pool.release, ids, newest,
+                                   args.readers, args.writers, args.seconds)
+    report.update(summarize('pooled', results, errors, args.seconds))
+
+    print()
+    print(f"{'mode|operation':<20} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    print('-' * 60)
+    for key, row in report.items():
+        print(f"{key:<20} {row['ops_per_s']:>10.1f} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['errors']:>7}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+OCR Benchmark and Regression Harness
+
+Renders synthetic Chinese/English intake forms from the patient generator
+vocabularies at several resolutions and noise levels, runs them through
+python-services/ocr-service/ocr_service.py in-process, and reports
+throughput, p50/p95 latency and character error rate (CER) per
+preprocessing configuration.
+
+Requirements (Linux):
+    apt-get install tesseract-ocr tesseract-ocr-chi-sim tesseract-ocr-eng fonts-noto-cjk
+    pip install -r python-services/ocr-service/requirements_ocr.txt
+
+Usage:
+    python scripts/testing/benchmark_ocr.py
+    python scripts/testing/benchmark_ocr.py --samples 10 --dpi 150 300 --noise clean heavy
+    python scripts/testing/benchmark_ocr.py --output baseline.json
+    python scripts/testing/benchmark_ocr.py --baseline baseline.json   # exit 1 on regression
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / 'scripts' / 'data-generation'))
+sys.path.insert(0, str(REPO_ROOT / 'python-services' / 'ocr-service'))
+
+# Measure recognition, not the result cache, and keep the job queue out of the repo
+os.environ.setdefault('OCR_CACHE_MAX_ENTRIES', '0')
+os.environ.setdefault('OCR_JOB_DB', os.path.join(tempfile.gettempdir(), 'ocr_benchmark_jobs.db'))
+
+import generate_patients  # noqa: E402
+
+CJK_FONT_CANDIDATES = [
+    '/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc',
+    '/usr/share/fonts/truetype/wqy/wqy-microhei.ttc',
+]
+
+# Preprocessing configurations compared by the benchmark (ocr_image_bytes kwargs)
+CONFIGS = {
+    'raw': {'preprocess': False, 'orient': False},
+    'preprocess': {'preprocess': True, 'orient': False},
+    'preprocess+orient': {'preprocess': True, 'orient': True},
+}
+
+NOISE_LEVELS = ['clean', 'light', 'heavy']
+
+# A5 portrait intake sheet
+PAGE_WIDTH_MM = 148
+PAGE_HEIGHT_MM = 210
+FONT_SIZE_PT = 11
+
+CER_TOLERANCE = 0.02
+LATENCY_TOLERANCE = 0.25
+LATENCY_SLACK_MS = 50  # ignore jitter on very fast configurations
+
+# ============================================================
+# Synthetic Forms
+# ============================================================
+
+def find_cjk_font(path=None):
+    """Locate a font that can render Chinese text"""
+    for candidate in ([path] if path else CJK_FONT_CANDIDATES):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    print("ERROR: No CJK font found. Install fonts-noto-cjk or pass --font /path/to/font.ttc")
+    sys.exit(1)
+
+
+def form_lines(patient):
+    """Intake form text (ground truth) for a generated patient"""
+    return [
+        '低背痛患者评估表 Low Back Pain Intake',
+        f"姓名: {patient['name']}   性别: {patient['gender']}   年龄: {patient['age']}岁",
+        f"研究编号 Study ID: {patient['study_id']}   电话: {patient['phone']}",
+        f"主诉: {patient['chief_complaint']}",
+        f"疼痛类型: {patient['pain_type']}   疼痛评分 VAS: {patient['pain_score']}/10",
+        f"加重因素: {patient['aggravating_factors']}   缓解因素: {patient['relieving_factors']}",
+        f"既往治疗: {patient['previous_treatment']}",
+        f"用药: {patient['medication_details']}",
+        f"RMDQ: {patient['rmdq_score']}   NDI: {patient['ndi_score']}",
+        f"腰椎姿势: {patient['lumbar_posture']}   病情进展: {patient['condition_progress']}",
+    ]
+
+
+def render_form(lines, font_path, dpi):
+    """Render form lines onto a white page at the given DPI"""
+    width = int(PAGE_WIDTH_MM / 25.4 * dpi)
+    height = int(PAGE_HEIGHT_MM / 25.4 * dpi)
+    font_px = int(FONT_SIZE_PT / 72 * dpi)
+    margin = int(12 / 25.4 * dpi)
+
+    font = ImageFont.truetype(font_path, font_px)
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+
+    y = margin
+    for line in lines:
+        draw.text((margin, y), line, font=font, fill=0)
+        y += int(font_px * 2.2)
+
+    return page
+
+
+def add_noise(page, level, rng):
+    """Degrade a page like a phone photo / cheap scanner and encode it"""
+    if level == 'clean':
+        return encode(page, 'PNG')
+
+    sigma, blur = (8, 0.6) if level == 'light' else (20, 1.0)
+    pixels = np.asarray(page, dtype=np.float32)
+    pixels = pixels + rng.normal(0, sigma, pixels.shape)
+    page = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    page = page.filter(ImageFilter.GaussianBlur(blur))
+
+    if level == 'heavy':
+        page = page.rotate(1.5, resample=Image.BICUBIC, expand=True, fillcolor=255)
+        return encode(page, 'JPEG', quality=40)
+    return encode(page, 'PNG')
+
+
+def encode(page, fmt, **kwargs):
+    buf = io.BytesIO()
+    page.save(buf, fmt, **kwargs)
+    return buf.getvalue()
+
+
+def build_corpus(samples, dpis, noise_levels, font_path, seed):
+    """Generate (dpi, noise, ground_truth, image_bytes) tuples reproducibly"""
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for i in range(samples):
+        lines = form_lines(generate_patients.generate_realistic_patient(i + 1))
+        truth = '\n'.join(lines)
+        for dpi in dpis:
+            page = render_form(lines, font_path, dpi)
+            for level in noise_levels:
+                corpus.append((dpi, level, truth, add_noise(page, level, rng)))
+    return corpus
+
+# ============================================================
+# Metrics
+# ============================================================
+
+def normalize_text(text):
+    """Compare text without whitespace (Tesseract spaces CJK inconsistently)"""
+    return ''.join(text.split())
+
+
+def character_error_rate(reference, hypothesis):
+    """Levenshtein distance over characters divided by reference length"""
+    reference = normalize_text(reference)
+    hypothesis = normalize_text(hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_char != hyp_char)
+            ))
+        previous = current
+    return previous[-1] / len(reference)
+
+
+def percentile(values, pct):
+    return float(np.percentile(values, pct)) if values else 0.0
+
+# ============================================================
+# Benchmark
+# ============================================================
+
+def run_sample(ocr_service, languages, config, sample):
+    dpi, level, truth, image_data = sample
+    started = time.perf_counter()
+    result = ocr_service.ocr_image_bytes(image_data, languages, use_cache=False, **config)
+    latency = time.perf_counter() - started
+    return dpi, level, latency, character_error_rate(truth, result['text'])
+
+
+def run_benchmark(corpus, configs, languages, workers):
+    import ocr_service
+
+    report = {}
+    for name in configs:
+        config = CONFIGS[name]
+        print(f"\n[RUN] {name}: {len(corpus)} pages, {workers} worker(s)")
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(lambda s: run_sample(ocr_service, languages, config, s), corpus))
+        wall = time.perf_counter() - started
+
+        groups = {}
+        for dpi, level, latency, cer in rows:
+            groups.setdefault((dpi, level), []).append((latency, cer))
+
+        for (dpi, level), measurements in sorted(groups.items()):
+            latencies = [m[0] for m in measurements]
+            cers = [m[1] for m in measurements]
+            report[f'{name}|{dpi}dpi|{level}'] = {
+                'config': name,
+                'dpi': dpi,
+                'noise': level,
+                'pages': len(measurements),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'cer': round(sum(cers) / len(cers), 4)
+            }
+
+        report[f'{name}|all'] = {
+            'config': name,
+            'pages': len(rows),
+            'throughput_pages_per_s': round(len(rows) / wall, 3),
+            'p50_ms': round(percentile([r[2] for r in rows], 50) * 1000, 1),
+            'p95_ms': round(percentile([r[2] for r in rows], 95) * 1000, 1),
+            'cer': round(sum(r[3] for r in rows) / len(rows), 4)
+        }
+    return report
+
+
+def print_report(report):
+    print()
+    print(f"{'configuration':<36} {'pages':>5} {'pages/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'CER':>7}")
+    print('-' * 80)
+    for key, row in report.items():
+        throughput = row.get('throughput_pages_per_s')
+        throughput = f'{throughput:>8.2f}' if throughput is not None else ' ' * 8
+        print(f"{key:<36} {row['pages']:>5} {throughput} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['cer']:>7.3f}")
+
+
+def compare_to_baseline(report, baseline):
+    """List regressions against a saved report (CER up or p95 latency slower)"""
+    regressions = []
+    for key, row in report.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if row['cer'] > base['cer'] + CER_TOLERANCE:
+            regressions.append(f"{key}: CER {base['cer']:.3f} -> {row['cer']:.3f}")
+        if base['p95_ms'] and row['p95_ms'] > base['p95_ms'] * (1 + LATENCY_TOLERANCE) + LATENCY_SLACK_MS:
+            regressions.append(f"{key}: p95 {base['p95_ms']:.0f}ms -> {row['p95_ms']:.0f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Tesseract OCR service on synthetic intake forms')
+    parser.add_argument('--samples', type=int, default=5, help='patients rendered per resolution/noise level')
+    parser.add_argument('--dpi', type=int, nargs='+', default=[150, 200, 300])
+    parser.add_argument('--noise', nargs='+', choices=NOISE_LEVELS, default=NOISE_LEVELS)
+    parser.add_argument('--configs', nargs='+', choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument('--languages', default='chi_sim+eng')
+    parser.add_argument('--workers', type=int, default=1, help='concurrent pages (1 = pure latency)')
+    parser.add_argument('--font', help='CJK font path (default: search common Linux locations)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the report as JSON (e.g. a new baseline)')
+    parser.add_argument('--baseline', help='compare with a saved report; exit 1 on regression')
+    args = parser.parse_args()
+
+    print("OCR Benchmark")
+    print("=" * 80)
+
+    font_path = find_cjk_font(args.font)
+    print(f"Font: {font_path}")
+
+    corpus = build_corpus(args.samples, args.dpi, args.noise, font_path, args.seed)
+    print(f"Corpus: {len(corpus)} pages ({args.samples} patients x {len(args.dpi)} DPI x {len(args.noise)} noise levels)")
+
+    report = run_benchmark(corpus, args.configs, args.languages.split('+'), args.workers)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nReport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_to_baseline(report, json.load(f))
+        if regressions:
+            print("\nREGRESSIONS:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Patient Storage Format Benchmark
+
+Compares the two row formats of
+_archive/old-backend/python-flask-backend/database_service.py:
+
+  v1 - every field in its column AND the whole payload again in data_json
+  v2 - typed columns + extra_json holding only keys without a column
+
+Writes the same generated patients in both formats and reports bytes per
+row (file size after VACUUM), insert time and full-record read time.
+
+Usage:
+    python scripts/testing/benchmark_patient_storage.py
+    python scripts/testing/benchmark_patient_storage.py --patients 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT / 'scripts' / 'data-generation'))
+sys.path.insert(0, str(REPO_ROOT / '_archive' / 'old-backend' / 'python-flask-backend'))
+
+WORKDIR = tempfile.mkdtemp(prefix='lbp_storage_bench_')
+os.environ['DB_PATH'] = os.path.join(WORKDIR, 'v2.db')
+
+import database_service  # noqa: E402
+import generate_patients  # noqa: E402
+
+V1_SCHEMA = '''
+    CREATE TABLE patients (
+        id TEXT PRIMARY KEY, study_id TEXT, name TEXT, gender TEXT, age INTEGER, phone TEXT,
+        onset_date TEXT, chief_complaint TEXT, medical_history TEXT, pain_areas TEXT,
+        subjective_exam TEXT, objective_exam TEXT, functional_scores TEXT, intervention TEXT,
+        ai_posture_analysis TEXT, remarks TEXT, created_date TEXT NOT NULL,
+        last_sync_timestamp TEXT, workspace_id TEXT, data_json TEXT
+    )
+'''
+
+# ============================================================
+# Row Formats
+# ============================================================
+
+def v1_row(data):
+    """Row as the original create_patient wrote it"""
+    def as_json(key, kind, default):
+        value = data.get(key)
+        return json.dumps(data.get(key, default)) if isinstance(value, kind) else value
+
+    row = {key: data.get(key) for key in database_service.PATIENT_COLUMNS}
+    row['pain_areas'] = as_json('pain_areas', list, [])
+    row['functional_scores'] = as_json('functional_scores', dict, {})
+    row['ai_posture_analysis'] = as_json('ai_posture_analysis', dict, {})
+    row['data_json'] = json.dumps(data)
+    return row
+
+
+def v1_read(row):
+    """Record as the original read path built it"""
+    patient = dict(row)
+    if patient.get('data_json'):
+        patient.update(json.loads(patient['data_json']))
+    return patient
+
+
+def v2_row(data):
+    columns, extra_json = database_service.split_patient(data)
+    return {**columns, 'extra_json': extra_json}
+
+# ============================================================
+# Benchmark
+# ============================================================
+
+def patient_records(count, seed):
+    random.seed(seed)
+    records = []
+    for i in range(count):
+        p = generate_patients.generate_realistic_patient(i + 1)
+        p['id'] = f'patient-{i:06d}'
+        # The assessment form sends these structured fields
+        p['pain_areas'] = [p['pain_location']] if p.get('pain_location') else []
+        p['functional_scores'] = {'rmdq': p['rmdq_score'], 'ndi': p['ndi_score']}
+        records.append(p)
+    return records
+
+
+def write(path, schema, rows):
+    conn = sqlite3.connect(path)
+    if schema:
+        conn.execute(schema)
+    columns = list(rows[0])
+    started = time.perf_counter()
+    conn.executemany(
+        f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        [tuple(row[c] for c in columns) for row in rows]
+    )
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.execute('VACUUM')
+    conn.close()
+    return elapsed
+
+
+def read(path, decode):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    started = time.perf_counter()
+    records = [decode(row) for row in conn.execute('SELECT * FROM patients')]
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed, records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark patient row storage formats')
+    parser.add_argument('--patients', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print("Patient Storage Benchmark")
+    print("=" * 70)
+
+    records = patient_records(args.patients, args.seed)
+    v1_path = os.path.join(WORKDIR, 'v1.db')
+    v2_path = database_service.DB_PATH
+
+    started = time.perf_counter()
+    v1_rows = [v1_row(r) for r in records]
+    v1_encode = time.perf_counter() - started
+    v1_insert = write(v1_path, V1_SCHEMA, v1_rows)
+
+    started = time.perf_counter()
+    v2_rows = [v2_row(r) for r in records]
+    v2_encode = time.perf_counter() - started
+    v2_insert = write(v2_path, None, v2_rows)
+
+    v1_read_time, v1_records = read(v1_path, v1_read)
+    v2_read_time, v2_records = read(v2_path, database_service.row_to_patient)
+
+    # Same records either way (v1 additionally echoes its data_json string)
+    mismatched = sum(
+        1 for a, b in zip(v1_records, v2_records)
+        if {k: v for k, v in a.items() if k != 'data_json'} != b
+    )
+
+    print(f"{args.patients} patients, {WORKDIR}")
+    print()
+    print(f"{'format':<8} {'bytes/row':>10} {'encode ms':>10} {'insert ms':>10} {'read ms':>10}")
+    print('-' * 52)
+    for name, path, encode, insert, read_time in (
+        ('v1', v1_path, v1_encode, v1_insert, v1_read_time),
+        ('v2', v2_path, v2_encode, v2_insert, v2_read_time)
+    ):
+        bytes_per_row = os.path.getsize(path) / args.patients
+        print(f"{name:<8} {bytes_per_row:>10.0f} {encode * 1000:>10.1f} {insert * 1000:>10.1f} {read_time * 1000:>10.1f}")
+    print()
+    print(f"Records differing between formats: {mismatched}")
+
+
+if __name__ == '__main__':
+    main()